@@ -0,0 +1,48 @@
+'''
+Public ID resolution & RFC 3151 conversion throughput
+
+python bench/bench_catalog.py [COUNT]
+
+Simulates COUNT (default 1000000) documents, each declaring one of 20 DTDs by
+public & system ID, resolved through a catalog, then converts the public IDs to
+URNs one at a time with iri.public_id_to_urn and in a batch with the caching
+catalog.public_ids_to_urns.
+'''
+
+import os
+import sys
+import time
+import tempfile
+
+from amara3 import iri
+from amara3.catalog import catalog, public_ids_to_urns
+
+
+def timed(label, count, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print('{0:36} {1:6.2f}s {2:10.0f}/s'.format(label, elapsed, count/elapsed))
+    return result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    dtds = [ ('-//Example Corp//DTD Document Type {0} V1.{0}//EN'.format(i), 'http://example.com/dtd/doc{0}.dtd'.format(i)) for i in range(20) ]
+    entries = ''.join('<public publicId="{0}" uri="dtd/{1}.dtd"/>\n'.format(p, i) for i, (p, s) in enumerate(dtds))
+    fd, path = tempfile.mkstemp(suffix='.xml')
+    with os.fdopen(fd, 'w') as fp:
+        fp.write('<catalog xmlns="urn:oasis:names:tc:entity:xmlns:xml:catalog">\n{0}</catalog>\n'.format(entries))
+    cat = catalog([path])
+    docs = [ dtds[i % len(dtds)] for i in range(count) ]
+
+    timed('resolve, one at a time', count, lambda: [ cat.resolve(p, s) for p, s in docs ])
+    timed('resolve_many', count, lambda: cat.resolve_many(docs))
+    pubids = [ p for p, s in docs ]
+    expected = timed('iri.public_id_to_urn, one at a time', count, lambda: [ iri.public_id_to_urn(p) for p in pubids ])
+    assert timed('public_ids_to_urns', count, lambda: public_ids_to_urns(pubids)) == expected
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
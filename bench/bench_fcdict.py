@@ -0,0 +1,73 @@
+'''
+Size & lookup speed of a front-coded IRI dictionary against a plain dict (with a
+list for ID => IRI) and an iridict
+
+python bench/bench_fcdict.py [COUNT] [BLOCK_SIZE]
+'''
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+from amara3.irihelper import iridict
+from amara3.fcdict import build_fcdict, fcdict
+from amara3.contrib.mem_check import alloc_diff
+
+
+def gen_iris(count):
+    for i in range(count):
+        yield 'http://data{0}.example.org/resource/{1}/{2}'.format(i % 31, i % 1009, i)
+
+
+def timed(label, count, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print('{0:30} {1:8.3f}us/lookup'.format(label, elapsed / count * 1e6))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    block_size = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    lookups = 100000
+    rng = random.Random(0)
+
+    fd, path = tempfile.mkstemp(suffix='.fcd')
+    os.close(fd)
+    try:
+        start = time.perf_counter()
+        build_fcdict(gen_iris(count), path, block_size=block_size)
+        print('build_fcdict {0:.2f}s'.format(time.perf_counter() - start))
+        d = fcdict(path)
+        iris = list(d)
+        probe = [ iris[rng.randrange(count)] for _ in range(lookups) ]
+        ids = [ rng.randrange(count) for _ in range(lookups) ]
+
+        with alloc_diff() as diff:
+            plain = { i: n for n, i in enumerate(iris) }
+            plain_ids = list(iris)
+        plain_size = diff.net
+        with alloc_diff() as diff:
+            idict = iridict()
+            for n, i in enumerate(iris):
+                idict[i] = n
+        idict_size = diff.net
+        print('{0:30} {1:8.1f} MiB'.format('fcdict file', os.path.getsize(path) / 2**20))
+        print('{0:30} {1:8.1f} MiB (excluding the IRI strings)'.format('dict + list', plain_size / 2**20))
+        print('{0:30} {1:8.1f} MiB (including its normalized key strings)'.format('iridict', idict_size / 2**20))
+        print('{0:30} {1:8.1f} MiB'.format('the IRI strings themselves', sum(sys.getsizeof(i) for i in iris) / 2**20))
+
+        timed('fcdict IRI => ID', lookups, lambda: [ d.id_of(i) for i in probe ])
+        timed('dict IRI => ID', lookups, lambda: [ plain[i] for i in probe ])
+        timed('iridict IRI => ID', lookups, lambda: [ idict[i] for i in probe ])
+        timed('fcdict ID => IRI', lookups, lambda: [ d[n] for n in ids ])
+        timed('list ID => IRI', lookups, lambda: [ plain_ids[n] for n in ids ])
+        d.close()
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+'''
+Compare read throughput & resident memory of buffered vs memory-mapped file inputsources
+
+python bench/bench_inputsource_mmap.py [SIZE_MB] [PATH]
+
+Creates (or reuses) a file of SIZE_MB megabytes (default 512) at PATH (default a
+temp file), then feeds it to a hash (standing in for a downstream parser that accepts
+buffers) through the regular buffered stream and through the zero-copy buffer of an
+mmap inputsource. RSS is sampled while the source is still open. Note that pages
+of a mapped file which have been touched count towards RSS, but they're shared,
+clean page cache pages which the OS can drop at will. Use a multi-GB size on a
+local disk for meaningful numbers, and run twice so the page cache is warm for both.
+'''
+
+import os
+import sys
+import time
+import hashlib
+import tempfile
+
+from amara3.inputsource import inputsource, inputsourcetype
+
+CHUNK = 1024*1024
+LINE = b'http://example.org/vocab/resource/0123456789 <http://example.org/p> "o" .\n'
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024*1024)
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def ensure_file(path, size_mb):
+    if os.path.exists(path) and os.path.getsize(path) >= size_mb*CHUNK:
+        return
+    block = LINE * (CHUNK // len(LINE))
+    with open(path, 'wb') as fp:
+        for _ in range(size_mb):
+            fp.write(block)
+
+
+def buffered_scan(path):
+    digest = hashlib.blake2b()
+    with inputsource(path, sourcetype=inputsourcetype.filename) as inp:
+        read = inp.stream.read
+        chunk = read(CHUNK)
+        while chunk:
+            digest.update(chunk)
+            chunk = read(CHUNK)
+        return digest.hexdigest(), rss_mb()
+
+
+def mmap_scan(path):
+    digest = hashlib.blake2b()
+    with inputsource(path, sourcetype=inputsourcetype.filename, use_mmap=True) as inp:
+        buf = inp.buffer
+        for offset in range(0, len(buf), CHUNK):
+            #Slicing a memoryview doesn't copy
+            digest.update(buf[offset:offset+CHUNK])
+        return digest.hexdigest(), rss_mb()
+
+
+def run(label, func, path, size):
+    before = rss_mb()
+    start = time.perf_counter()
+    digest, during = func(path)
+    elapsed = time.perf_counter() - start
+    print('{:9} {:10.1f} MB/s  {}  RSS before {:8.1f} MB, while open {:8.1f} MB'.format(
+        label, size/elapsed, digest[:16], before, during))
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(tempfile.gettempdir(), 'amara3-mmap-bench.dat')
+    ensure_file(path, size_mb)
+    size = os.path.getsize(path) / (1024*1024)
+    run('buffered', buffered_scan, path, size)
+    run('mmap', mmap_scan, path, size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+'''
+Cost of iri.iri_equivalent against comparing fully normalized IRIs, for pairs
+which are identical, differ in the host, are equivalent only after normalization,
+or differ only in the path
+
+python bench/bench_iri_equivalent.py [COUNT]
+'''
+
+import sys
+import time
+
+from amara3 import iri
+
+CASES = {
+    'identical': ('http://example.org/a/b/c?x=1#f', 'http://example.org/a/b/c?x=1#f'),
+    'different host': ('http://example.org/a/b/c?x=1#f', 'http://example.com/a/b/c?x=1#f'),
+    'equivalent': ('http://example.org/a/./b/%7ec?x=1#f', 'HTTP://Example.ORG:80/a/b/~c?x=1#f'),
+    'different path': ('http://example.org/a/b/c?x=1#f', 'http://example.org/a/b/d?x=1#f'),
+}
+
+
+def timed(func, pairs):
+    start = time.perf_counter()
+    for a, b in pairs:
+        func(a, b)
+    return time.perf_counter() - start
+
+
+def via_normalize(a, b):
+    return iri.normalize(a) == iri.normalize(b)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print('{0:>16} {1:>14} {2:>16}'.format('case', 'normalize us', 'iri_equivalent us'))
+    for case, pair in CASES.items():
+        assert via_normalize(*pair) == iri.iri_equivalent(*pair)
+        pairs = [pair] * count
+        old = min(timed(via_normalize, pairs) for _ in range(3))
+        new = min(timed(iri.iri_equivalent, pairs) for _ in range(3))
+        print('{0:>16} {1:14.2f} {2:16.2f}'.format(case, old / count * 1e6, new / count * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+'''
+Memory & load time of IriArray against a list of str
+
+python bench/bench_iriarray.py [COUNT]
+
+Builds COUNT (default 1000000) IRIs, measures the memory held by a list of them
+and by an IriArray with the same content, then saves the array and times loading
+it back & reading every authority.
+'''
+
+import os
+import sys
+import time
+import tempfile
+
+from amara3.iriarray import IriArray
+from amara3.contrib.mem_check import alloc_diff
+
+
+def gen_iris(count):
+    for i in range(count):
+        yield 'http://host{0}.example.org/path/to/resource/{1}?page={2}#s{3}'.format(i % 97, i, i % 13, i % 5)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    with alloc_diff() as diff:
+        strs = list(gen_iris(count))
+    print('list of str  {0:8.1f} MiB {1:6.1f} bytes/IRI'.format(diff.net / 2**20, diff.net / count))
+    del strs
+    with alloc_diff() as diff:
+        arr = IriArray(gen_iris(count))
+    print('IriArray     {0:8.1f} MiB {1:6.1f} bytes/IRI'.format(diff.net / 2**20, diff.net / count))
+    #Timed apart from the above, since tracemalloc slows every allocation
+    del arr
+    start = time.perf_counter()
+    arr = IriArray(gen_iris(count))
+    print('build        {0:8.2f}s'.format(time.perf_counter() - start))
+
+    fd, path = tempfile.mkstemp(suffix='.iris')
+    os.close(fd)
+    try:
+        arr.save(path)
+        start = time.perf_counter()
+        loaded = IriArray.load(path)
+        print('load         {0:8.4f}s'.format(time.perf_counter() - start))
+        start = time.perf_counter()
+        hosts = set()
+        for i in range(len(loaded)):
+            hosts.add(bytes(loaded.component(i, 'authority')))
+        print('authorities  {0:8.2f}s ({1} distinct)'.format(time.perf_counter() - start, len(hosts)))
+        loaded.close()
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+'''
+Cost of iri.join as the number of parts grows, against the original one
+basejoin per part, which re-parses the growing result each time
+
+python bench/bench_join.py [MAX_PARTS]
+
+Per-part time should stay flat for join, where it grows with the length of the
+result for the original.
+'''
+
+import sys
+import time
+
+from amara3 import iri
+
+
+def reference_join(*parts):
+    base = parts[0]
+    for part in parts[1:]:
+        base = iri.basejoin(base.rstrip('/') + '/', part)
+    return base
+
+
+def per_part(func, parts):
+    repeat = max(1, 20000 // len(parts))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(*parts)
+    return (time.perf_counter() - start) / repeat / len(parts) * 1e6, result
+
+
+def main():
+    max_parts = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    print('{0:>8} {1:>14} {2:>14}'.format('parts', 'original us/part', 'join us/part'))
+    n = 10
+    while n <= max_parts:
+        parts = ['http://example.org/base'] + [ 'seg{0}'.format(i) if i % 7 else '../seg{0}/.'.format(i) for i in range(n) ]
+        old, expected = per_part(reference_join, parts)
+        new, result = per_part(iri.join, parts)
+        assert result == expected
+        print('{0:8} {1:14.2f} {2:14.2f}'.format(n, old, new))
+        n *= 10
+
+
+if __name__ == '__main__':
+    main()
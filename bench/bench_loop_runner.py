@@ -0,0 +1,56 @@
+'''
+Compare per-call latency of running a coroutine from sync code via asyncio.run
+(a new event loop every call, as the old go_async did) & via the persistent loop_runner
+
+python bench/bench_loop_runner.py [CALLS] [THREADS]
+
+Each call runs a trivial coroutine, so the times are pure dispatch overhead.
+CALLS (default 2000) are spread across THREADS (default 8) callers.
+'''
+
+import sys
+import time
+import asyncio
+import threading
+
+from amara3.asynctools import loop_runner
+
+
+async def noop(n):
+    await asyncio.sleep(0)
+    return n
+
+
+def timed(label, call, calls, threads):
+    latencies = []
+    lock = threading.Lock()
+    def work(count):
+        mine = []
+        for i in range(count):
+            start = time.perf_counter()
+            call(noop(i))
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+    workers = [ threading.Thread(target=work, args=(calls // threads,)) for _ in range(threads) ]
+    start = time.perf_counter()
+    for w in workers: w.start()
+    for w in workers: w.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    p50 = latencies[len(latencies)//2] * 1e6
+    p99 = latencies[int(len(latencies)*0.99)] * 1e6
+    print('{0:12} {1:8.0f} calls/s   p50 {2:7.1f}us   p99 {3:7.1f}us'.format(
+        label, len(latencies)/elapsed, p50, p99))
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    timed('asyncio.run', asyncio.run, calls, threads)
+    with loop_runner() as runner:
+        timed('loop_runner', runner.run, calls, threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+'''
+Throughput of iri.mint_iris for each strategy, against making each IRI one at
+a time through the uuid & hashlib modules & the validating iriref constructor
+
+python bench/bench_mint_iris.py [COUNT]
+'''
+
+import sys
+import time
+import hashlib
+from uuid import uuid4, uuid5, NAMESPACE_URL
+
+from amara3 import iri
+from amara3.iri import I
+
+BASE = 'http://example.org/id/'
+
+
+def rate(label, count, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    assert len(result) == count
+    print('{0:28} {1:12,.0f} IRIs/s'.format(label, count / elapsed))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    keys = [ 'record-{0}'.format(i) for i in range(count) ]
+    ns = uuid5(NAMESPACE_URL, BASE)
+    rate('uuid4, one at a time', count, lambda: [ I(BASE + str(uuid4())) for _ in range(count) ])
+    rate('uuid4, mint_iris', count, lambda: list(iri.mint_iris(BASE, count)))
+    rate('uuid5, one at a time', count, lambda: [ I(BASE + str(uuid5(ns, k))) for k in keys ])
+    rate('uuid5, mint_iris', count, lambda: list(iri.mint_iris(BASE, strategy='uuid5', keys=keys)))
+    rate('blake2, one at a time', count, lambda: [ I(BASE + hashlib.blake2b(k.encode('utf-8'), digest_size=16).hexdigest()) for k in keys ])
+    rate('blake2, mint_iris', count, lambda: list(iri.mint_iris(BASE, strategy='blake2', keys=keys)))
+
+
+if __name__ == '__main__':
+    main()
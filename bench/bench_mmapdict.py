@@ -0,0 +1,59 @@
+'''
+Write & lookup speed of mmapdict against iridict, and time to open a populated one
+
+python bench/bench_mmapdict.py [COUNT]
+'''
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+from amara3.irihelper import iridict
+from amara3.mmapdict import mmapdict
+
+
+def timed(label, count, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print('{0:24} {1:8.2f}us/op'.format(label, elapsed / count * 1e6))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    iris = [ 'http://data{0}.example.org/resource/{1}'.format(i % 31, i) for i in range(count) ]
+    probe = random.Random(0).sample(iris, min(count, 100000))
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, 'bench')
+    idict = iridict()
+
+    def fill_iridict():
+        for n, i in enumerate(iris):
+            idict[i] = n
+
+    d = mmapdict(path, slots=2 * count)
+
+    def fill_mmapdict():
+        for n, i in enumerate(iris):
+            d[i] = n
+
+    timed('iridict set', count, fill_iridict)
+    timed('mmapdict set', count, fill_mmapdict)
+    timed('iridict get', len(probe), lambda: [ idict[i] for i in probe ])
+    timed('mmapdict get', len(probe), lambda: [ d[i] for i in probe ])
+    d.close()
+    start = time.perf_counter()
+    d = mmapdict(path, readonly=True)
+    print('{0:24} {1:8.2f}ms'.format('mmapdict open', (time.perf_counter() - start) * 1e3))
+    timed('mmapdict get, reopened', len(probe), lambda: [ d[i] for i in probe ])
+    print('{0:24} {1:8.1f} MiB'.format('files', sum(os.path.getsize(path + ext) for ext in ('.dat', '.idx')) / 2**20))
+    d.close()
+    for ext in ('.dat', '.idx'):
+        os.remove(path + ext)
+    os.rmdir(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+'''
+Per-instance memory of NormalizedIri against str & iriref, and the cost of
+deduplicating IRIs by equivalence with a set of NormalizedIri against iridict
+
+python bench/bench_normalized_iri.py [COUNT]
+'''
+
+import sys
+import time
+
+from amara3.iri import I
+from amara3.irihelper import iridict, NormalizedIri
+from amara3.contrib.mem_check import alloc_diff
+
+
+def gen_iris(count):
+    for i in range(count):
+        #Every other one already in normal form
+        yield ('http://example.org/r/{0}' if i % 2 else 'HTTP://Example.org:80/r/%7e{0}').format(i)
+
+
+def per_instance(label, count, make):
+    with alloc_diff() as diff:
+        keep = make()
+    print('{0:36} {1:7.1f} bytes'.format(label, diff.net / count))
+    return keep
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    texts = list(gen_iris(count))
+    per_instance('str (copy)', count, lambda: [ t[:-1] + t[-1] for t in texts ])
+    per_instance('iriref', count, lambda: [ I(t) for t in texts ])
+    values = per_instance('NormalizedIri, excluding its text', count, lambda: [ NormalizedIri(t) for t in texts ])
+    with alloc_diff() as diff:
+        for v in values:
+            hash(v)
+    print('{0:36} {1:7.1f} bytes'.format('  + canonical form & hash', diff.net / count))
+
+    start = time.perf_counter()
+    unique = set(NormalizedIri(t) for t in texts)
+    print('{0:36} {1:7.2f}us/IRI'.format('set of NormalizedIri', (time.perf_counter() - start) / count * 1e6))
+    start = time.perf_counter()
+    d = iridict()
+    for t in texts:
+        d[t] = None
+    print('{0:36} {1:7.2f}us/IRI'.format('iridict', (time.perf_counter() - start) / count * 1e6))
+    assert len(unique) == len(d) == count
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+'''
+Compare batched amara3.pipeline stages with classic one-item-per-send coroutines
+
+python bench/bench_pipeline.py [COUNT] [BATCH_SIZE]
+
+Runs COUNT (default 200000) IRIs through two pipelines, each in both styles, best of 3 runs:
+a cheap one (map, filter, dedupe) where generator overhead dominates, and one
+resolving & normalizing the IRIs with amara3.iri, where the work per item does.
+'''
+
+import sys
+import time
+
+from amara3 import iri
+from amara3.util import coroutine
+from amara3 import pipeline as pl
+
+
+@coroutine
+def item_map(func, target):
+    try:
+        while True:
+            target.send(func((yield)))
+    except GeneratorExit:
+        target.close()
+
+
+@coroutine
+def item_filter(pred, target):
+    try:
+        while True:
+            item = (yield)
+            if pred(item):
+                target.send(item)
+    except GeneratorExit:
+        target.close()
+
+
+@coroutine
+def item_dedupe(target):
+    seen = set()
+    try:
+        while True:
+            item = (yield)
+            if item not in seen:
+                seen.add(item)
+                target.send(item)
+    except GeneratorExit:
+        target.close()
+
+
+@coroutine
+def item_sink(results):
+    while True:
+        results.append((yield))
+
+
+def item_source(iterable, target):
+    for item in iterable:
+        target.send(item)
+    target.close()
+
+
+def normalize(i):
+    i = iri.normalize_case(iri.normalize_percent_encoding(i), doHost=True)
+    return iri.normalize_path_segments_in_uri(i)
+
+
+def timed(label, count, func, repeat=3):
+    elapsed = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = min(elapsed, time.perf_counter() - start)
+    print('{0:28} {1:10.0f} items/s'.format(label, count / elapsed))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else pl.DEFAULT_BATCH_SIZE
+    refs = [ 'a/./{0}/%7E{1}'.format(i % 5000, i) for i in range(count) ]
+    base = 'HTTP://Example.ORG/x/'
+    upper = str.upper
+    keep = lambda s: not s.endswith('7')
+    absolutize = lambda r: iri.absolutize(r, base)
+
+    out = []
+    def run(build):
+        del out[:]
+        build()
+
+    timed('cheap, per item', count, lambda: run(lambda: item_source(refs, item_map(upper, item_filter(keep, item_dedupe(item_sink(out)))))))
+    check = list(out)
+    timed('cheap, batched', count, lambda: run(lambda: pl.source(refs, pl.map_items(upper, pl.filter_items(keep, pl.dedupe(pl.collect(out)))), batch_size)))
+    assert out == check
+
+    timed('resolve+normalize, per item', count, lambda: run(lambda: item_source(refs, item_map(absolutize, item_map(normalize, item_sink(out))))))
+    check = list(out)
+    timed('resolve+normalize, batched', count, lambda: run(lambda: pl.source(refs, pl.resolve_iris(base, pl.normalize_iris(pl.collect(out))), batch_size)))
+    assert out == check
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+'''
+Cost of iri.get_scheme & iri.is_absolute against the original SCHEME_PATTERN
+regex, for references with & without a scheme, and of iri.schemes_of for a batch
+
+python bench/bench_scheme.py [COUNT]
+'''
+
+import sys
+import time
+
+from amara3 import iri
+
+
+def regex_get_scheme(iri_ref):
+    m = iri.SCHEME_PATTERN.match(iri_ref)
+    return None if m is None else m.group(1)
+
+
+def regex_is_absolute(iri_ref):
+    return regex_get_scheme(iri_ref) is not None
+
+
+CASES = {
+    'scheme present': ['http://example.org/a/b', 'https://example.org/', 'urn:isbn:0451450523', 'x-custom+v1:thing'],
+    'scheme absent': ['a/b/c', '../d', '/abs/path', '#frag', 'a/b:c'],
+}
+
+
+def timed(func, iris):
+    start = time.perf_counter()
+    for i in iris:
+        func(i)
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    print('{0:>16} {1:>14} {2:>8} {3:>8}'.format('case', 'function', 'regex s', 'scan s'))
+    for case, samples in CASES.items():
+        iris = (samples * (count // len(samples) + 1))[:count]
+        assert [ regex_get_scheme(i) for i in samples ] == iri.schemes_of(samples)
+        for name, old, new in (('get_scheme', regex_get_scheme, iri.get_scheme), ('is_absolute', regex_is_absolute, iri.is_absolute)):
+            print('{0:>16} {1:>14} {2:8.3f} {3:8.3f}'.format(case, name, min(timed(old, iris) for _ in range(3)), min(timed(new, iris) for _ in range(3))))
+        start = time.perf_counter()
+        iri.schemes_of(iris)
+        print('{0:>16} {1:>14} {2:>8} {3:8.3f}'.format(case, 'schemes_of', '', time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+'''
+Cost of handing a large IRI table to pool workers as a pickled list of iriref,
+against publishing it once to shared memory for workers to attach to, plus the
+cost of unpickling iriref with & without revalidation
+
+python bench/bench_shared_iris.py [COUNT] [TASKS]
+'''
+
+import sys
+import time
+import pickle
+import multiprocessing
+
+from amara3.iri import I
+from amara3.irihelper import iriref
+from amara3.iriarray import publish, attach
+
+
+def pickled_task(args):
+    iris, picks = args
+    return sum(len(iris[i]) for i in picks)
+
+
+def shared_task(args):
+    name, picks = args
+    with attach(name) as table:
+        arr = table.array
+        return sum(len(arr[i]) for i in picks)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    tasks = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    iris = [ I('http://data{0}.example.org/resource/{1}'.format(i % 31, i)) for i in range(count) ]
+    picks = [ list(range(t, count, count // 1000)) for t in range(tasks) ]
+
+    with multiprocessing.Pool(4) as pool:
+        start = time.perf_counter()
+        expected = pool.map(pickled_task, [ (iris, p) for p in picks ])
+        print('{0:36} {1:8.2f}s'.format('pickled list per task', time.perf_counter() - start))
+        start = time.perf_counter()
+        with publish(iris) as table:
+            published = time.perf_counter() - start
+            results = pool.map(shared_task, [ (table.name, p) for p in picks ])
+        print('{0:36} {1:8.2f}s (publish {2:.2f}s)'.format('shared memory', time.perf_counter() - start, published))
+        assert results == expected
+
+    data = pickle.dumps(iris)
+    start = time.perf_counter()
+    pickle.loads(data)
+    print('{0:36} {1:8.2f}s'.format('unpickle iriref list, trusted', time.perf_counter() - start))
+    #As before __reduce__, which went through __new__ & its syntax check
+    data = pickle.dumps([ (iriref, (str(i),)) for i in iris ])
+    start = time.perf_counter()
+    [ cls(*args) for cls, args in pickle.loads(data) ]
+    print('{0:36} {1:8.2f}s'.format('unpickle iriref list, validated', time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
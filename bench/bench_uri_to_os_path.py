@@ -0,0 +1,37 @@
+'''
+Batch conversion of file URIs to posix paths with uri_to_os_path
+
+python bench/bench_uri_to_os_path.py [COUNT]
+
+Converts COUNT (default 1000000) URIs, spread over 1000 directories, once with
+no percent-escapes & once with escapes in both directory & file names. The
+general code path (forced by adding a fragment to each URI) stands in for the
+implementation before the posix fast path.
+'''
+
+import sys
+import time
+
+from amara3.iri import uri_to_os_path
+
+
+def timed(label, uris, **kwargs):
+    start = time.perf_counter()
+    for uri in uris:
+        uri_to_os_path(uri, osname='posix', **kwargs)
+    elapsed = time.perf_counter() - start
+    print('{0:34} {1:6.2f}s {2:10.0f} URIs/s'.format(label, elapsed, len(uris)/elapsed))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    plain = [ 'file:///data/set{0}/part-{1}.xml'.format(i % 1000, i) for i in range(count) ]
+    escaped = [ 'file:///data/r%C3%A9sum%C3%A9%20{0}/part%20{1}.xml'.format(i % 1000, i) for i in range(count) ]
+    for label, uris in (('plain', plain), ('escaped', escaped)):
+        timed(label + ', general path', [ u + '#' for u in uris ])
+        timed(label + ', fast path', uris)
+        timed(label + ', fast path + cache_dirs', uris, cache_dirs=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+'''
+Compare os.walk + os_path_to_uri per file with iri.walk_file_uris
+
+python bench/bench_walk_file_uris.py [ROOT]
+
+With no ROOT, builds a temporary tree of 100 directories x 500 files, with a mix of
+plain names & names needing percent-encoding. Both runs list the same (warm) tree,
+so the difference is in URI construction.
+'''
+
+import os
+import sys
+import time
+import tempfile
+
+from amara3.iri import os_path_to_uri, walk_file_uris
+
+
+def build_tree(root, dirs=100, files=500):
+    for d in range(dirs):
+        dirpath = os.path.join(root, 'collection {0}'.format(d), 'items')
+        os.makedirs(dirpath)
+        for f in range(files):
+            name = 'record-{0}.xml'.format(f) if f % 4 else 'résumé {0}.xml'.format(f)
+            open(os.path.join(dirpath, name), 'w').close()
+
+
+def per_file(root):
+    return [ (os.path.join(d, f), os_path_to_uri(os.path.join(d, f))) for d, _, files in os.walk(root) for f in files ]
+
+
+def timed(label, func, root):
+    start = time.perf_counter()
+    result = func(root)
+    elapsed = time.perf_counter() - start
+    print('{0:28} {1:8} files {2:7.3f}s {3:10.0f} files/s'.format(label, len(result), elapsed, len(result)/elapsed))
+    return result
+
+
+def main():
+    if len(sys.argv) > 1:
+        root = sys.argv[1]
+    else:
+        root = tempfile.mkdtemp()
+        build_tree(root)
+    per_file(root) #Warm the directory cache
+    old = timed('os.walk + os_path_to_uri', per_file, root)
+    new = timed('walk_file_uris', lambda r: list(walk_file_uris(r)), root)
+    assert sorted(old) == sorted(new)
+
+
+if __name__ == '__main__':
+    main()
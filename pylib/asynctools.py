@@ -1,6 +1,13 @@
 import sys
 import ssl
+import time
+import random
 import asyncio
+import threading
+from collections import OrderedDict, namedtuple
+from urllib.parse import urlsplit
+
+from amara3.util import latency_histogram
 
 
 try:
@@ -16,15 +23,129 @@ try:
         aiohttp.ClientError,
     )
 except ImportError:
-    pass
+    aiohttp = None
+
+
+class loop_runner:
+    '''
+    Event loop kept running in a dedicated daemon thread, so that sync code,
+    from any number of threads at once, can run coroutines without paying for
+    a new event loop each time (as with asyncio.run)
+
+    >>> import asyncio
+    >>> from amara3.asynctools import loop_runner
+    >>> async def x(n):
+    ...     await asyncio.sleep(0.1)
+    ...     return n * 2
+    >>> with loop_runner() as runner:
+    ...     runner.run(x(21))
+    ...
+    42
+
+    Coroutines all share the one loop, so things bound to a loop, such as an
+    aiohttp.ClientSession, can be created once via run() and reused across calls.
+    '''
+    def __init__(self, name='amara3-event-loop'):
+        self.name = name
+        self.loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        '''
+        Start the loop thread, if not already running
+        '''
+        with self._lock:
+            if self._thread is not None:
+                return self
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            def serve():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+            self._thread = threading.Thread(target=serve, name=self.name, daemon=True)
+            self._thread.start()
+            ready.wait()
+            self.loop = loop
+        return self
+
+    def submit(self, coro):
+        '''
+        Schedule a coroutine on the loop, returning a concurrent.futures.Future
+        for its result. Safe to call from any thread
+        '''
+        if self.loop is None:
+            self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        '''
+        Run a coroutine on the loop, blocking until it completes & returning its result
+        '''
+        if self._thread is not None and threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError('loop_runner.run() called from its own loop, which would deadlock. Use await')
+        return self.submit(coro).result(timeout)
+
+    def stop(self):
+        '''
+        Cancel whatever is still running on the loop, then stop & close it
+        '''
+        with self._lock:
+            loop, thread = self.loop, self._thread
+            self.loop = self._thread = None
+        if thread is None:
+            return
+        async def shutdown():
+            tasks = [ t for t in asyncio.all_tasks() if t is not asyncio.current_task() ]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await loop.shutdown_asyncgens()
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+
+_default_runner = None
+_default_runner_lock = threading.Lock()
+
+def get_runner():
+    '''
+    Return the shared loop_runner, starting it on first use
+    '''
+    global _default_runner
+    if _default_runner is None:
+        with _default_runner_lock:
+            if _default_runner is None:
+                _default_runner = loop_runner().start()
+    return _default_runner
 
 
 def go_async(launch_task, close_loop=False):
     '''
-    Convenience function to launch a coroutine asynchronously
-    Basically Python 3.7's asyncio.run() simulated for 3.5 & 3.6
-    
-    WARNING: You can generally only use this once per interpreter session, unless you set close_loop=False
+    Convenience function to launch a coroutine asynchronously & return its result
+
+    Coroutines run on the shared, persistent event loop from get_runner(), so
+    go_async can be called any number of times, from any thread. close_loop
+    only applies to other awaitables (e.g. the result of asyncio.gather), which
+    are run the old way, on the current thread's event loop
+
+    Note that a coroutine therefore runs on another thread (the runner's), not on
+    the calling thread's event loop. It doesn't see the caller's thread-local data
+    or context variables, and must not use objects bound to another loop, such as
+    an aiohttp.ClientSession created under asyncio.run. Objects it creates are
+    bound to the shared loop, so can be reused by later go_async calls. To run on
+    the calling thread instead, use asyncio.run
 
     >>> import asyncio
     >>> from amara3.asynctools import go_async
@@ -35,6 +156,8 @@ def go_async(launch_task, close_loop=False):
     >>> retval
     'ndewo'
     '''
+    if asyncio.iscoroutine(launch_task):
+        return get_runner().run(launch_task)
     loop = asyncio.get_event_loop()
     resp = loop.run_until_complete(launch_task)
     if close_loop: loop.close()
@@ -60,6 +183,9 @@ async def progress_indicator(delay, loop=None, out=sys.stdout, max_width=80):
     Coroutine useful for progress indication to console,
     printing dots when scheduled, after a given delay
 
+    Deprecated: prefer progress_meter, which reports throughput & ETA from item
+    counters rather than by polling the event loop's tasks
+
     >>> import sys
     >>> import asyncio
     >>> from amara3.asynctools import progress_indicator, go_async
@@ -87,12 +213,219 @@ async def progress_indicator(delay, loop=None, out=sys.stdout, max_width=80):
         #Print a dot, with no newline afterward & force the output to appear immediately
         print('.', end='', file=out, flush=True)
         #Check if this is the last remaining task, and exit if so
-        num_active_tasks = [ task for task in asyncio.Task.all_tasks(loop)
+        num_active_tasks = [ task for task in asyncio.all_tasks(loop)
                                   if not task.done() ]
         if len(num_active_tasks) == 1:
             break
 
 
+def _human_bytes(n):
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if n < 1024 or unit == 'TB':
+            return '{:.1f} {}'.format(n, unit) if unit != 'B' else '{} B'.format(int(n))
+        n /= 1024
+
+
+def _human_duration(seconds):
+    minutes, seconds = divmod(int(seconds + 0.5), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{}:{:02}:{:02}'.format(hours, minutes, seconds)
+
+
+class progress_meter:
+    '''
+    Progress & throughput reporter for batch pipelines, driven by counts of items
+    (and optionally bytes) processed, which it turns into a periodic report of
+    items/s, bytes/s & ETA. Works as a context manager from sync code (reporting
+    from a daemon thread) or as an async context manager (reporting from a task)
+
+    total, total_bytes - expected totals, if known, for percentage & ETA
+    interval - seconds between reports
+    out - where to write reports. If it's a terminal each report overwrites the last,
+        otherwise each is on its own line
+    label - prefix for each report line
+
+    >>> import io
+    >>> from amara3.asynctools import progress_meter
+    >>> batches = [[b'spam', b'eggs'], [b'monty']]
+    >>> with progress_meter(total=3, out=io.StringIO()) as meter:
+    ...     for batch in batches:
+    ...         meter.update(len(batch), sum(len(i) for i in batch))
+    ...
+    >>> meter.items, meter.bytes
+    (3, 13)
+
+    update() takes a lock, so call it per batch rather than per item. Where batches
+    aren't natural, e.g. one worker thread per item, get a counter(), which tallies
+    locally & only updates the meter every so many items:
+
+    >>> tally = meter.counter(every=1000)
+    >>> for item in [b'python']:
+    ...     tally.add(1, len(item))
+    ...
+    >>> tally.flush()
+    >>> meter.items, meter.bytes
+    (4, 19)
+
+    Once stopped, the meter's elapsed time (and so its rates) stay as they were at stop.
+    '''
+    def __init__(self, total=None, total_bytes=None, interval=1.0, out=sys.stderr, label=''):
+        self.total = total
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.out = out
+        self.label = label
+        self.items = 0
+        self.bytes = 0
+        self.start_t = None
+        self.stop_t = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._task = None
+        isatty = getattr(out, 'isatty', None)
+        self._tty = bool(isatty and isatty())
+
+    def update(self, items=1, nbytes=0):
+        '''
+        Count items (& bytes) as done. Safe to call from any thread
+        '''
+        with self._lock:
+            self.items += items
+            self.bytes += nbytes
+
+    def counter(self, every=1000):
+        '''
+        Return a local tally which passes its counts on to this meter every so
+        many items. Remember to flush() it when done
+        '''
+        return _batched_counter(self, every)
+
+    def snapshot(self):
+        '''
+        Dict of current items, bytes, elapsed seconds, items_per_s, bytes_per_s
+        & eta (seconds, None if there's no total to go by)
+        '''
+        with self._lock:
+            items, nbytes = self.items, self.bytes
+        if self.start_t is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self.stop_t or time.monotonic()) - self.start_t
+        items_per_s = items / elapsed if elapsed else 0.0
+        bytes_per_s = nbytes / elapsed if elapsed else 0.0
+        eta = None
+        if self.total and items_per_s:
+            eta = max(self.total - items, 0) / items_per_s
+        elif self.total_bytes and bytes_per_s:
+            eta = max(self.total_bytes - nbytes, 0) / bytes_per_s
+        return {'items': items, 'bytes': nbytes, 'elapsed': elapsed,
+                'items_per_s': items_per_s, 'bytes_per_s': bytes_per_s, 'eta': eta}
+
+    def format(self, snap=None):
+        '''
+        Render a snapshot as a one-line report
+        '''
+        snap = snap or self.snapshot()
+        parts = [self.label] if self.label else []
+        done = '{:,}'.format(snap['items'])
+        if self.total:
+            done += '/{:,} ({:.0%})'.format(self.total, snap['items'] / self.total)
+        parts.append('{} items, {:,.1f}/s'.format(done, snap['items_per_s']))
+        if snap['bytes'] or self.total_bytes:
+            parts.append('{}, {}/s'.format(_human_bytes(snap['bytes']), _human_bytes(snap['bytes_per_s'])))
+        parts.append('elapsed ' + _human_duration(snap['elapsed']))
+        if snap['eta'] is not None:
+            parts.append('ETA ' + _human_duration(snap['eta']))
+        return ' | '.join(parts)
+
+    def report(self, final=False):
+        '''
+        Write a report line to out
+        '''
+        line = self.format()
+        if self._tty:
+            self.out.write('\r\x1b[K' + line + ('\n' if final else ''))
+        else:
+            self.out.write(line + '\n')
+        self.out.flush()
+
+    def start(self):
+        '''
+        Start the clock & periodic reporting from a daemon thread
+        '''
+        self.start_t = time.monotonic()
+        self.stop_t = None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run_thread, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run_thread(self):
+        while not self._stop.wait(self.interval):
+            self.report()
+
+    async def _run_task(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.report()
+
+    def stop(self):
+        '''
+        Stop periodic reporting & the clock, writing a final report
+        '''
+        self.stop_t = time.monotonic()
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.report(final=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    async def __aenter__(self):
+        self.start_t = time.monotonic()
+        self.stop_t = None
+        self._task = asyncio.ensure_future(self._run_task())
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+
+class _batched_counter:
+    '''
+    Thread- or task-local tally for a progress_meter (see progress_meter.counter)
+    '''
+    __slots__ = ('meter', 'every', 'items', 'bytes')
+
+    def __init__(self, meter, every):
+        self.meter = meter
+        self.every = every
+        self.items = 0
+        self.bytes = 0
+
+    def add(self, items=1, nbytes=0):
+        self.items += items
+        self.bytes += nbytes
+        if self.items >= self.every:
+            self.flush()
+
+    def flush(self):
+        if self.items or self.bytes:
+            self.meter.update(self.items, self.bytes)
+            self.items = self.bytes = 0
+
+
 #class req_tracer docstring rendered here for easy testing, for now
 '''
 import aiohttp
@@ -103,21 +436,134 @@ async def access_site():
     async with aiohttp.ClientSession(trace_configs=[rtimings.trace_config]) as sess:
         #If trace_request_ctx omitted, results stored in rtimings.request[None]
         async with sess.get(url, trace_request_ctx={'reqid': 'ID'}) as response:
+            await response.read()
+            rtimings.finish('ID')
             t = rtimings.request['ID'].get('total_elapsed', 0)
             t = '{:.3f}'.format(t) if t else 'UNKNOWN'
             print('Web request took', t, 'seconds')
             return response
 
 resp = go_async(access_site())
+print(rtimings.metrics.to_prometheus())
 '''
 
+#Request phases for which http_metrics keeps latency histograms
+HTTP_PHASES = ('dns', 'connect', 'ttfb', 'transfer', 'total')
+
+#Key under which http_metrics aggregates hosts beyond its max_hosts
+OTHER_HOST = '(other)'
+
+
+class http_metrics:
+    '''
+    Per-host aggregate of HTTP request latencies, broken down by phase
+    (see HTTP_PHASES), in fixed-memory histograms. Doesn't itself need aiohttp;
+    req_tracer feeds one from aiohttp's tracing signals
+
+    max_hosts - number of distinct hosts tracked separately. Any further hosts are
+        lumped together under OTHER_HOST, so memory use is bounded however
+        long a crawler runs
+
+    >>> from amara3.asynctools import http_metrics
+    >>> m = http_metrics()
+    >>> m.record('example.org', 'ttfb', 0.120)
+    >>> m.record('example.org', 'ttfb', 0.080)
+    >>> m.summary()['example.org']['ttfb']['count']
+    2
+    '''
+    def __init__(self, max_hosts=256, percentiles=(50, 90, 99)):
+        self.max_hosts = max_hosts
+        self.percentiles = percentiles
+        #host => phase => latency_histogram
+        self.hosts = {}
+        #host => {'requests': n, 'errors': n, 'bytes': n}
+        self.counters = {}
+
+    def _host(self, host):
+        if host not in self.hosts:
+            if len(self.hosts) >= self.max_hosts:
+                host = OTHER_HOST
+            if host not in self.hosts:
+                self.hosts[host] = { phase: latency_histogram() for phase in HTTP_PHASES }
+                self.counters[host] = {'requests': 0, 'errors': 0, 'bytes': 0}
+        return host
+
+    def record(self, host, phase, seconds):
+        '''
+        Add a latency sample for the given phase of a request to the given host
+        '''
+        self.hosts[self._host(host)][phase].record(seconds)
+
+    def count(self, host, counter, n=1):
+        '''
+        Bump one of the requests, errors or bytes counters for the given host
+        '''
+        self.counters[self._host(host)][counter] += n
+
+    def summary(self):
+        '''
+        Dict of host => phase => summary (count, sum, min, max, mean & percentiles, e.g. p50),
+        plus host => 'counters' => requests, errors & bytes
+        '''
+        result = {}
+        for host, phases in self.hosts.items():
+            result[host] = { phase: hist.summary(self.percentiles) for phase, hist in phases.items() }
+            result[host]['counters'] = dict(self.counters[host])
+        return result
+
+    def to_json(self, **kwargs):
+        '''
+        summary() as JSON. Keyword args are passed on to json.dumps
+        '''
+        import json
+        return json.dumps(self.summary(), **kwargs)
+
+    def to_prometheus(self, prefix='amara3_http'):
+        '''
+        Metrics in the Prometheus text exposition format: a histogram of request
+        phase durations, plus request, error & byte counters, all labeled by host
+        '''
+        def esc(value):
+            return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        name = prefix + '_request_phase_seconds'
+        lines = ['# HELP {} Duration of HTTP request phases'.format(name),
+                 '# TYPE {} histogram'.format(name)]
+        for host, phases in self.hosts.items():
+            for phase, hist in phases.items():
+                labels = 'host="{}",phase="{}"'.format(esc(host), phase)
+                for bound, cumulative in hist.buckets():
+                    le = '+Inf' if bound is None else '{:.6g}'.format(bound)
+                    lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, labels, le, cumulative))
+                lines.append('{}_sum{{{}}} {!r}'.format(name, labels, hist.total))
+                lines.append('{}_count{{{}}} {}'.format(name, labels, hist.count))
+        for counter in ('requests', 'errors', 'bytes'):
+            cname = '{}_{}_total'.format(prefix, counter)
+            lines.append('# TYPE {} counter'.format(cname))
+            for host, counters in self.counters.items():
+                lines.append('{}{{host="{}"}} {}'.format(cname, esc(host), counters[counter]))
+        return '\n'.join(lines) + '\n'
+
+
 class req_tracer:
     '''
     aiohttp request tracer helper
     Requires aiohttp version 3.0.
-    
+
     See: https://docs.aiohttp.org/en/stable/tracing_reference.html#aiohttp-client-tracing-reference
-    
+
+    Aggregates DNS, connect, time-to-first-byte (TTFB), transfer & total latencies
+    per host in self.metrics (an http_metrics), and keeps the timings of the most
+    recent max_requests requests in self.request, keyed by the reqid given in the
+    request's trace_request_ctx (None if not given).
+
+    DNS & connect phases are only seen when they happen: a DNS cache hit or a reused
+    pooled connection skips them, which is why they aren't in every request's timings.
+    aiohttp signals the end of a request once response headers arrive, before the body
+    is read, so call finish(reqid) once you've read the body to record the transfer phase.
+    If several requests in flight share a reqid, finish(reqid) applies to the one
+    whose headers arrived first.
+
     >>> import aiohttp
     >>> from amara3.asynctools import go_async, req_tracer
     >>> rtimings = req_tracer()
@@ -126,20 +572,30 @@ class req_tracer:
     ...     async with aiohttp.ClientSession(trace_configs=[rtimings.trace_config]) as sess:
     ...         #If trace_request_ctx omitted, results stored in rtimings.request[None]
     ...         async with sess.get(url, trace_request_ctx={'reqid': 'ID'}) as response:
+    ...             await response.read()
+    ...             rtimings.finish('ID')
     ...             t = rtimings.request['ID'].get('total_elapsed', 0)
     ...             t = '{:.3f}'.format(t) if t else 'UNKNOWN'
     ...             print('Web request took', t, 'seconds')
     ...             return response
-    ... 
+    ...
     >>> resp = go_async(access_site())
     Web request took 0.121 seconds
-    >>> 
+    >>> sorted(rtimings.metrics.summary()['artscene.textfiles.com']['ttfb'])
+    ['count', 'max', 'mean', 'min', 'p50', 'p90', 'p99', 'sum']
     '''
-    def __init__(self):
+    def __init__(self, max_hosts=256, max_requests=1000, metrics=None):
+        if aiohttp is None:
+            raise ImportError('req_tracer requires aiohttp')
+        self.metrics = metrics or http_metrics(max_hosts=max_hosts)
+        self.max_requests = max_requests
         #Store the tracked timings according to a key specified in the request context (or use None key if none provided)
-        self.request = {}
+        self.request = OrderedDict()
+        #Trace contexts of requests whose body might still be arriving, by id(). Each
+        #entry holds on to its context, so the id isn't reused while it's there
+        self._inflight = OrderedDict()
         self.trace_config = aiohttp.TraceConfig()
- 
+
         self.trace_config.on_request_start.append(self.start_t)
         self.trace_config.on_request_redirect.append(self.redirected)
         self.trace_config.on_dns_resolvehost_start.append(self.dns_start_t)
@@ -147,69 +603,202 @@ class req_tracer:
         self.trace_config.on_connection_create_start.append(self.connect_start_t)
         self.trace_config.on_connection_create_end.append(self.connect_end_t)
         self.trace_config.on_request_end.append(self.end_t)
-        self.trace_config.on_request_chunk_sent.append(self.chunk_sent)
+        self.trace_config.on_request_exception.append(self.exception_t)
         self.trace_config.on_response_chunk_received.append(self.chunk_received)
 
+    @staticmethod
+    def _reqid(context):
+        ctx = context.trace_request_ctx
+        return ctx.get('reqid') if isinstance(ctx, dict) else None
+
+    def _remember(self, store, reqid, value):
+        #Bounded, most recent last
+        store.pop(reqid, None)
+        store[reqid] = value
+        while len(store) > self.max_requests:
+            store.popitem(last=False)
+
     async def start_t(self, session, context, params):
-        time = session.loop.time()
-        context.start_t = time
+        context.start_t = time.monotonic()
+        context.reqid = self._reqid(context)
+        context.host = params.url.host or ''
         context.is_redirect = False
- 
-    async def connect_start_t(self, session, context, params):
-        time = session.loop.time()
-        since_start = time - context.start_t
-        context.connect_start_t = since_start
- 
+        context.timings = {}
+        context.bytes = 0
+        context.last_chunk_t = None
+
     async def redirected(self, session, context, params):
-        time = session.loop.time()
-        since_start = time - context.start_t
-        context.redirected = since_start
         context.is_redirect = True
- 
+
     async def dns_start_t(self, session, context, params):
-        time = session.loop.time()
-        since_start = time - context.start_t
-        context.dns_start_t = since_start
- 
+        context.dns_start_t = time.monotonic()
+
     async def dns_end_t(self, session, context, params):
-        time = session.loop.time()
-        since_start = time - context.start_t
-        context.dns_end_t = since_start
- 
+        elapsed = time.monotonic() - context.dns_start_t
+        context.timings['dns'] = elapsed
+        self.metrics.record(context.host, 'dns', elapsed)
+
+    async def connect_start_t(self, session, context, params):
+        context.connect_start_t = time.monotonic()
+
     async def connect_end_t(self, session, context, params):
-        time = session.loop.time()
-        since_start = time - context.start_t
-        context.connect_end_t = since_start
-     
-    async def chunk_sent(self, session, context, params):
-        time = session.loop.time()
-        since_start = time - context.start_t
-        context.chunk_sent = since_start
-     
+        #Connection creation includes any DNS resolution, which is accounted separately
+        elapsed = time.monotonic() - context.connect_start_t - context.timings.get('dns', 0)
+        context.timings['connect'] = elapsed
+        self.metrics.record(context.host, 'connect', elapsed)
+
     async def chunk_received(self, session, context, params):
-        time = session.loop.time()
-        since_start = time - context.start_t
-        context.chunk_received = since_start
- 
+        context.last_chunk_t = time.monotonic()
+        context.bytes += len(params.chunk)
+
+    async def exception_t(self, session, context, params):
+        self.metrics.count(context.host, 'errors')
+
     async def end_t(self, session, context, params):
-        if not context.trace_request_ctx: return
-        #Store the tracked timings according to a key specified in the request context (or use None key if none provided)
-        reqid = context.trace_request_ctx.get('reqid')
-        time_now = session.loop.time()
-        total_elapsed = time_now - context.start_t
-        context.end_t = total_elapsed
- 
-        #The DNS & connect callbacks are not getting called, for some reason
-        #dns_lookup_and_dial_time = context.dns_end_t - context.dns_start_t
-        #connect_time = context.connect_end_t - dns_lookup_and_dial_time
-        #transfer_time = total_elapsed - context.connect_end_t
-        is_redirect = context.is_redirect
-        
-        self.request.setdefault(reqid, {}).update({
-            #'dns_lookup_and_dial_time': dns_lookup_and_dial_time,
-            #'connect_time': connect_time,
-            #'transfer_time': transfer_time,
-            'is_redirect': is_redirect,
-            'total_elapsed': total_elapsed
+        context.end_t = time.monotonic()
+        ttfb = context.end_t - context.start_t
+        context.timings['ttfb'] = ttfb
+        self.metrics.record(context.host, 'ttfb', ttfb)
+        self.metrics.count(context.host, 'requests')
+        reqid = context.reqid
+        record = dict(context.timings)
+        record.update({
+            'host': context.host,
+            'is_redirect': context.is_redirect,
+            'total_elapsed': ttfb
         })
+        self._remember(self.request, reqid, record)
+        self._remember(self._inflight, id(context), context)
+
+    def finish(self, reqid=None):
+        '''
+        Mark the response body of the identified request as fully read, recording
+        its transfer phase & total elapsed time
+        '''
+        for key, context in self._inflight.items():
+            if context.reqid == reqid:
+                break
+        else:
+            return
+        del self._inflight[key]
+        end = context.last_chunk_t or context.end_t
+        transfer = end - context.end_t
+        total = end - context.start_t
+        self.metrics.record(context.host, 'transfer', transfer)
+        self.metrics.record(context.host, 'total', total)
+        self.metrics.count(context.host, 'bytes', context.bytes)
+        record = self.request.get(reqid)
+        if record is not None:
+            record.update({'transfer': transfer, 'total_elapsed': total, 'bytes': context.bytes})
+        return
+
+
+#Response statuses which fetch_many treats as transient, and so retries
+RETRY_STATUSES = frozenset((408, 429, 500, 502, 503, 504))
+
+#Outcome of fetching one IRI. status, body & headers are None if no response was had.
+#error is the exception behind the final failed attempt, or None on success
+fetch_result = namedtuple('fetch_result', 'iri status body headers error attempts')
+
+
+async def fetch_many(iris, concurrency=32, per_host=4, retries=3, backoff=0.5, max_backoff=30.0,
+                        timeout=60, session=None, tracer=None, retry_statuses=RETRY_STATUSES):
+    '''
+    Async generator fetching the content of many IRIs, yielding a fetch_result for
+    each as it finishes (so not necessarily in the order given)
+
+    iris - iterable of IRIs, which is only consumed as capacity frees up, so it can
+        be a huge (or endless) generator
+    concurrency - cap on requests in flight overall
+    per_host - cap on requests in flight to any one host
+    retries - number of times to retry an IRI after an error in AIOHTTP_ERROR_MENAGERIE
+        (connection failures, timeouts, etc.) or a response with one of retry_statuses
+    backoff, max_backoff - delay before retry n is chosen at random between 0 and
+        min(max_backoff, backoff * 2**n) seconds ("full jitter" exponential backoff)
+    timeout - total timeout in seconds for each attempt, if fetch_many creates the session
+    session - aiohttp.ClientSession to use. By default one is created & closed again
+    tracer - req_tracer for timings. If you provide a session, it must have been
+        created with the tracer's trace_config. Timings for each attempt are under
+        the reqid (iri, attempt number) in tracer.request
+
+    Responses with other error statuses (say 404) are not retried, and yielded with
+    their status & body as for any other response.
+
+    >>> from amara3.asynctools import fetch_many, req_tracer, go_async
+    >>> tracer = req_tracer()
+    >>> async def crawl(iris):
+    ...     async for result in fetch_many(iris, concurrency=16, per_host=2, tracer=tracer):
+    ...         print(result.iri, result.status, len(result.body or b''))
+    ...
+    >>> go_async(crawl(['http://example.org/', 'http://example.com/']))
+    http://example.com/ 200 1256
+    http://example.org/ 200 1256
+    '''
+    if aiohttp is None:
+        raise ImportError('fetch_many requires aiohttp')
+    global_limit = asyncio.Semaphore(concurrency)
+    #host => [semaphore, number of fetch_one tasks using it]. Dropped once unused,
+    #so a crawl over many hosts doesn't keep one for each
+    host_limits = {}
+    own_session = session is None
+    if own_session:
+        session = aiohttp.ClientSession(
+            trace_configs=[tracer.trace_config] if tracer else None,
+            timeout=aiohttp.ClientTimeout(total=timeout))
+
+    async def fetch_one(iri):
+        host = urlsplit(iri).hostname or ''
+        entry = host_limits.get(host)
+        if entry is None:
+            entry = host_limits[host] = [asyncio.Semaphore(per_host), 0]
+        entry[1] += 1
+        try:
+            return await fetch_attempts(iri, entry[0])
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del host_limits[host]
+
+    async def fetch_attempts(iri, host_limit):
+        status = error = None
+        for attempt in range(retries + 1):
+            if attempt:
+                #Sleep outside of the semaphores, so others can use the slot meanwhile
+                await asyncio.sleep(random.uniform(0, min(max_backoff, backoff * 2 ** attempt)))
+            reqid = (iri, attempt)
+            try:
+                #Wait for the host first, so as not to hog a global slot while doing so
+                async with host_limit, global_limit:
+                    async with session.get(iri, trace_request_ctx={'reqid': reqid}) as resp:
+                        status = resp.status
+                        if status in retry_statuses:
+                            resp.raise_for_status()
+                        body = await resp.read()
+                        headers = resp.headers
+                if tracer: tracer.finish(reqid)
+                return fetch_result(iri, status, body, headers, None, attempt + 1)
+            except AIOHTTP_ERROR_MENAGERIE as e:
+                error = e
+                #No point trying again
+                if isinstance(e, aiohttp.InvalidURL): break
+        return fetch_result(iri, status, None, None, error, attempt + 1)
 
+    iris = iter(iris)
+    #Keep enough tasks waiting that per-host limits don't leave global capacity idle,
+    #without materializing the whole input
+    window = concurrency * 2
+    pending = set()
+    try:
+        while True:
+            for iri in iris:
+                pending.add(asyncio.ensure_future(fetch_one(iri)))
+                if len(pending) >= window: break
+            if not pending: break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        if own_session:
+            await session.close()
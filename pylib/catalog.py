@@ -0,0 +1,293 @@
+# amara3.catalog
+"""
+In-memory index of OASIS XML Catalogs, for resolving the public & system IDs of
+DTDs & external entities (and other IRIs) to local copies
+
+http://www.oasis-open.org/committees/download.php/14809/xml-catalogs.html
+
+>>> from amara3.catalog import catalog
+>>> cat = catalog(['/etc/xml/catalog'])
+>>> cat.resolve('-//OASIS//DTD DocBook XML V4.5//EN', 'http://www.oasis-open.org/docbook/xml/4.5/docbookx.dtd')
+'file:///usr/share/xml/docbook/schema/dtd/4.5/docbookx.dtd'
+
+Entries are held in dicts keyed by normalized ID, and each distinct query's
+result is remembered, so repeat lookups (the usual pattern when processing
+many documents sharing a few DTDs) cost a single dict lookup.
+
+Also here are batch versions of the RFC 3151 conversions in amara3.iri, which
+memoize the converted forms.
+"""
+
+from functools import lru_cache
+from collections import OrderedDict
+from urllib.request import urlopen
+from xml.etree import ElementTree
+
+from amara3 import iri
+
+__all__ = ['catalog', 'public_ids_to_urns', 'urns_to_public_ids', 'CATALOG_NAMESPACE']
+
+CATALOG_NAMESPACE = 'urn:oasis:names:tc:entity:xmlns:xml:catalog'
+XML_BASE = '{http://www.w3.org/XML/1998/namespace}base'
+PUBLICID_URN_PREFIX = 'urn:publicid:'
+
+#Number of converted forms kept by the batch conversion functions
+CONVERSION_CACHE_SIZE = 65536
+
+_public_id_to_urn = lru_cache(maxsize=CONVERSION_CACHE_SIZE)(iri.public_id_to_urn)
+_urn_to_public_id = lru_cache(maxsize=CONVERSION_CACHE_SIZE)(iri.urn_to_public_id)
+
+
+def public_ids_to_urns(public_ids):
+    '''
+    Convert public IDs to RFC 3151 URNs, returning a list
+
+    >>> from amara3.catalog import public_ids_to_urns
+    >>> public_ids_to_urns(['-//OASIS//DTD DocBook XML V4.5//EN'])
+    ['urn:publicid:-:OASIS:DTD+DocBook+XML+V4.5:EN']
+    '''
+    return [ _public_id_to_urn(pubid) for pubid in public_ids ]
+
+
+def urns_to_public_ids(urns):
+    '''
+    Convert RFC 3151 URNs to public IDs, returning a list. Raises ValueError for
+    any that aren't publicid URNs
+    '''
+    return [ _urn_to_public_id(urn) for urn in urns ]
+
+
+def normalize_public_id(pubid):
+    '''
+    Normalize whitespace in a public ID, as for matching in catalogs
+    '''
+    return iri.PUBLIC_ID_SPACE_PATTERN.sub(' ', pubid.strip())
+
+
+def _unwrap_urn(ident):
+    #Per the spec (section 6.4) publicid URNs given as IDs are matched as public IDs
+    if ident[:13].lower() == PUBLICID_URN_PREFIX:
+        try:
+            return _urn_to_public_id(ident)
+        except ValueError:
+            pass
+    return None
+
+
+class _prefix_index(object):
+    '''
+    Prefix => value, for longest-prefix (or, with suffixes, longest-suffix) matching,
+    checking one dict entry per distinct prefix length
+    '''
+    def __init__(self, suffix=False):
+        self.entries = {}
+        self.lengths = []
+        self.suffix = suffix
+
+    def add(self, prefix, value):
+        #Within a catalog, the first matching entry wins
+        self.entries.setdefault(prefix, value)
+        if len(prefix) not in self.lengths:
+            self.lengths.append(len(prefix))
+            self.lengths.sort(reverse=True)
+
+    def match(self, ident):
+        entries = self.entries
+        for length in self.lengths:
+            if length <= len(ident):
+                key = ident[-length:] if self.suffix else ident[:length]
+                if key in entries:
+                    return key, entries[key]
+        return None
+
+
+#Attributes each supported entry must have, without which it's skipped
+_REQUIRED_ATTRIBUTES = {
+    'public': ('publicId', 'uri'),
+    'system': ('systemId', 'uri'),
+    'uri': ('name', 'uri'),
+    'rewriteSystem': ('systemIdStartString', 'rewritePrefix'),
+    'rewriteURI': ('uriStartString', 'rewritePrefix'),
+    'systemSuffix': ('systemIdSuffix', 'uri'),
+    'uriSuffix': ('uriSuffix', 'uri'),
+    'nextCatalog': ('catalog',),
+}
+
+
+class catalog(object):
+    '''
+    Index of XML Catalog entries
+
+    locations - catalog files (paths or IRIs) to load, in order of precedence
+    prefer - 'public' (the default) or 'system': whether public ID entries apply
+        when a system ID is also given, for entries not within an element setting it
+    cache_size - how many distinct query results to remember
+
+    Supported entries are public, system, uri, rewriteSystem, rewriteURI,
+    systemSuffix, uriSuffix, nextCatalog & group, with xml:base & prefer.
+    Delegation entries are ignored, as are entries missing a required attribute.
+    nextCatalog entries are loaded up front.
+    '''
+    def __init__(self, locations=None, prefer='public', cache_size=65536):
+        self.prefer = prefer
+        self.cache_size = cache_size
+        #Public ID => (IRI, prefer)
+        self.public = {}
+        self.system = {}
+        self.uri = {}
+        self.rewrite_system = _prefix_index()
+        self.rewrite_uri = _prefix_index()
+        self.system_suffix = _prefix_index(suffix=True)
+        self.uri_suffix = _prefix_index(suffix=True)
+        self._loaded = set()
+        self._memo = OrderedDict()
+        for location in (locations or ()):
+            self.load(location)
+
+    def load(self, location):
+        '''
+        Add the entries from a catalog file, given as path or IRI, after any already loaded
+        '''
+        if iri.is_absolute(location):
+            location_iri = location
+        else:
+            location_iri = iri.os_path_to_uri(location)
+        if location_iri in self._loaded:
+            return
+        self._loaded.add(location_iri)
+        if location_iri.startswith('file:'):
+            with open(iri.uri_to_os_path(location_iri), 'rb') as fp:
+                root = ElementTree.parse(fp).getroot()
+        else:
+            with urlopen(location_iri) as fp:
+                root = ElementTree.parse(fp).getroot()
+        if root.tag != '{' + CATALOG_NAMESPACE + '}catalog':
+            raise ValueError('Not an OASIS XML catalog: {0}'.format(location))
+        next_catalogs = []
+        self._load_entries(root, location_iri, self.prefer, next_catalogs)
+        self._memo.clear()
+        for next_catalog in next_catalogs:
+            self.load(next_catalog)
+        return
+
+    def _load_entries(self, elem, base, prefer, next_catalogs):
+        base = iri.absolutize(elem.get(XML_BASE), base) if elem.get(XML_BASE) else base
+        prefer = elem.get('prefer', prefer)
+        ns = '{' + CATALOG_NAMESPACE + '}'
+        for child in elem:
+            if not isinstance(child.tag, str) or not child.tag.startswith(ns):
+                continue
+            kind = child.tag[len(ns):]
+            if any(child.get(attr) is None for attr in _REQUIRED_ATTRIBUTES.get(kind, ())):
+                continue
+            cbase = iri.absolutize(child.get(XML_BASE), base) if child.get(XML_BASE) else base
+            resolved = lambda attr: iri.absolutize(child.get(attr), cbase)
+            if kind == 'public':
+                self.public.setdefault(normalize_public_id(child.get('publicId')), (resolved('uri'), child.get('prefer', prefer)))
+            elif kind == 'system':
+                self.system.setdefault(child.get('systemId'), resolved('uri'))
+            elif kind == 'uri':
+                self.uri.setdefault(child.get('name'), resolved('uri'))
+            elif kind == 'rewriteSystem':
+                self.rewrite_system.add(child.get('systemIdStartString'), resolved('rewritePrefix'))
+            elif kind == 'rewriteURI':
+                self.rewrite_uri.add(child.get('uriStartString'), resolved('rewritePrefix'))
+            elif kind == 'systemSuffix':
+                self.system_suffix.add(child.get('systemIdSuffix'), resolved('uri'))
+            elif kind == 'uriSuffix':
+                self.uri_suffix.add(child.get('uriSuffix'), resolved('uri'))
+            elif kind == 'nextCatalog':
+                next_catalogs.append(resolved('catalog'))
+            elif kind == 'group':
+                #Applies its own xml:base
+                self._load_entries(child, base, prefer, next_catalogs)
+        return
+
+    def add_public(self, public_id, uri):
+        '''
+        Map a public ID to an IRI, overriding any catalog entry
+        '''
+        self.public[normalize_public_id(public_id)] = (uri, self.prefer)
+        self._memo.clear()
+
+    def add_system(self, system_id, uri):
+        '''
+        Map a system ID to an IRI, overriding any catalog entry
+        '''
+        self.system[system_id] = uri
+        self._memo.clear()
+
+    def _remember(self, key, value):
+        #Least recently used results are dropped first (hits move to the end)
+        memo = self._memo
+        memo[key] = value
+        if len(memo) > self.cache_size:
+            memo.popitem(last=False)
+        return value
+
+    def _resolve_system(self, system_id):
+        found = self.system.get(system_id)
+        if found is not None:
+            return found
+        match = self.rewrite_system.match(system_id)
+        if match is not None:
+            prefix, rewrite = match
+            return rewrite + system_id[len(prefix):]
+        match = self.system_suffix.match(system_id)
+        if match is not None:
+            return match[1]
+        return None
+
+    def resolve(self, public_id=None, system_id=None):
+        '''
+        Resolve an external identifier, as from a DOCTYPE or entity declaration,
+        to an IRI from the catalog, or None if there's no match. Matching system
+        entries take precedence over public ones
+        '''
+        key = (public_id, system_id)
+        memo = self._memo
+        if key in memo:
+            memo.move_to_end(key)
+            return memo[key]
+        if system_id is not None:
+            unwrapped = _unwrap_urn(system_id)
+            if unwrapped is not None:
+                #A publicid URN as system ID is treated as if it were the public ID
+                public_id, system_id = (public_id or unwrapped), None
+        if public_id is not None:
+            public_id = normalize_public_id(_unwrap_urn(public_id) or public_id)
+        result = None
+        if system_id is not None:
+            result = self._resolve_system(system_id)
+        if result is None and public_id is not None:
+            entry = self.public.get(public_id)
+            if entry is not None and (system_id is None or entry[1] == 'public'):
+                result = entry[0]
+        return self._remember(key, result)
+
+    def resolve_uri(self, uri):
+        '''
+        Resolve an IRI (e.g. of a schema or stylesheet) to an IRI from the catalog, or None
+        '''
+        key = (None, None, uri)
+        memo = self._memo
+        if key in memo:
+            memo.move_to_end(key)
+            return memo[key]
+        result = self.uri.get(uri)
+        if result is None:
+            match = self.rewrite_uri.match(uri)
+            if match is not None:
+                result = match[1] + uri[len(match[0]):]
+        if result is None:
+            match = self.uri_suffix.match(uri)
+            if match is not None:
+                result = match[1]
+        return self._remember(key, result)
+
+    def resolve_many(self, ids):
+        '''
+        Resolve a sequence of (public ID, system ID) pairs, returning a list of IRIs or None
+        '''
+        resolve = self.resolve
+        return [ resolve(*pair) for pair in ids ]
@@ -9,15 +9,28 @@ Windows and *nix versions
 
 USAGE:
 
-amount = get_mem_use(units='MB') # options are KB, MB, GB
+amount = get_mem_use(units='MB') # current resident set. options are B, KB, MB, GB
+peak = get_peak_mem_use(units='MB')
+
+with alloc_diff() as diff: # Python allocations made in a block, via tracemalloc
+    build_lots_of_iris()
+print(diff.net, diff.peak)
+print(diff.report(top=10))
+
+deep_sizeof(some_iridict) # bytes, following contained objects
+sizeof_report(some_iridict) # total, per item, keys vs values...
 
 """
 
+import gc
+import os
 import sys
+import tracemalloc
 
 div = {'GB': 1024*1024*1024,
        'MB': 1024*1024,
        'KB': 1024,
+       'B': 1,
        }
 
 if sys.platform.startswith('win'):
@@ -93,19 +106,170 @@ if sys.platform.startswith('win'):
         info = get_memory_info()
         return info['PrivateUsage'] / float(div[units])
 
+    def get_peak_mem_use(units='MB'):
+        """
+        returns the peak working set of the current python process
+
+        :param units='MB': the units you want the reslut in. Options are:
+                           'GB', 'MB', 'KB', 'B'
+        """
+        info = get_memory_info()
+        return info['PeakWorkingSetSize'] / float(div[units])
+
+
+else:
+    import resource
+
+    #ru_maxrss is in kilobytes on Linux & the BSDs, but bytes on macOS
+    _MAXRSS_SCALE = 1 if sys.platform == 'darwin' else 1024
+
+    def _statm_rss():
+        try:
+            with open('/proc/self/statm') as statm:
+                return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, IndexError):
+            return None
 
-else: # for posix systems only tested on OS-X for now
     def get_mem_use(units='MB'):
         """
-        returns the total memory use of the current python process
+        returns the current resident memory of the current python process
+
+        Read from /proc/self/statm where available (Linux). Elsewhere (e.g. macOS)
+        this falls back to the peak resident set, as from get_peak_mem_use
 
         :param units='MB': the units you want the reslut in. Options are:
-                           'GB', 'MB', 'KB'
+                           'GB', 'MB', 'KB', 'B'
+        """
+        rss = _statm_rss()
+        if rss is None:
+            return get_peak_mem_use(units)
+        return rss / float(div[units])
+
+    def get_peak_mem_use(units='MB'):
+        """
+        returns the peak resident memory of the current python process
+
+        :param units='MB': the units you want the reslut in. Options are:
+                           'GB', 'MB', 'KB', 'B'
+        """
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _MAXRSS_SCALE
+        return peak / float(div[units])
+
+
+class alloc_diff:
+    """
+    Context manager recording Python memory allocations made within a block, as
+    the difference between tracemalloc snapshots taken on entry & exit
+
+    Starts tracemalloc if it's not already tracing, and stops it again on exit.
+    Only allocations through Python's allocators are seen, not e.g. mmap'ed files.
+
+    :param frames=1: depth of traceback stored per allocation
+    :param key_type='lineno': how to group the differences ('filename', 'lineno', 'traceback')
+
+    After the block:
+    net - bytes allocated & still live, minus bytes freed
+    peak - highest traced memory during the block, above the level on entry
+    stats - list of tracemalloc.StatisticDiff, largest change first
+    """
+    def __init__(self, frames=1, key_type='lineno'):
+        self.frames = frames
+        self.key_type = key_type
+        self.net = self.peak = 0
+        self.stats = []
+        self._started = False
+
+    def __enter__(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started = True
+        self._before = tracemalloc.take_snapshot()
+        self._base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        if self._started:
+            tracemalloc.stop()
+        #Leave out tracemalloc's own bookkeeping
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        self.stats = after.filter_traces(ignore).compare_to(
+            self._before.filter_traces(ignore), self.key_type)
+        self.net = sum(stat.size_diff for stat in self.stats)
+        self.peak = max(peak - self._base, 0)
+        self._before = None
+        return False
+
+    def report(self, top=10, units='KB'):
+        """
+        returns a text summary of the largest allocation changes
         """
-        import resource
-        #useage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
-        div = {'GB': 1024*1024*1024,
-               'MB': 1024*1024,
-               'KB': 1024,
-               }
-        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / float(div[units])
+        lines = ['net {0:.1f} {2}, peak {1:.1f} {2}'.format(
+            self.net / float(div[units]), self.peak / float(div[units]), units)]
+        for stat in self.stats[:top]:
+            lines.append(str(stat))
+        return '\n'.join(lines)
+
+
+_NOT_FOLLOWED = (type, type(sys), type(len), type(lambda: None))
+
+
+def deep_sizeof(obj, seen=None):
+    """
+    returns the size in bytes of an object plus everything reachable from it,
+    such as container contents & instance attributes, counting each object once
+
+    Classes, modules & functions aren't followed. Uses gc.get_referents, which
+    unlike touching __dict__ doesn't create instance dicts as a side effect. Pass the same seen set across calls
+    to size several objects without counting what they share more than once.
+
+    >>> from amara3.contrib.mem_check import deep_sizeof
+    >>> deep_sizeof(['spam', 'spam']) == deep_sizeof(['spam'] * 2)
+    True
+    """
+    seen = set() if seen is None else seen
+    total = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, _NOT_FOLLOWED):
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        stack.extend(gc.get_referents(o))
+    return total
+
+
+def sizeof_report(container):
+    """
+    returns a dict breaking down the memory of an IRI container, such as an
+    iridict or list of iriref, for comparing representations
+
+    container - shallow size of the container itself
+    keys, values - deep sizes of the dict keys & values (for lists etc. the items
+        are counted under values)
+    total - deep size of the lot
+    items - number of items
+    per_item - total / items
+    """
+    if isinstance(container, dict):
+        keys, values = container.keys(), container.values()
+    else:
+        keys, values = (), container
+    seen = set()
+    keysize = sum(deep_sizeof(k, seen) for k in keys)
+    valuesize = sum(deep_sizeof(v, seen) for v in values)
+    #Whatever's left, with the items already counted
+    shallow = deep_sizeof(container, seen)
+    total = shallow + keysize + valuesize
+    count = len(container)
+    return {
+        'container': shallow,
+        'keys': keysize,
+        'values': valuesize,
+        'total': total,
+        'items': count,
+        'per_item': total / count if count else 0.0,
+    }
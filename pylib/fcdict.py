@@ -0,0 +1,287 @@
+# amara3.fcdict
+"""
+On-disk, front-coded dictionary mapping IRIs to integer IDs & back, for sets of
+IRIs too large to hold in a Python dict (after the Plain Front Coding used for
+the dictionaries of HDT, http://www.rdfhdt.org/)
+
+>>> from amara3.fcdict import build_fcdict, fcdict
+>>> build_fcdict(['http://example.org/b', 'HTTP://example.org/a', 'http://example.org/%7ec'], '/tmp/iris.fcd')
+3
+>>> d = fcdict('/tmp/iris.fcd')
+>>> d.id_of('http://example.org/b')
+1
+>>> d[2]
+'http://example.org/~c'
+
+IRIs are normalized as for iridict keys, sorted & deduplicated, then stored
+in blocks of block_size. The first IRI of each block is stored whole and each
+of the rest as the length of the prefix it shares with the one before, plus
+the remaining suffix. IDs are positions in sorted order, from 0.
+
+IRI => ID is a binary search over the first IRIs of the blocks, then a scan
+within one block, so O(log n). ID => IRI decodes at most block_size entries
+of one block, so O(1) for a given block size. The file is memory-mapped, so
+processes opening the same dictionary share its pages.
+"""
+
+import sys
+import mmap
+import heapq
+import struct
+import tempfile
+
+from amara3.irihelper import normalize_key
+
+__all__ = ['fcdict', 'build_fcdict', 'DEFAULT_BLOCK_SIZE', 'DEFAULT_RUN_SIZE']
+
+DEFAULT_BLOCK_SIZE = 16
+#Distinct IRIs sorted in memory at a time by build_fcdict, before spilling to disk
+DEFAULT_RUN_SIZE = 1000000
+
+#File header: magic, byte order flag, IRI count, block size, data size
+MAGIC = b'AFCDICT1'
+_HEADER = struct.Struct('<8sQQQQ')
+_BYTE_ORDER = 1 if sys.byteorder == 'little' else 2
+
+
+def _varint(n):
+    #LEB128: 7 bits per byte, low first, high bit set on all but the last
+    if n < 0x80:
+        return bytes((n,))
+    out = bytearray()
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def _read_varint(buf, pos):
+    b = buf[pos]
+    if b < 0x80:
+        return b, pos + 1
+    n = shift = 0
+    while b >= 0x80:
+        n |= (b & 0x7f) << shift
+        shift += 7
+        pos += 1
+        b = buf[pos]
+    return n | (b << shift), pos + 1
+
+
+def _shared_prefix(a, b):
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def _spill(keys, tmpdir):
+    fp = tempfile.TemporaryFile(dir=tmpdir)
+    for key in sorted(keys):
+        fp.write(key + b'\n')
+    fp.seek(0)
+    return fp
+
+
+def build_fcdict(iris, path, block_size=DEFAULT_BLOCK_SIZE, normalize=True, run_size=DEFAULT_RUN_SIZE, tmpdir=None):
+    '''
+    Write a front-coded dictionary of the given IRIs to path, returning the
+    number of distinct IRIs stored
+
+    iris - iterable of IRIs (str), in any order, duplicates allowed. It's
+        consumed once, as a stream
+    block_size - IRIs per block. Larger blocks make the file smaller and ID
+        lookups slower
+    normalize - normalize IRIs as for iridict keys. If false, they're stored as is
+    run_size - distinct IRIs sorted in memory at a time. Beyond that, sorted runs
+        are spilled to temporary files (in tmpdir) and merged, so memory use
+        is bounded by run_size rather than by the number of IRIs
+    '''
+    runs = []
+    chunk = set()
+    for iri_ref in iris:
+        key = (normalize_key(iri_ref) if normalize else iri_ref).encode('utf-8')
+        if b'\n' in key:
+            raise ValueError('Invalid IRI (contains a line break): {0!r}'.format(iri_ref))
+        chunk.add(key)
+        if len(chunk) >= run_size:
+            runs.append(_spill(chunk, tmpdir))
+            chunk = set()
+    if runs:
+        if chunk:
+            runs.append(_spill(chunk, tmpdir))
+        del chunk
+        keys = heapq.merge(*[ (line[:-1] for line in run) for run in runs ])
+    else:
+        keys = sorted(chunk)
+
+    count = pos = 0
+    prev = None
+    blocks = tempfile.TemporaryFile(dir=tmpdir)
+    try:
+        with open(path, 'wb') as fp:
+            fp.write(_HEADER.pack(MAGIC, _BYTE_ORDER, 0, block_size, 0))
+            for key in keys:
+                if key == prev:
+                    #Duplicates across runs
+                    continue
+                if count % block_size:
+                    shared = _shared_prefix(prev, key)
+                    entry = _varint(shared) + _varint(len(key) - shared) + key[shared:]
+                else:
+                    blocks.write(struct.pack('Q', pos))
+                    entry = _varint(len(key)) + key
+                fp.write(entry)
+                pos += len(entry)
+                count += 1
+                prev = key
+            #End of the last block
+            blocks.write(struct.pack('Q', pos))
+            #Align the block offsets for casting a memoryview over them
+            fp.write(b'\0' * (-pos % 8))
+            blocks.seek(0)
+            while True:
+                data = blocks.read(1 << 20)
+                if not data:
+                    break
+                fp.write(data)
+            fp.seek(0)
+            fp.write(_HEADER.pack(MAGIC, _BYTE_ORDER, count, block_size, pos))
+    finally:
+        blocks.close()
+        for run in runs:
+            run.close()
+    return count
+
+
+class fcdict(object):
+    '''
+    Read-only view of a dictionary written by build_fcdict, memory-mapped
+
+    path - the dictionary file
+    normalize - normalize IRIs looked up as for iridict keys. Should match the
+        setting used to build the dictionary
+
+    Indexing by ID gives the IRI (str). Iteration gives all IRIs in ID order.
+    '''
+    def __init__(self, path, normalize=True):
+        self.path = path
+        self.normalize = normalize
+        with open(path, 'rb') as fp:
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, order, count, block_size, data_size = _HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError('Not a front-coded IRI dictionary: {0}'.format(path))
+        if order != _BYTE_ORDER:
+            self._mmap.close()
+            raise ValueError('Dictionary written with a different byte order: {0}'.format(path))
+        self.count = count
+        self.block_size = block_size
+        nblocks = -(-count // block_size)
+        #Entries are read by slicing the mmap itself, which gives bytes directly
+        self._base = _HEADER.size
+        start = _HEADER.size + data_size + (-data_size % 8)
+        view = memoryview(self._mmap)
+        self._blocks = view[start:start + 8 * (nblocks + 1)].cast('Q')
+        self._nblocks = nblocks
+        view.release()
+
+    def __len__(self):
+        return self.count
+
+    def _head(self, block):
+        data = self._mmap
+        length, pos = _read_varint(data, self._base + self._blocks[block])
+        return data[pos:pos + length]
+
+    def _entries(self, block):
+        '''
+        Yield the IRIs (UTF-8 bytes) of a block in order
+        '''
+        data = self._mmap
+        pos = self._base + self._blocks[block]
+        end = self._base + self._blocks[block + 1]
+        length, pos = _read_varint(data, pos)
+        key = data[pos:pos + length]
+        pos += length
+        yield key
+        while pos < end:
+            shared, pos = _read_varint(data, pos)
+            length, pos = _read_varint(data, pos)
+            key = key[:shared] + data[pos:pos + length]
+            pos += length
+            yield key
+
+    def id_of(self, iri_ref):
+        '''
+        The ID of an IRI. Raises KeyError if it's not in the dictionary
+        '''
+        key = (normalize_key(iri_ref) if self.normalize else iri_ref).encode('utf-8')
+        #Find the last block whose first IRI is <= key
+        lo, hi = 0, self._nblocks
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._head(mid) <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        block = lo - 1
+        if block >= 0:
+            for i, entry in enumerate(self._entries(block)):
+                if entry >= key:
+                    if entry == key:
+                        return block * self.block_size + i
+                    break
+        raise KeyError(iri_ref)
+
+    def get(self, iri_ref, default=None):
+        '''
+        The ID of an IRI, or default if it's not in the dictionary
+        '''
+        try:
+            return self.id_of(iri_ref)
+        except KeyError:
+            return default
+
+    def __contains__(self, iri_ref):
+        return self.get(iri_ref) is not None
+
+    def iri_of(self, ident):
+        '''
+        The IRI with the given ID. Raises IndexError if there's none
+        '''
+        if ident < 0:
+            ident += self.count
+        if not 0 <= ident < self.count:
+            raise IndexError('IRI ID out of range: {0}'.format(ident))
+        block, offset = divmod(ident, self.block_size)
+        for i, entry in enumerate(self._entries(block)):
+            if i == offset:
+                return entry.decode('utf-8')
+
+    __getitem__ = iri_of
+
+    def __iter__(self):
+        for block in range(self._nblocks):
+            for entry in self._entries(block):
+                yield entry.decode('utf-8')
+
+    def close(self):
+        '''
+        Unmap the file
+        '''
+        if self._mmap is not None:
+            self._blocks.release()
+            self._mmap.close()
+            self._mmap = None
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
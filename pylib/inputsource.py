@@ -5,9 +5,16 @@ Utilities for managing data inputs for Amara
 Copyright 2008-2015 Uche Ogbuji
 """
 
+import os
+import mmap
+import tarfile
 import zipfile
+import itertools
 import functools
+import threading
 from enum import Enum
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from io import StringIO, BytesIO
 
 from amara3 import iri
@@ -20,40 +27,167 @@ class inputsourcetype(Enum):
     iri = 3
     filename = 4
     zipfilestream = 5
+    tarfilestream = 6
 
 
-def factory(obj, defaultsourcetype=inputsourcetype.unknown, encoding=None, streamopenmode='rb', zipcheck=False):
+#Default cap on the number of sources a lazyinputsources keeps open at once
+DEFAULT_MAX_OPEN = 128
+
+
+def factory(obj, defaultsourcetype=inputsourcetype.unknown, encoding=None, streamopenmode='rb', zipcheck=False, use_mmap=False,
+            max_open=DEFAULT_MAX_OPEN, prefetch=0, cache=None, rewriter=None):
     '''
     Helper function to create an iterable of inputsources from compound sources such as a zip file
     Returns an iterable of input sources
 
-    obj - object, possibly list or tuple of items to be converted into one or more inputsource
+    obj - object, possibly list or tuple of items to be converted into one or more inputsource.
+        A list or tuple yields a lazyinputsources, which only opens each source as
+        it's reached (see lazyinputsources for max_open & prefetch)
+    zipcheck - if True and obj is a rewindable stream, check whether it's a zip or tar
+        archive, and if so return an iterator over its members. Use archivesource
+        directly for random access to members or to process them in parallel
+    use_mmap - passed on to each inputsource created from a file name (see inputsource)
+    cache, rewriter - passed on to each inputsource created from an IRI (see inputsource)
     '''
     if isinstance(obj, inputsource):
         return obj
-    _inputsource = functools.partial(inputsource, encoding=encoding, streamopenmode=streamopenmode)
+    _inputsource = functools.partial(inputsource, encoding=encoding, streamopenmode=streamopenmode, use_mmap=use_mmap,
+                                     cache=cache, rewriter=rewriter)
     if isinstance(obj, tuple) or isinstance(obj, list):
-        inputsources = [ _inputsource(o, sourcetype=defaultsourcetype) for o in obj ]
+        inputsources = lazyinputsources(obj, functools.partial(_inputsource, sourcetype=defaultsourcetype),
+                                        max_open=max_open, prefetch=prefetch)
     #if isinstance(objs, str) or isinstance(objs, bytes) or isinstance(objs, bytearray):
     #Don't do a zipcheck unless we know we can rewind the obj
     #Because zipfile.is_zipfile fast forwards to EOF
     elif zipcheck and hasattr(obj, 'seek'):
         inputsources = []
-        if zipfile.is_zipfile(obj):
-            def zipfilegen():
-                zf = zipfile.ZipFile(obj, 'r') #Mode must be r, w or a
-                for info in zf.infolist():
-                    #From the doc: Note If the ZipFile was created by passing in a file-like object as the first argument to the constructor, then the object returned by open() shares the ZipFile’s file pointer. Under these circumstances, the object returned by open() should not be used after any additional operations are performed on the ZipFile object.
-                    yield(_inputsource(zf.open(info, mode='r')))
-            inputsources = zipfilegen()
-        else:
+        try:
+            #Covers tar (optionally compressed) as well as zip
+            archive = archivesource(obj)
+        except ValueError:
             #Because zipfile.is_zipfile fast forwards to EOF
             obj.seek(0, 0)
+        else:
+            #Members are read out independently of any shared file pointer, so each
+            #yielded inputsource remains usable whatever else is done with the archive
+            inputsources = iter(archive)
     else:
         inputsources = [_inputsource(obj)]
     return inputsources
 
 
+class lazyinputsources(object):
+    '''
+    Sequence of inputsources over a list of source objects (file names, IRIs, strings,
+    streams), each opened only when reached, by iteration or by index
+
+    objs - list or tuple of objects from which to create inputsources
+    opener - callable creating an inputsource from one of objs
+    max_open - cap on the number of sources this object keeps open. Once reached,
+        the least recently reached source is closed to make room for the next.
+        Sources created from caller-provided streams don't count, and are never
+        closed here. None for no cap
+    prefetch - number of upcoming sources to open ahead of time in a background
+        thread, e.g. to overlap network latency for IRIs with processing. Capped
+        at max_open - 1
+
+    Use as a context manager (or call close()) to deterministically close whatever
+    is still open.
+
+    >>> from amara3.inputsource import factory
+    >>> with factory(['abc', 'def']) as inpl:
+    ...     [ inp.stream.read() for inp in inpl ]
+    ...
+    ['abc', 'def']
+
+    Note: don't hold on to an inputsource beyond the max_open most recently reached,
+    as its stream might be closed from under you.
+    '''
+    def __init__(self, objs, opener, max_open=DEFAULT_MAX_OPEN, prefetch=0):
+        self._objs = objs
+        self._opener = opener
+        self._max_open = max_open
+        self._prefetch = min(prefetch, max_open - 1) if max_open else prefetch
+        #Index of each open source we own => source, least recently reached first
+        self._open = OrderedDict()
+        #Index => Future for sources being opened ahead of time
+        self._pending = {}
+        self._executor = None
+
+    def _owned(self, index):
+        #Only sources opened from something other than a stream are ours to close
+        return not hasattr(self._objs[index], 'read')
+
+    def _get(self, index):
+        if index in self._open:
+            self._open.move_to_end(index)
+            return self._open[index]
+        fut = self._pending.pop(index, None)
+        inp = fut.result() if fut else self._opener(self._objs[index])
+        if self._owned(index):
+            self._open[index] = inp
+            self._evict()
+        return inp
+
+    def _evict(self):
+        if not self._max_open: return
+        while self._open and len(self._open) + len(self._pending) > self._max_open:
+            _, inp = self._open.popitem(last=False)
+            inp.close()
+
+    def _schedule(self, start):
+        if not self._prefetch: return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        for index in range(start, min(start + self._prefetch, len(self._objs))):
+            if index not in self._open and index not in self._pending and self._owned(index):
+                self._pending[index] = self._executor.submit(self._opener, self._objs[index])
+
+    def __len__(self):
+        return len(self._objs)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [ self[i] for i in range(*index.indices(len(self._objs))) ]
+        if index < 0:
+            index += len(self._objs)
+        if not 0 <= index < len(self._objs):
+            raise IndexError('inputsource index out of range')
+        return self._get(index)
+
+    def __iter__(self):
+        #Each iteration starts over from the first source, as for a list
+        for index in range(len(self._objs)):
+            self._schedule(index + 1)
+            yield self._get(index)
+
+    def close(self):
+        '''
+        Close every source still held open, including any opened ahead of time
+        '''
+        pending, self._pending = self._pending, {}
+        for fut in pending.values():
+            if not fut.cancel():
+                try:
+                    fut.result().close()
+                except Exception:
+                    pass
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        opened, self._open = self._open, OrderedDict()
+        for inp in opened.values():
+            inp.close()
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
 class inputsource(object):
     '''
     A flexible class for managing input sources for e.g. XML processing
@@ -61,12 +195,24 @@ class inputsource(object):
     Loosely based on Amara's old inputsource <https://github.com/zepheira/amara/blob/master/lib/lib/_inputsource.py>
     '''
     def __init__(self, obj, siri=None, encoding=None, streamopenmode='rb',
-                    sourcetype=inputsourcetype.unknown):
+                    sourcetype=inputsourcetype.unknown, use_mmap=False, cache=None, rewriter=None):
         '''
         obj - byte string, proper string (only if you really know what you're doing),
             file-like object (stream), file path or URI.
         uri - optional override URI.  Base URI for the input source will be set to
             this value
+        use_mmap - if True, and obj is opened as a file name in a binary mode, memory-map
+            the file rather than opening a buffered stream. The stream is then the mmap
+            object (which supports read, readline, seek, etc.) and inp.buffer is a
+            zero-copy, read-only memoryview over the whole file content. Empty files,
+            pipes & anything else that can't be mapped silently fall back to the
+            usual buffered stream, in which case inp.buffer is None
+        cache - optional cache for the content of remote IRIs, such as
+            amara3.iricache.diskcache. Anything with an open(iri) method returning
+            a binary stream will do
+        rewriter - optional callable mapping an IRI to the one to actually open, such
+            as an amara3.irirewrite.rewriter redirecting to local mirrors. inp.iri
+            remains the IRI as given, for use as the base IRI
 
         >>> from amara3 import inputsource
         >>> inp = inputsource('abc')
@@ -96,6 +242,7 @@ class inputsource(object):
         # b'<?xml version="1.0" encoding="UTF-8"?>\r\n<collection xmlns="http://www.loc.gov/MARC21/slim">\r\n  <reco'
 
         self.stream = None
+        self.buffer = None
         self.iri = siri
         self.sourcetype = sourcetype
 
@@ -112,11 +259,14 @@ class inputsource(object):
             #uri = uri or uuid4().urn
         elif self.sourcetype == inputsourcetype.iri or (siri and iri.matches_uri_syntax(obj)):
             self.iri = siri or obj
-            self.stream = urlopen(iri)
+            target = rewriter(self.iri) if rewriter is not None else self.iri
+            self.stream = cache.open(target) if cache is not None else urlopen(target)
         elif self.sourcetype == inputsourcetype.filename or (siri and iri.is_absolute(obj) and not os.path.isfile(obj)):
             #FIXME: convert path to URI
             self.iri = siri or iri.os_path_to_uri(obj)
             self.stream = open(obj, streamopenmode)
+            if use_mmap and 'b' in streamopenmode:
+                self._mmap_stream()
         elif self.sourcetype == inputsourcetype.string or isinstance(obj, str) or isinstance(obj, bytes):
             self.stream = StringIO(obj)
             #If obj is beyond a certain length, don't even try it as a URI
@@ -127,6 +277,44 @@ class inputsource(object):
             raise ValueError("Unable to recognize as an inputsource")
         return
 
+    def _mmap_stream(self):
+        '''
+        Swap the opened file stream for a read-only memory map of the same file,
+        leaving it in place if the OS won't map it
+        '''
+        try:
+            mapped = mmap.mmap(self.stream.fileno(), 0, access=mmap.ACCESS_READ)
+        #ValueError for an empty file. OSError for pipes, character devices & such
+        except (ValueError, OSError):
+            return
+        #The map holds its own reference to the file, so we can let go of ours
+        self.stream.close()
+        self.stream = mapped
+        self.buffer = memoryview(mapped)
+        return
+
+    def close(self):
+        '''
+        Release the underlying stream (and memory map, if any)
+        '''
+        if self.buffer is not None:
+            self.buffer.release()
+            self.buffer = None
+        if self.stream is not None and hasattr(self.stream, 'close'):
+            try:
+                self.stream.close()
+            #Slices of the mapped buffer are still alive elsewhere; leave the map to the GC
+            except BufferError:
+                pass
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
     @staticmethod
     def text(obj, siri=None, encoding=None):
         '''
@@ -137,3 +325,221 @@ class inputsource(object):
         (e.g. could be mistaken for filenames or IRIs)
         '''
         return inputsource(obj, siri, encoding, sourcetype=inputsourcetype.string)
+
+
+#Leading bytes of the formats archivesource reads: zip (a local file header, or the
+#end record of an empty archive), gzip, bz2, xz & legacy lzma
+_ARCHIVE_MAGIC = (b'PK\x03\x04', b'PK\x05\x06', b'\x1f\x8b', b'BZh', b'\xfd7zXZ\x00', b'\x5d\x00\x00')
+#Uncompressed (ustar) tar has its magic in the first header block instead
+_TAR_MAGIC_OFFSET = 257
+
+
+def _looks_like_archive(head):
+    '''
+    Whether bytes from the start of a stream (at least 262 of them, if there
+    are that many) could begin a zip or tar archive
+    '''
+    return head.startswith(_ARCHIVE_MAGIC) or head[_TAR_MAGIC_OFFSET:_TAR_MAGIC_OFFSET + 5] == b'ustar'
+
+
+def _archive_kind(src):
+    '''
+    Return 'zip' or 'tar' according to the archive format of src (a file path or a
+    seekable binary stream), or None if it's neither
+    '''
+    if zipfile.is_zipfile(src):
+        return 'zip'
+    if not isinstance(src, str):
+        src.seek(0, 0)
+    try:
+        #Mode 'r:*' sniffs gzip, bz2 & lzma compression
+        tf = tarfile.open(src, 'r:*') if isinstance(src, str) else tarfile.open(fileobj=src, mode='r:*')
+    except (tarfile.TarError, OSError):
+        return None
+    tf.close()
+    return 'tar'
+
+
+class archivesource(object):
+    '''
+    Random-access view over the members of a zip or tar (optionally gzip, bz2 or xz
+    compressed) archive, each of which can be had as an inputsource
+
+    The member index is built once, on construction. Every thread reading members
+    gets its own handle on the archive, so members can be decompressed in parallel
+    (zlib & friends release the GIL while they work) and no inputsource shares a file
+    pointer with any other.
+
+    obj - path to the archive file, or a seekable binary stream. If the stream has
+        the name of a regular file, that file is reopened for each handle, otherwise
+        the stream content is read into memory once and shared by all handles (as
+        long as it starts like a zip or tar archive)
+
+    >>> from amara3.inputsource import archivesource
+    >>> arc = archivesource('test/resource/speggs.zip')
+    >>> arc.names()
+    ['eggs.txt', 'spam.txt']
+    >>> arc['spam.txt'].stream.read()
+    b'monty\\n'
+    >>> sorted(arc.map(lambda inp: len(inp.stream.read())))
+    [('eggs.txt', 7), ('spam.txt', 6)]
+    >>> arc.close()
+
+    Note: tar archives don't support seeking within compressed content, so each
+    random access to a member of a compressed tar decompresses from the start of the
+    archive. map() hands out members in index order, which keeps each worker
+    moving forward, but for heavy random access prefer zip or uncompressed tar.
+    '''
+    def __init__(self, obj):
+        self._path = None
+        self._data = None
+        if isinstance(obj, str):
+            self._path = obj
+        elif hasattr(obj, 'read'):
+            name = getattr(obj, 'name', None)
+            if isinstance(name, str) and os.path.isfile(name):
+                self._path = name
+            else:
+                #Check the magic bytes before reading the whole stream into memory
+                obj.seek(0, 0)
+                head = obj.read(_TAR_MAGIC_OFFSET + 5)
+                obj.seek(0, 0)
+                if not _looks_like_archive(head):
+                    raise ValueError("Not a zip or tar archive")
+                #bytes are immutable, so one copy can back every handle
+                self._data = obj.read()
+        else:
+            raise ValueError("Unable to recognize as an archive source")
+        self.kind = _archive_kind(self._path or BytesIO(self._data))
+        if self.kind is None:
+            raise ValueError("Not a zip or tar archive")
+        self.sourcetype = inputsourcetype.zipfilestream if self.kind == 'zip' else inputsourcetype.tarfilestream
+        self._local = threading.local()
+        self._handles = []
+        self._lock = threading.Lock()
+        handle = self._handle()
+        if self.kind == 'zip':
+            self._index = { info.filename: info for info in handle.infolist() if not info.is_dir() }
+        else:
+            self._index = { info.name: info for info in handle.getmembers() if info.isfile() }
+        return
+
+    def _open(self):
+        src = self._path or BytesIO(self._data)
+        if self.kind == 'zip':
+            return zipfile.ZipFile(src, 'r')
+        elif self._path:
+            return tarfile.open(src, 'r:*')
+        else:
+            return tarfile.open(fileobj=src, mode='r:*')
+
+    def _handle(self):
+        '''
+        Return the archive handle belonging to the current thread, opening it if need be
+        '''
+        handle = getattr(self._local, 'handle', None)
+        if handle is None:
+            handle = self._local.handle = self._open()
+            with self._lock:
+                self._handles.append((threading.current_thread(), handle))
+        return handle
+
+    def _reap(self):
+        '''
+        Close handles left behind by threads which have since finished
+        '''
+        with self._lock:
+            dead = [ (t, h) for (t, h) in self._handles if not t.is_alive() ]
+            self._handles = [ (t, h) for (t, h) in self._handles if t.is_alive() ]
+        for _, handle in dead:
+            handle.close()
+        return
+
+    def names(self):
+        '''
+        List of member names, in archive order
+        '''
+        return list(self._index)
+
+    def read(self, name):
+        '''
+        Return the full, decompressed content of the named member as bytes
+        '''
+        info = self._index[name]
+        if self.kind == 'zip':
+            return self._handle().read(info)
+        else:
+            #The member info can come from any handle on the same archive
+            with self._handle().extractfile(info) as fp:
+                return fp.read()
+
+    def map(self, func, names=None, workers=None, ordered=False):
+        '''
+        Apply func to the inputsource of each member using a pool of worker threads,
+        each with its own archive handle. Generates (name, result) pairs as each
+        finishes, or in the order of names if ordered is True
+
+        func - callable taking an inputsource
+        names - iterable of member names to process, by default all of them
+        workers - number of worker threads, by default the number of CPUs
+
+        At most twice as many members as there are workers are in flight at a
+        time, so memory use stays bounded even for very large archives.
+        '''
+        names = iter(self._index if names is None else names)
+        workers = workers or os.cpu_count() or 1
+        def task(name):
+            return name, func(self[name])
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        pending = deque(executor.submit(task, name) for name in itertools.islice(names, workers*2))
+        try:
+            while pending:
+                if ordered:
+                    done = [pending.popleft()]
+                else:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        pending.remove(fut)
+                for fut in done:
+                    yield fut.result()
+                    for name in itertools.islice(names, 1):
+                        pending.append(executor.submit(task, name))
+        finally:
+            #Don't keep working on behalf of a consumer who stopped listening
+            for fut in pending:
+                fut.cancel()
+            executor.shutdown(wait=True)
+            #The worker threads are gone now, and so should their handles be
+            self._reap()
+
+    def close(self):
+        '''
+        Close all handles on the archive, across all threads
+        '''
+        with self._lock:
+            handles, self._handles = self._handles, []
+        for _, handle in handles:
+            handle.close()
+        self._local = threading.local()
+        return
+
+    def __getitem__(self, name):
+        return inputsource(BytesIO(self.read(name)), sourcetype=self.sourcetype)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        for name in self._index:
+            yield self[name]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -0,0 +1,157 @@
+# amara3.instrument
+"""
+Opt-in call counters & timers for the public functions of amara3.iri,
+amara3.irihelper & amara3.inputsource
+
+>>> from amara3 import instrument, iri
+>>> instrument.enable()
+>>> iri.absolutize('a/b', 'http://example.org/')
+'http://example.org/a/b'
+>>> [ f['name'] for f in instrument.report(top=1) ]
+['amara3.iri.absolutize']
+>>> instrument.disable()
+
+Or set the environment variable AMARA3_INSTRUMENT=1 to enable on import of amara3.iri.
+
+Enabling swaps timing wrappers into the module namespaces, and disabling puts the
+original functions back, so when off there's no wrapper at all. Calls between the
+functions of a module (e.g. absolutize calling split_uri_ref) go through the module
+globals, so they're counted too. Names bound elsewhere before enable(), as by
+"from amara3.iri import absolutize", keep pointing at the originals.
+
+Times are inclusive of calls to other instrumented functions. Counts are kept
+without locking, so under heavy contention from threads a few may be lost.
+"""
+
+import os
+import sys
+import inspect
+from time import perf_counter
+from functools import wraps
+
+from amara3.util import latency_histogram
+
+__all__ = ['enable', 'disable', 'enabled', 'reset', 'report', 'DEFAULT_MODULES']
+
+DEFAULT_MODULES = ('amara3.iri', 'amara3.irihelper', 'amara3.inputsource')
+
+#Module name => {function name: original function}
+_originals = {}
+#Qualified function name => funcstats
+_stats = {}
+
+
+class funcstats(object):
+    '''
+    Counters for one instrumented function
+    '''
+    __slots__ = ('name', 'calls', 'total', 'histogram')
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.total = 0.0
+        self.histogram = latency_histogram(low=1e-7, high=10.0)
+
+
+def _public_functions(module):
+    for name, obj in list(vars(module).items()):
+        #Only functions defined in the module itself, not classes or imports
+        if not name.startswith('_') and inspect.isfunction(obj) and obj.__module__ == module.__name__:
+            yield name, obj
+
+
+def _wrap(func, stats, sample_every):
+    @wraps(func)
+    def timed(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = perf_counter() - start
+            stats.calls += 1
+            stats.total += elapsed
+            if not stats.calls % sample_every:
+                stats.histogram.record(elapsed)
+    timed.__wrapped__ = func
+    return timed
+
+
+def enable(modules=DEFAULT_MODULES, sample_every=8):
+    '''
+    Start counting calls to the public functions of the given modules
+
+    modules - names of modules to instrument
+    sample_every - record the latency of one call in this many in the histogram.
+        Counts & cumulative times cover every call
+    '''
+    for modname in modules:
+        if modname in _originals:
+            continue
+        __import__(modname)
+        module = sys.modules[modname]
+        originals = _originals[modname] = {}
+        for name, func in _public_functions(module):
+            qname = modname + '.' + name
+            stats = _stats.get(qname)
+            if stats is None:
+                stats = _stats[qname] = funcstats(qname)
+            originals[name] = func
+            setattr(module, name, _wrap(func, stats, sample_every))
+    return
+
+
+def disable():
+    '''
+    Put the original functions back. Collected counts are kept until reset()
+    '''
+    while _originals:
+        modname, originals = _originals.popitem()
+        module = sys.modules[modname]
+        for name, func in originals.items():
+            setattr(module, name, func)
+    return
+
+
+def enabled():
+    '''
+    Whether any modules are currently instrumented
+    '''
+    return bool(_originals)
+
+
+def reset():
+    '''
+    Discard collected counts
+    '''
+    #Cleared in place, since wrappers hold on to their funcstats
+    for stats in _stats.values():
+        stats.__init__(stats.name)
+    return
+
+
+def report(top=10, sort='total', percentiles=(50, 99)):
+    '''
+    Return a list of dicts for the top functions, each with name, calls, total &
+    mean seconds, plus estimated latency percentiles (pNN keys) from the sampled calls
+
+    sort - 'total' for cumulative time or 'calls' for call count
+    '''
+    key = (lambda s: s.total) if sort == 'total' else (lambda s: s.calls)
+    hot = sorted((s for s in _stats.values() if s.calls), key=key, reverse=True)
+    result = []
+    for stats in hot[:top]:
+        item = {
+            'name': stats.name,
+            'calls': stats.calls,
+            'total': stats.total,
+            'mean': stats.total / stats.calls,
+        }
+        for pct in percentiles:
+            item['p{0}'.format(pct)] = stats.histogram.percentile(pct) if stats.histogram.count else None
+        result.append(item)
+    return result
+
+
+if os.environ.get('AMARA3_INSTRUMENT', '').lower() not in ('', '0', 'false', 'no'):
+    enable()
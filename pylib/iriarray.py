@@ -0,0 +1,380 @@
+# amara3.iriarray
+"""
+Compact, columnar storage for large numbers of IRIs
+
+>>> from amara3.iriarray import IriArray
+>>> arr = IriArray(['http://example.org/a?x=1#top', 'urn:isbn:0451450523'])
+>>> arr[0]
+'http://example.org/a?x=1#top'
+>>> bytes(arr.component(0, 'authority'))
+b'example.org'
+>>> arr.component(1, 'authority') is None
+True
+>>> arr.save('/tmp/iris.bin')
+>>> IriArray.load('/tmp/iris.bin')[1]
+'urn:isbn:0451450523'
+
+All IRIs live in one UTF-8 buffer, with an array('Q') of offsets into it and five
+uint32 component boundaries per IRI, worked out once on the way in, so there's no
+per-IRI Python object until one is asked for. Components come back as memoryviews
+of the buffer. A saved array is loaded with mmap and used in place, without parsing.
+
+The same layout can be published to shared memory (see publish() & attach()), so
+the processes of a pool all read one copy of a large IRI table.
+"""
+
+import re
+import sys
+import mmap
+import struct
+import threading
+from array import array
+from multiprocessing import shared_memory, resource_tracker
+
+__all__ = ['IriArray', 'COMPONENTS', 'publish', 'attach', 'shared_iri_table']
+
+COMPONENTS = ('scheme', 'authority', 'path', 'query', 'fragment')
+
+#File header: magic, byte order flag, count, buffer size
+MAGIC = b'AIRIARR1'
+_HEADER = struct.Struct('<8sQQQ')
+_BYTE_ORDER = 1 if sys.byteorder == 'little' else 2
+
+#Boundary value for an absent component
+_NONE = 0xFFFFFFFF
+#Boundaries stored per IRI, relative to its start: end of scheme, start of
+#authority, start of path, end of path, end of query
+_FIELDS = 5
+
+#Serializes the stand-in for resource_tracker.register used by attach()
+_attach_lock = threading.Lock()
+
+#The split_uri_ref regex, applied to UTF-8 bytes to get byte offsets directly.
+#All its delimiters are ASCII, so it splits just as it would the string.
+#With DOTALL it matches anything, even (invalid) IRIs with line breaks
+_SPLIT_PATTERN = re.compile(
+    rb"^(?:(?P<scheme>[^:/?#]+):)?(?://(?P<authority>[^/?#]*))?(?P<path>[^?#]*)(?:\?(?P<query>[^#]*))?(?:#(?P<fragment>.*))?$",
+    re.DOTALL)
+
+
+def _boundaries(data):
+    '''
+    Component boundaries of one UTF-8 encoded IRI reference
+    '''
+    if len(data) >= _NONE:
+        raise ValueError('IRI too long for IriArray: {0} bytes'.format(len(data)))
+    m = _SPLIT_PATTERN.match(data)
+    scheme_end = m.end('scheme') if m.start('scheme') >= 0 else _NONE
+    auth_start = m.start('authority') if m.start('authority') >= 0 else _NONE
+    query_end = m.end('query') if m.start('query') >= 0 else _NONE
+    return (scheme_end, auth_start, m.start('path'), m.end('path'), query_end)
+
+
+class IriArray(object):
+    '''
+    Sequence of IRI references, as str, stored compactly
+
+    iris - optional iterable of IRI references (str) to start with
+
+    Indexing gives str (decoded on each access). Slicing with step 1 gives
+    another IriArray sharing the same buffer, without copying the IRIs.
+    Use component() for a memoryview of one component, or None if absent.
+    Arrays built in memory can be added to with append() & extend(), though
+    not while slices or memoryviews from component() are still alive (the buffer can't
+    be resized under them, so BufferError is raised). Loaded arrays are read-only.
+    '''
+    def __init__(self, iris=None):
+        self._buffer = bytearray()
+        self._offsets = array('Q', [0])
+        self._bounds = array('I')
+        self._mmap = None
+        if iris is not None:
+            self.extend(iris)
+
+    @classmethod
+    def _from_parts(cls, buffer, offsets, bounds, mm=None):
+        self = cls.__new__(cls)
+        self._buffer = buffer
+        self._offsets = offsets
+        self._bounds = bounds
+        self._mmap = mm
+        return self
+
+    def append(self, iri_ref):
+        '''
+        Add an IRI reference (str) to the end
+        '''
+        if not isinstance(self._buffer, bytearray):
+            raise TypeError('IriArray is read-only')
+        data = iri_ref.encode('utf-8')
+        self._bounds.extend(_boundaries(data))
+        self._buffer += data
+        self._offsets.append(len(self._buffer))
+        return
+
+    def extend(self, iris):
+        '''
+        Add IRI references (str) to the end
+        '''
+        if not isinstance(self._buffer, bytearray):
+            raise TypeError('IriArray is read-only')
+        buf = self._buffer
+        offsets_append = self._offsets.append
+        bounds_extend = self._bounds.extend
+        for iri_ref in iris:
+            data = iri_ref.encode('utf-8')
+            bounds_extend(_boundaries(data))
+            buf += data
+            offsets_append(len(buf))
+        return
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def _index(self, i):
+        n = len(self._offsets) - 1
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError('IriArray index out of range')
+        return i
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return IriArray(self[j] for j in range(start, stop, step))
+            stop = max(start, stop)
+            return IriArray._from_parts(memoryview(self._buffer), self._offsets[start:stop + 1],
+                                        self._bounds[start * _FIELDS:stop * _FIELDS])
+        i = self._index(i)
+        return str(self._buffer[self._offsets[i]:self._offsets[i + 1]], 'utf-8')
+
+    def __iter__(self):
+        buf = memoryview(self._buffer)
+        offsets = self._offsets
+        try:
+            for i in range(len(offsets) - 1):
+                yield str(buf[offsets[i]:offsets[i + 1]], 'utf-8')
+        finally:
+            buf.release()
+
+    def __contains__(self, iri_ref):
+        return any(i == iri_ref for i in self)
+
+    def __repr__(self):
+        return '<IriArray of {0} IRIs>'.format(len(self))
+
+    def raw(self, i):
+        '''
+        The UTF-8 bytes of an IRI reference, as a memoryview
+        '''
+        i = self._index(i)
+        return memoryview(self._buffer)[self._offsets[i]:self._offsets[i + 1]]
+
+    def span(self, i, name):
+        '''
+        (start, end) byte offsets within the IRI reference of the named component
+        (one of COMPONENTS), or None if it's absent
+        '''
+        i = self._index(i)
+        b = self._bounds[i * _FIELDS:(i + 1) * _FIELDS]
+        if name == 'path':
+            return b[2], b[3]
+        elif name == 'scheme':
+            return None if b[0] == _NONE else (0, b[0])
+        elif name == 'authority':
+            return None if b[1] == _NONE else (b[1], b[2])
+        elif name == 'query':
+            return None if b[4] == _NONE else (b[3] + 1, b[4])
+        elif name == 'fragment':
+            length = self._offsets[i + 1] - self._offsets[i]
+            frag_start = b[3] if b[4] == _NONE else b[4]
+            return None if frag_start >= length else (frag_start + 1, length)
+        raise ValueError('Unknown IRI component: {0}'.format(name))
+
+    def component(self, i, name):
+        '''
+        The named component (one of COMPONENTS) of an IRI reference, as a
+        memoryview of its UTF-8 bytes, or None if it's absent
+        '''
+        span = self.span(i, name)
+        if span is None:
+            return None
+        base = self._offsets[self._index(i)]
+        return memoryview(self._buffer)[base + span[0]:base + span[1]]
+
+    def split(self, i):
+        '''
+        The components of an IRI reference, as split_uri_ref would give them (str or None)
+        '''
+        data = self.raw(i)
+        try:
+            return tuple(None if s is None else str(data[s[0]:s[1]], 'utf-8')
+                         for s in (self.span(i, name) for name in COMPONENTS))
+        finally:
+            data.release()
+
+    def _chunks(self):
+        #Header, offsets (from 0), boundaries & IRIs, as saved or published
+        start = self._offsets[0]
+        offsets = self._offsets
+        if start:
+            offsets = array('Q', (o - start for o in offsets))
+        return (_HEADER.pack(MAGIC, _BYTE_ORDER, len(self), offsets[-1]),
+                memoryview(offsets).cast('B'), memoryview(self._bounds).cast('B'),
+                memoryview(self._buffer)[start:self._offsets[-1]])
+
+    def save(self, path):
+        '''
+        Write the array to a file, for use with load()
+        '''
+        with open(path, 'wb') as fp:
+            for chunk in self._chunks():
+                fp.write(chunk)
+        return
+
+    @classmethod
+    def _from_buffer(cls, buf, source, owner=None):
+        magic, order, count, size = _HEADER.unpack_from(buf)
+        if magic != MAGIC:
+            raise ValueError('Not a saved IriArray: {0}'.format(source))
+        if order != _BYTE_ORDER:
+            raise ValueError('IriArray saved with a different byte order: {0}'.format(source))
+        view = memoryview(buf)
+        pos = _HEADER.size
+        offsets = view[pos:pos + 8 * (count + 1)].cast('Q')
+        pos += 8 * (count + 1)
+        bounds = view[pos:pos + 4 * _FIELDS * count].cast('I')
+        pos += 4 * _FIELDS * count
+        result = cls._from_parts(view[pos:pos + size], offsets, bounds, owner)
+        view.release()
+        return result
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Map an array saved with save() into memory, read-only. Nothing is parsed;
+        offsets, boundaries & IRIs are all used in place. Call close() (or use
+        the array as a context manager) to unmap it
+        '''
+        with open(path, 'rb') as fp:
+            mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls._from_buffer(mm, path, mm)
+        except ValueError:
+            mm.close()
+            raise
+
+    def close(self):
+        '''
+        Release a loaded or attached array's memory. Views obtained from it must be released first
+        '''
+        if not isinstance(self._buffer, bytearray):
+            for part in (self._offsets, self._bounds, self._buffer):
+                if isinstance(part, memoryview):
+                    part.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class shared_iri_table(object):
+    '''
+    An IriArray in a multiprocessing.shared_memory block, as returned by
+    publish() & attach(). The array is in the attribute array, and the name
+    by which other processes attach in name
+    '''
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.name = shm.name
+        self.owner = owner
+        self.array = IriArray._from_buffer(shm.buf, shm.name)
+
+    def close(self):
+        '''
+        Detach from the shared memory. Views obtained from the array must be released first
+        '''
+        if self.array is not None:
+            self.array.close()
+            self.array = None
+            self.shm.close()
+        return
+
+    def unlink(self):
+        '''
+        Free the shared memory, once all processes have closed it
+        '''
+        self.shm.unlink()
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        #The publisher frees the block when done with it
+        self.close()
+        if self.owner:
+            self.unlink()
+        return False
+
+
+def publish(iris, name=None):
+    '''
+    Copy IRIs (an IriArray, or any iterable of str) into a new block of shared
+    memory, in the layout of IriArray.save(), returning a shared_iri_table.
+    Pass its name to worker processes, which call attach() to read the IRIs in
+    place, rather than each being sent a pickled copy
+
+    >>> from amara3.iriarray import publish, attach
+    >>> with publish(['http://example.org/a', 'http://example.org/b']) as table:
+    ...     #As a worker process would, given table.name
+    ...     with attach(table.name) as shared:
+    ...         shared.array[1]
+    ...
+    'http://example.org/b'
+    '''
+    arr = iris if isinstance(iris, IriArray) else IriArray(iris)
+    chunks = arr._chunks()
+    shm = shared_memory.SharedMemory(name=name, create=True, size=sum(len(c) for c in chunks))
+    pos = 0
+    for chunk in chunks:
+        shm.buf[pos:pos + len(chunk)] = chunk
+        pos += len(chunk)
+        if isinstance(chunk, memoryview):
+            chunk.release()
+    return shared_iri_table(shm, owner=True)
+
+
+def attach(name):
+    '''
+    Attach to IRIs published by publish() (in this or another process), returning
+    a shared_iri_table. Its array reads the shared memory in place: indexing
+    decodes one IRI, and raw() & component() give memoryviews without copying
+    '''
+    try:
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        #Before Python 3.13 attaching also registers the block with the resource
+        #tracker, which would free it when this process exits. Unregistering after
+        #the fact won't do: fork workers share the publisher's tracker, so that would
+        #drop the publisher's own registration. Skip registering it instead
+        with _attach_lock:
+            register = resource_tracker.register
+            def register_others(rname, rtype):
+                if rtype != 'shared_memory' or rname.lstrip('/') != name.lstrip('/'):
+                    register(rname, rtype)
+            resource_tracker.register = register_others
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+            finally:
+                resource_tracker.register = register
+    return shared_iri_table(shm, owner=False)
@@ -0,0 +1,250 @@
+# amara3.iricache
+"""
+On-disk cache for the content of remote IRIs, with HTTP conditional revalidation
+
+Plug an instance into inputsource (or factory) via the cache parameter:
+
+>>> from amara3.inputsource import inputsource, inputsourcetype
+>>> from amara3.iricache import diskcache
+>>> cache = diskcache('/tmp/amara3-cache', max_size=64*1024*1024)
+>>> inp = inputsource('http://example.org/', sourcetype=inputsourcetype.iri, cache=cache)
+
+Anything with an open(iri) method returning a binary stream can serve as a cache.
+"""
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+
+from amara3 import iri
+
+__all__ = ['cache_key', 'diskcache']
+
+
+def cache_key(iri_ref):
+    '''
+    Normalized form of an IRI for use as a cache key, so that RFC 3986 equivalent
+    IRIs share an entry. The fragment is dropped, since it's never sent to the server
+
+    >>> from amara3.iricache import cache_key
+    >>> cache_key('HTTP://Example.ORG/a/./b/%7euser#frag')
+    'http://example.org/a/b/~user'
+    '''
+    key = iri.normalize_percent_encoding(iri.strip_fragment(iri_ref))
+    key = iri.normalize_case(key, doHost=True)
+    return iri.normalize_path_segments_in_uri(key)
+
+
+def _parse_http_date(value):
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def _freshness(headers, default_ttl, now):
+    '''
+    Compute the expiry time for a response from its headers, following RFC 7234
+    for Cache-Control max-age & no-cache, then Expires. Returns None if the response
+    must not be stored at all
+    '''
+    directives = {}
+    for part in (headers.get('Cache-Control') or '').split(','):
+        name, _, value = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"')
+    if 'no-store' in directives:
+        return None
+    if 'no-cache' in directives:
+        return now
+    if 'max-age' in directives:
+        try:
+            return now + int(directives['max-age'])
+        except ValueError:
+            return now
+    expires = headers.get('Expires')
+    if expires:
+        expiry = _parse_http_date(expires)
+        date = _parse_http_date(headers.get('Date')) or now
+        #Invalid Expires values such as "0" mean already expired
+        return now + (expiry - date) if expiry is not None else now
+    return now + default_ttl
+
+
+class diskcache(object):
+    '''
+    Cache of IRI content stored in a local directory, one body file & one JSON
+    metadata file per entry, keyed by a hash of the normalized IRI
+
+    directory - where to keep the cache. Created if need be. Entries already there
+        are picked up, so a cache persists across runs & can be shared by processes
+        (though the size budget is only enforced by each process for its own writes)
+    max_size - budget in bytes for all stored bodies. Least recently used entries
+        are evicted to stay within it. Bodies larger than the budget aren't stored
+    default_ttl - seconds for which a response with no freshness information
+        (Cache-Control max-age or Expires) is served without revalidation.
+        The default of 0 means always revalidate such responses
+    opener - callable to use in place of urllib.request.urlopen, which must accept
+        a urllib.request.Request and raise HTTPError for a 304
+
+    Fresh hits are served from disk without touching the network. Stale entries are
+    revalidated with If-None-Match and/or If-Modified-Since, based on the stored
+    ETag and Last-Modified, and a 304 response refreshes them in place.
+
+    Counts of the outcomes are kept in the attributes hits, revalidated & misses.
+    '''
+    def __init__(self, directory, max_size=256*1024*1024, default_ttl=0, opener=None):
+        self.directory = directory
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self._urlopen = opener or urlopen
+        self._lock = threading.RLock()
+        #Key digest => body size, least recently used first
+        self._index = OrderedDict()
+        self.size = 0
+        self.hits = self.revalidated = self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _paths(self, digest):
+        base = os.path.join(self.directory, digest)
+        return base + '.body', base + '.meta'
+
+    def _load_index(self):
+        entries = []
+        for fname in os.listdir(self.directory):
+            if not fname.endswith('.body'): continue
+            try:
+                stat = os.stat(os.path.join(self.directory, fname))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, fname[:-5], stat.st_size))
+        #Body files are touched on every hit, so mtime order is LRU order
+        for _, digest, size in sorted(entries):
+            self._index[digest] = size
+            self.size += size
+        return
+
+    def _read_meta(self, digest):
+        try:
+            with open(self._paths(digest)[1]) as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, digest, meta):
+        #Write then rename, so readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(meta, fp)
+        os.replace(tmp, self._paths(digest)[1])
+
+    def _touch(self, digest):
+        try:
+            os.utime(self._paths(digest)[0])
+        except OSError:
+            pass
+        with self._lock:
+            if digest in self._index:
+                self._index.move_to_end(digest)
+
+    def _store(self, digest, meta, body):
+        bodypath, _ = self._paths(digest)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(body)
+        os.replace(tmp, bodypath)
+        self._write_meta(digest, meta)
+        with self._lock:
+            self.size += len(body) - self._index.pop(digest, 0)
+            self._index[digest] = len(body)
+            self._evict()
+
+    def _evict(self):
+        #The newest entry is last, so it's never the one evicted
+        while self.size > self.max_size and len(self._index) > 1:
+            digest, size = self._index.popitem(last=False)
+            self.size -= size
+            for path in self._paths(digest):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return
+
+    def remove(self, iri_ref):
+        '''
+        Drop any entry for the given IRI
+        '''
+        digest = hashlib.sha256(cache_key(iri_ref).encode('utf-8')).hexdigest()
+        with self._lock:
+            self.size -= self._index.pop(digest, 0)
+        for path in self._paths(digest):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return
+
+    def open(self, iri_ref):
+        '''
+        Return a binary stream with the content of the given IRI, from the cache
+        if possible, otherwise from the network (storing the result)
+        '''
+        digest = hashlib.sha256(cache_key(iri_ref).encode('utf-8')).hexdigest()
+        bodypath, _ = self._paths(digest)
+        now = time.time()
+        meta = self._read_meta(digest) if digest in self._index else None
+        if meta is not None and meta['expires'] > now:
+            try:
+                stream = open(bodypath, 'rb')
+            except OSError:
+                meta = None
+            else:
+                self._touch(digest)
+                self.hits += 1
+                return stream
+
+        req = Request(iri_ref)
+        if meta is not None:
+            if meta.get('etag'):
+                req.add_header('If-None-Match', meta['etag'])
+            if meta.get('last_modified'):
+                req.add_header('If-Modified-Since', meta['last_modified'])
+        try:
+            resp = self._urlopen(req)
+        except HTTPError as e:
+            if e.code != 304 or meta is None:
+                raise
+            expires = _freshness(e.headers, self.default_ttl, now)
+            meta['expires'] = now if expires is None else expires
+            meta['etag'] = e.headers.get('ETag') or meta.get('etag')
+            meta['last_modified'] = e.headers.get('Last-Modified') or meta.get('last_modified')
+            self._write_meta(digest, meta)
+            self._touch(digest)
+            self.revalidated += 1
+            return open(bodypath, 'rb')
+
+        with resp:
+            body = resp.read()
+            headers = resp.headers
+        self.misses += 1
+        expires = _freshness(headers, self.default_ttl, now)
+        if expires is not None and len(body) <= self.max_size:
+            meta = {
+                'iri': iri_ref,
+                'expires': expires,
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'content_type': headers.get('Content-Type'),
+            }
+            self._store(digest, meta, body)
+        return BytesIO(body)
@@ -8,9 +8,7 @@ import urllib, urllib.request
 import email
 from email.utils import formatdate as _formatdate
 
-__all__ = ['iriref', 'iridict', 'codex']
-
-from . import iri
+__all__ = ['iriref', 'iridict', 'codex', 'normalize_key', 'NormalizedIri']
 
 class iriref(str):
     '''
@@ -31,6 +29,10 @@ class iriref(str):
         # optionally do stuff to self here
         return self
 
+    def __reduce__(self):
+        # Checked when first made, so not again on unpickling
+        return (_unpickle_iriref, (self.__class__, str(self)))
+
     def __repr__(self):
         return u'I(' + str(self) + ')'
 
@@ -48,6 +50,11 @@ class iriref(str):
 I = iriref
 
 
+def _unpickle_iriref(cls, value):
+    #Skips the syntax check. A module function, so pickles refer to it just once
+    return str.__new__(cls, value)
+
+
 class codex:
     '''
     Proposed helper IRI stem registry for speeding up IRI comparisons
@@ -74,6 +81,19 @@ class codex:
     pass
 
 
+def normalize_key(key):
+    """
+    Normal form of an IRI as used for keys by iridict (and the on-disk
+    dictionaries built on the same semantics): case & percent-encoding
+    normalized, and file://localhost/ taken as file:///
+    """
+    key = iri.normalize_case(iri.normalize_percent_encoding(key))
+    if key[:17] == 'file://localhost/':
+        return 'file://' + key[16:]
+    else:
+        return key
+
+
 # FIXME: Port to use UserDict
 class iridict(dict):
     """
@@ -98,26 +118,22 @@ class iridict(dict):
     #
     #FIXME: make localhost the default for all schemes, not just file
     def _normalizekey(self, key):
-        key = normalize_case(normalize_percent_encoding(key))
-        if key[:17] == 'file://localhost/':
-            return 'file://' + key[16:]
-        else:
-            return key
+        return normalize_key(key)
 
     def __getitem__(self, key):
-        return super(uridict, self).__getitem__(self._normalizekey(key))
+        return super(iridict, self).__getitem__(self._normalizekey(key))
 
     def __setitem__(self, key, value):
-        return super(uridict, self).__setitem__(self._normalizekey(key), value)
+        return super(iridict, self).__setitem__(self._normalizekey(key), value)
 
     def __delitem__(self, key):
-        return super(uridict, self).__delitem__(self._normalizekey(key))
+        return super(iridict, self).__delitem__(self._normalizekey(key))
 
     def has_key(self, key):
-        return super(uridict, self).has_key(self._normalizekey(key))
+        return self.__contains__(key)
 
     def __contains__(self, key):
-        return super(uridict, self).__contains__(self._normalizekey(key))
+        return super(iridict, self).__contains__(self._normalizekey(key))
 
     def __iter__(self):
         return iter(self.keys())
@@ -127,6 +143,78 @@ class iridict(dict):
         for key in self.iterkeys():
             yield key, self.__getitem__(key)
 
+#Name from earlier Amara versions
+uridict = iridict
+
+
+class NormalizedIri(object):
+    """
+    IRI reference value which compares & hashes by its RFC 3986 normal form
+    (as from amara3.iri.normalize), so equivalent IRIs are interchangeable as
+    set members & dict keys, without normalizing up front
+
+    >>> from amara3.irihelper import NormalizedIri
+    >>> NormalizedIri('HTTP://Example.org:80/%7ex') == NormalizedIri('http://example.org/~x')
+    True
+    >>> str(NormalizedIri('HTTP://Example.org:80/%7ex'))
+    'HTTP://Example.org:80/%7ex'
+
+    The original text is kept as given (str() returns it). The normal form and
+    its hash are computed on first use and stored. Instances are slotted, with
+    no __dict__. Unlike iriref, this isn't a str subclass: a str's equality & hash
+    can't be made to agree with IRI equivalence. It's never equal to a plain str.
+    """
+    __slots__ = ('text', '_canonical', '_hash')
+
+    def __init__(self, text):
+        self.text = text
+        self._canonical = None
+        self._hash = None
+
+    @property
+    def canonical(self):
+        '''
+        The normal form of the IRI reference
+        '''
+        canonical = self._canonical
+        if canonical is None:
+            canonical = iri.normalize(self.text)
+            #Share the original string when it's already normal
+            if canonical == self.text:
+                canonical = self.text
+            self._canonical = canonical
+        return canonical
+
+    def __eq__(self, other):
+        if not isinstance(other, NormalizedIri):
+            return NotImplemented
+        # Identical text is equivalent without normalizing either
+        return self.text == other.text or self.canonical == other.canonical
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __lt__(self, other):
+        if not isinstance(other, NormalizedIri):
+            return NotImplemented
+        return self.canonical < other.canonical
+
+    def __hash__(self):
+        h = self._hash
+        if h is None:
+            h = self._hash = hash(self.canonical)
+        return h
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return 'NormalizedIri({0!r})'.format(self.text)
+
+    def __reduce__(self):
+        return (NormalizedIri, (self.text,))
+
 
 #FIXME: Port to more amara.lib.iri functions
 def get_filename_from_url(url):
@@ -140,3 +228,7 @@ def get_filename_parts_from_url(url):
     if t[1]:
         t[1] = t[1][1:]
     return t
+
+
+#Imported last, since amara3.iri in turn imports I from this module
+from . import iri
@@ -0,0 +1,209 @@
+# amara3.irirewrite
+r"""
+Rewrite IRIs by rule, e.g. to redirect remote vocabularies & schemas to local mirrors
+
+>>> import re
+>>> from amara3.irirewrite import rewriter
+>>> rw = rewriter([
+...     ('http://purl.org/dc/', 'file:///srv/mirror/dc/'),
+...     (re.compile(r'https?://schemas\.example\.com/(\w+)/v(\d+)/'), r'file:///srv/mirror/\1-\2/'),
+... ])
+>>> rw('http://purl.org/dc/terms/')
+'file:///srv/mirror/dc/terms/'
+>>> rw('https://schemas.example.com/book/v2/book.xsd')
+'file:///srv/mirror/book-2/book.xsd'
+>>> rw('http://example.org/')
+'http://example.org/'
+
+Pass a rewriter to inputsource (or factory) to have it applied to IRIs before
+they're opened.
+"""
+
+import re
+try:
+    from re import _parser as _sre_parse
+except ImportError:
+    #Before Python 3.11
+    try:
+        import sre_parse as _sre_parse
+    except ImportError:
+        _sre_parse = None
+
+__all__ = ['rewriter']
+
+#Key in a trie node for the replacement of the prefix ending there
+_END = ''
+
+
+#Most literal starts indexed for one pattern rule, e.g. 2 for r'https?://'
+MAX_LITERAL_STARTS = 16
+
+
+def _extend_starts(items, starts):
+    #Extend the literal starts by parsed regex items, for as long as they're
+    #literal or simple choices among literals. Also says whether all were used
+    for op, arg in items:
+        if op is _sre_parse.LITERAL:
+            starts = [ s + chr(arg) for s in starts ]
+            continue
+        if op is _sre_parse.IN:
+            if (all(o is _sre_parse.LITERAL for o, _ in arg)
+                    and len(starts) * len(arg) <= MAX_LITERAL_STARTS):
+                starts = [ s + chr(c) for s in starts for _, c in arg ]
+                continue
+        elif op is _sre_parse.SUBPATTERN:
+            add_flags, sub = arg[1], arg[-1]
+            if not add_flags & re.IGNORECASE:
+                extended, done = _extend_starts(sub, starts)
+                if done:
+                    starts = extended
+                    continue
+                return extended, False
+        elif op in (_sre_parse.MAX_REPEAT, _sre_parse.MIN_REPEAT) and arg[:2] == (0, 1):
+            #Optional, as in s?
+            extended, done = _extend_starts(arg[2], starts)
+            if done and len(starts) + len(extended) <= MAX_LITERAL_STARTS:
+                starts = starts + extended
+                continue
+        elif op is _sre_parse.BRANCH:
+            choices = []
+            for sub in arg[1]:
+                extended, done = _extend_starts(sub, starts)
+                if not done:
+                    break
+                choices.extend(extended)
+            else:
+                if len(choices) <= MAX_LITERAL_STARTS:
+                    starts = choices
+                    continue
+        return starts, False
+    return starts, True
+
+
+def _literal_starts(pattern):
+    '''
+    Literal texts (maybe just the empty string) one of which every match of a
+    compiled regex must start with
+    '''
+    #The parser & its output are CPython internals, which can change. If they
+    #don't look as expected, the rule is just tried for every IRI
+    try:
+        parsed = _sre_parse.parse(pattern.pattern, pattern.flags)
+        if parsed.state.flags & re.IGNORECASE:
+            return ['']
+        return sorted(set(_extend_starts(parsed, [''])[0]))
+    except Exception:
+        return ['']
+
+
+class rewriter(object):
+    '''
+    Set of IRI rewrite rules, each a (pattern, replacement) pair
+
+    A string pattern is a prefix rule: an IRI starting with it has that prefix
+    replaced. Prefix rules live in a character trie, so finding the longest
+    matching prefix takes time in proportion to the length of the IRI, however
+    many rules there are.
+
+    A compiled regex pattern is matched at the start of the IRI, and the part
+    it matches is replaced by the replacement template, expanded as for re.sub.
+    Pattern rules are indexed in a second trie by the literal text their regex
+    starts with (e.g. 'http://' & 'https://' for r'https?://'), so only the
+    few rules whose literal start the IRI has are actually matched.
+
+    Prefix rules take precedence, then pattern rules in the order given.
+    '''
+    def __init__(self, rules=None):
+        self._trie = {}
+        self._patterns = []
+        #Trie of the literal starts of pattern rules, with lists of rule numbers at _END
+        self._pattern_trie = {}
+        self.prefix_count = 0
+        for pattern, replacement in (rules or ()):
+            if isinstance(pattern, str):
+                self.add_prefix(pattern, replacement)
+            else:
+                self.add_pattern(pattern, replacement)
+
+    def add_prefix(self, prefix, replacement):
+        '''
+        Add a rule replacing the given prefix. Replaces any existing rule for the same prefix
+        '''
+        if not prefix:
+            raise ValueError('Empty prefix rule')
+        node = self._trie
+        for c in prefix:
+            node = node.setdefault(c, {})
+        if _END not in node:
+            self.prefix_count += 1
+        node[_END] = replacement
+        return
+
+    def add_pattern(self, pattern, replacement):
+        '''
+        Add a rule for a regex (string or compiled) matched at the start of IRIs
+        '''
+        if isinstance(pattern, str):
+            pattern = re.compile(pattern)
+        for start in _literal_starts(pattern):
+            node = self._pattern_trie
+            for c in start:
+                node = node.setdefault(c, {})
+            node.setdefault(_END, []).append(len(self._patterns))
+        self._patterns.append((pattern, replacement))
+        return
+
+    def _candidates(self, iri_ref):
+        #Numbers of the pattern rules whose literal start the IRI has, in order
+        node = self._pattern_trie
+        found = node.get(_END)
+        found = list(found) if found else []
+        for c in iri_ref:
+            node = node.get(c)
+            if node is None:
+                break
+            if _END in node:
+                found.extend(node[_END])
+        #A rule with starts such as 'http' & 'https' can be found twice
+        return sorted(set(found))
+
+    def _match_prefix(self, iri_ref):
+        node = self._trie
+        found = None
+        for i, c in enumerate(iri_ref):
+            node = node.get(c)
+            if node is None:
+                break
+            if _END in node:
+                found = (i + 1, node[_END])
+        return found
+
+    def rewrite(self, iri_ref):
+        '''
+        Return the IRI as rewritten by the first applicable rule, or unchanged
+        '''
+        if self._trie:
+            found = self._match_prefix(iri_ref)
+            if found is not None:
+                end, replacement = found
+                return replacement + iri_ref[end:]
+        if self._patterns:
+            patterns = self._patterns
+            for i in self._candidates(iri_ref):
+                pattern, replacement = patterns[i]
+                m = pattern.match(iri_ref)
+                if m is not None:
+                    return m.expand(replacement) + iri_ref[m.end():]
+        return iri_ref
+
+    __call__ = rewrite
+
+    def rewrite_many(self, iris):
+        '''
+        Rewrite a sequence of IRIs, returning a list
+        '''
+        rewrite = self.rewrite
+        return [ rewrite(i) for i in iris ]
+
+    def __len__(self):
+        return self.prefix_count + len(self._patterns)
@@ -0,0 +1,343 @@
+# amara3.mmapdict
+"""
+Persistent iridict: an IRI-keyed mapping kept on disk & memory-mapped, which
+many processes can open at once
+
+>>> from amara3.mmapdict import mmapdict
+>>> d = mmapdict('/tmp/labels')
+>>> d['http://spam/%7ex/'] = 'x'
+>>> d['HTTP://spam/~x/']
+'x'
+>>> d.close()
+
+Keys follow the RFC 3986 equivalence rules of irihelper.iridict. Two files are
+used: path + '.dat', to which records (key & pickled value) are only ever
+appended, and path + '.idx', an open-addressing hash table of slots, each the
+64-bit blake2b fingerprint of a normalized key & the offset of its latest record.
+A lookup hashes the key, probes the table, then compares the key stored in the
+record, so fingerprint collisions never give a wrong answer.
+
+Writers (in any process) take an exclusive lock on the data file for each change,
+so writes are serialized. Readers take no lock: a record is complete before the
+slot pointing at it is set, and the slot offset is set last. When the table is
+grown it's rewritten to a new file which replaces the old, and a generation count
+in the data file header tells other processes to map the new one.
+
+Locking uses fcntl, so where that's missing (Windows) only one process at a
+time should write.
+"""
+
+import os
+import sys
+import mmap
+import pickle
+import struct
+import hashlib
+from collections.abc import MutableMapping
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from amara3.irihelper import normalize_key
+
+__all__ = ['mmapdict', 'fingerprint', 'DEFAULT_SLOTS']
+
+#Initial number of hash table slots, a power of 2
+DEFAULT_SLOTS = 1 << 16
+#Table is grown when occupied (including deleted) slots exceed this share
+MAX_LOAD = 0.7
+
+#Data file header: magic, index generation, end of the last complete record
+DATA_MAGIC = b'AMMDDAT1'
+_DATA_HEADER = struct.Struct('<8sQQ')
+#Index file header: magic, byte order flag, slots, live entries, occupied slots
+INDEX_MAGIC = b'AMMDIDX1'
+_INDEX_HEADER = struct.Struct('<8sQQQQ')
+_RECORD_HEADER = struct.Struct('<II')
+_BYTE_ORDER = 1 if sys.byteorder == 'little' else 2
+
+#Slot offsets. Real records always come after the data file header
+_EMPTY = 0
+_DELETED = 1
+
+
+def fingerprint(key):
+    '''
+    64-bit fingerprint of a normalized key, as UTF-8 bytes
+    '''
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+class _lock(object):
+    def __init__(self, fd):
+        self.fd = fd
+
+    def __enter__(self):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        return False
+
+
+class mmapdict(MutableMapping):
+    '''
+    Mapping of IRIs to picklable values, stored in files path.dat & path.idx,
+    which are created if need be
+
+    readonly - open for lookups only
+    slots - initial hash table size, for a new dictionary (rounded up to a power of 2).
+        Set it to about twice the expected number of entries to avoid regrowing
+    dumps, loads - value serializers, pickle by default. Only open files from
+        trusted sources with pickle
+
+    Iteration gives the normalized keys. Replacing or deleting entries leaves
+    the old records in the data file; compact() writes a fresh copy without them.
+    '''
+    def __init__(self, path, readonly=False, slots=DEFAULT_SLOTS, dumps=pickle.dumps, loads=pickle.loads):
+        self.path = path
+        self.readonly = readonly
+        self._dumps = dumps
+        self._loads = loads
+        self._datapath = path + '.dat'
+        self._indexpath = path + '.idx'
+        self._fd = os.open(self._datapath, os.O_RDONLY if readonly else (os.O_RDWR | os.O_CREAT), 0o666)
+        self._data = self._index = self._slots = None
+        if not readonly:
+            with _lock(self._fd):
+                if os.fstat(self._fd).st_size == 0:
+                    os.write(self._fd, _DATA_HEADER.pack(DATA_MAGIC, 0, _DATA_HEADER.size))
+                    self._write_index(self._indexpath, 1 << max(3, (slots - 1).bit_length()), ())
+        self._map_data()
+        if self._data[:8] != DATA_MAGIC:
+            self.close()
+            raise ValueError('Not an mmapdict data file: {0}'.format(self._datapath))
+        self._map_index()
+
+    #Mapping of the files
+
+    def _map_data(self):
+        if self._data is not None:
+            self._data.close()
+        self._data = mmap.mmap(self._fd, 0, access=mmap.ACCESS_READ)
+
+    def _map_index(self):
+        #The old mapping isn't closed here, since iterations may still be walking it.
+        #It goes away with the last reference to it
+        self._generation = _DATA_HEADER.unpack_from(self._data)[1]
+        with open(self._indexpath, 'rb' if self.readonly else 'r+b') as fp:
+            self._index = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ if self.readonly else mmap.ACCESS_WRITE)
+        magic, order, nslots, _, _ = _INDEX_HEADER.unpack_from(self._index)
+        if magic != INDEX_MAGIC or order != _BYTE_ORDER:
+            raise ValueError('Not an mmapdict index (for this byte order): {0}'.format(self._indexpath))
+        self._mask = nslots - 1
+        self._slots = memoryview(self._index)[_INDEX_HEADER.size:].cast('Q')
+
+    def _refresh(self):
+        #Pick up a table regrown by another process
+        if _DATA_HEADER.unpack_from(self._data)[1] != self._generation:
+            self._map_index()
+
+    def _record(self, offset):
+        if offset + _RECORD_HEADER.size > len(self._data):
+            #Appended to since mapped
+            self._map_data()
+        klen, vlen = _RECORD_HEADER.unpack_from(self._data, offset)
+        start = offset + _RECORD_HEADER.size
+        if start + klen + vlen > len(self._data):
+            self._map_data()
+        return self._data[start:start + klen], start + klen, vlen
+
+    def _find(self, key, fp):
+        '''
+        Slot number holding key, or if absent, the negated (minus 1) number of the slot to insert into
+        '''
+        slots = self._slots
+        mask = self._mask
+        i = fp & mask
+        insert_at = None
+        while True:
+            offset = slots[2 * i + 1]
+            if offset == _EMPTY:
+                return -1 - (i if insert_at is None else insert_at)
+            if offset == _DELETED:
+                if insert_at is None:
+                    insert_at = i
+            elif slots[2 * i] == fp and self._record(offset)[0] == key:
+                return i
+            i = (i + 1) & mask
+
+    def _key(self, key):
+        return normalize_key(key).encode('utf-8')
+
+    #Mapping protocol
+
+    def __getitem__(self, key):
+        self._refresh()
+        nkey = self._key(key)
+        i = self._find(nkey, fingerprint(nkey))
+        if i < 0:
+            raise KeyError(key)
+        _, start, vlen = self._record(self._slots[2 * i + 1])
+        return self._loads(self._data[start:start + vlen])
+
+    def __contains__(self, key):
+        self._refresh()
+        nkey = self._key(key)
+        return self._find(nkey, fingerprint(nkey)) >= 0
+
+    def __len__(self):
+        self._refresh()
+        return _INDEX_HEADER.unpack_from(self._index)[3]
+
+    def __iter__(self):
+        self._refresh()
+        #A view of its own on the table current now, which stays valid even if
+        #the table is regrown (here or in another process) along the way
+        slots = memoryview(self._index)[_INDEX_HEADER.size:].cast('Q')
+        try:
+            for i in range(len(slots) // 2):
+                offset = slots[2 * i + 1]
+                if offset > _DELETED:
+                    yield str(self._record(offset)[0], 'utf-8')
+        finally:
+            slots.release()
+
+    def __setitem__(self, key, value):
+        if self.readonly:
+            raise TypeError('mmapdict opened read-only')
+        nkey = self._key(key)
+        fp = fingerprint(nkey)
+        value = self._dumps(value)
+        record = _RECORD_HEADER.pack(len(nkey), len(value)) + nkey + value
+        with _lock(self._fd):
+            self._refresh()
+            end = _DATA_HEADER.unpack_from(self._data)[2]
+            os.pwrite(self._fd, record, end)
+            os.pwrite(self._fd, struct.pack('<Q', end + len(record)), 16)
+            i = self._find(nkey, fp)
+            _, nslots, live, occupied = _INDEX_HEADER.unpack_from(self._index)[1:]
+            if i >= 0:
+                self._slots[2 * i + 1] = end
+                return
+            i = -1 - i
+            if self._slots[2 * i + 1] == _EMPTY:
+                occupied += 1
+            self._slots[2 * i] = fp
+            self._slots[2 * i + 1] = end
+            struct.pack_into('<QQ', self._index, 24, live + 1, occupied)
+            if occupied > nslots * MAX_LOAD:
+                self._grow(nslots * 2)
+        return
+
+    def __delitem__(self, key):
+        if self.readonly:
+            raise TypeError('mmapdict opened read-only')
+        nkey = self._key(key)
+        with _lock(self._fd):
+            self._refresh()
+            i = self._find(nkey, fingerprint(nkey))
+            if i < 0:
+                raise KeyError(key)
+            self._slots[2 * i + 1] = _DELETED
+            live = _INDEX_HEADER.unpack_from(self._index)[3]
+            struct.pack_into('<Q', self._index, 24, live - 1)
+        return
+
+    #Maintenance
+
+    def _write_index(self, path, nslots, entries):
+        #Build a table in a new file, then swap it in, so readers never see it half done
+        table = memoryview(bytearray(16 * nslots)).cast('Q')
+        mask = nslots - 1
+        count = 0
+        for fp, offset in entries:
+            i = fp & mask
+            while table[2 * i + 1] != _EMPTY:
+                i = (i + 1) & mask
+            table[2 * i] = fp
+            table[2 * i + 1] = offset
+            count += 1
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as fp:
+            fp.write(_INDEX_HEADER.pack(INDEX_MAGIC, _BYTE_ORDER, nslots, count, count))
+            fp.write(table.cast('B'))
+        os.replace(tmp, path)
+        return
+
+    def _live_slots(self):
+        slots = self._slots
+        for i in range(self._mask + 1):
+            if slots[2 * i + 1] > _DELETED:
+                yield slots[2 * i], slots[2 * i + 1]
+
+    def _grow(self, nslots):
+        #Called with the lock held
+        self._write_index(self._indexpath, nslots, self._live_slots())
+        generation = self._generation + 1
+        os.pwrite(self._fd, struct.pack('<Q', generation), 8)
+        self._map_data()
+        self._map_index()
+        return
+
+    def compact(self):
+        '''
+        Rewrite the data file without replaced or deleted records. Other
+        processes must close & reopen the dictionary afterward
+        '''
+        if self.readonly:
+            raise TypeError('mmapdict opened read-only')
+        with _lock(self._fd):
+            self._refresh()
+            tmp = self._datapath + '.tmp'
+            entries = []
+            with open(tmp, 'wb') as out:
+                out.write(_DATA_HEADER.pack(DATA_MAGIC, self._generation + 1, 0))
+                pos = _DATA_HEADER.size
+                for fp, offset in self._live_slots():
+                    key, start, vlen = self._record(offset)
+                    out.write(self._data[offset:start + vlen])
+                    entries.append((fp, pos))
+                    pos += start + vlen - offset
+                out.seek(16)
+                out.write(struct.pack('<Q', pos))
+            nslots = self._mask + 1
+            self._write_index(self._indexpath, nslots, entries)
+            os.replace(tmp, self._datapath)
+            old_fd = self._fd
+            self._fd = os.open(self._datapath, os.O_RDWR)
+            self._map_data()
+            self._map_index()
+        os.close(old_fd)
+        return
+
+    def close(self):
+        '''
+        Unmap & close the files
+        '''
+        if self._slots is not None:
+            self._slots.release()
+            self._slots = None
+        for mm in (self._index, self._data):
+            if mm is not None:
+                try:
+                    mm.close()
+                except BufferError:
+                    #An unfinished iteration still has a view of it
+                    pass
+        self._index = self._data = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,192 @@
+# amara3.pipeline
+"""
+Push-based processing pipelines of coroutines, passing batches (lists) of items
+rather than single items from stage to stage, so the cost of a generator send
+is paid once per batch
+
+Stages are chained by passing each the next one as its target, ending in a sink.
+source pushes an iterable through, then closes the chain, which flushes every
+stage in turn.
+
+>>> from amara3 import pipeline as pl
+>>> results = []
+>>> iris = ['HTTP://Example.ORG/a/./b', 'http://example.org/a/b', 'c/%7ed']
+>>> pl.source(iris, pl.resolve_iris('http://example.org/', pl.normalize_iris(pl.dedupe(pl.collect(results)))))
+>>> results
+['http://example.org/a/b', 'http://example.org/c/~d']
+
+Custom stages follow the same pattern as those here: receive a list with
+(yield), send a (non-empty) list on, and close the target on GeneratorExit.
+"""
+
+from amara3.util import coroutine
+from amara3 import iri
+
+__all__ = [
+    'source', 'map_items', 'filter_items', 'batch', 'dedupe', 'sink', 'collect',
+    'normalize_iris', 'resolve_iris', 'DEFAULT_BATCH_SIZE',
+]
+
+DEFAULT_BATCH_SIZE = 1024
+
+
+def source(iterable, target, batch_size=DEFAULT_BATCH_SIZE):
+    '''
+    Push the items of an iterable into a pipeline in lists of up to batch_size,
+    then close it
+    '''
+    send = target.send
+    chunk = []
+    append = chunk.append
+    try:
+        for item in iterable:
+            append(item)
+            if len(chunk) >= batch_size:
+                send(chunk)
+                chunk = []
+                append = chunk.append
+        if chunk:
+            send(chunk)
+    finally:
+        target.close()
+    return
+
+
+@coroutine
+def map_items(func, target):
+    '''
+    Stage which applies func to each item
+    '''
+    send = target.send
+    try:
+        while True:
+            items = (yield)
+            send(list(map(func, items)))
+    except GeneratorExit:
+        target.close()
+
+
+@coroutine
+def filter_items(pred, target):
+    '''
+    Stage which passes on only the items for which pred returns true
+    '''
+    send = target.send
+    try:
+        while True:
+            items = (yield)
+            kept = list(filter(pred, items))
+            if kept:
+                send(kept)
+    except GeneratorExit:
+        target.close()
+
+
+@coroutine
+def batch(size, target):
+    '''
+    Stage which regroups items into lists of exactly size (except for the last),
+    e.g. to match the batch size a database bulk insert wants
+    '''
+    send = target.send
+    pending = []
+    try:
+        while True:
+            pending.extend((yield))
+            while len(pending) >= size:
+                send(pending[:size])
+                del pending[:size]
+    except GeneratorExit:
+        if pending:
+            send(pending)
+        target.close()
+
+
+@coroutine
+def dedupe(target, key=None, seen=None):
+    '''
+    Stage which drops items already seen, keeping the first occurrence
+
+    key - optional function giving the value to compare, as with sorted()
+    seen - optional set to start from, which could be shared with other pipelines.
+        It grows with the number of distinct items
+    '''
+    send = target.send
+    seen = set() if seen is None else seen
+    add = seen.add
+    try:
+        while True:
+            items = (yield)
+            fresh = []
+            if key is None:
+                for item in items:
+                    if item not in seen:
+                        add(item)
+                        fresh.append(item)
+            else:
+                for item in items:
+                    k = key(item)
+                    if k not in seen:
+                        add(k)
+                        fresh.append(item)
+            if fresh:
+                send(fresh)
+    except GeneratorExit:
+        target.close()
+
+
+@coroutine
+def sink(func):
+    '''
+    Final stage, which calls func with each list of items
+    '''
+    while True:
+        func((yield))
+
+
+def collect(results):
+    '''
+    Final stage which appends all items to the given list
+    '''
+    return sink(results.extend)
+
+
+@coroutine
+def normalize_iris(target, case=True, percent_encoding=True, path_segments=True):
+    '''
+    Stage which applies RFC 3986 syntax-based normalization to IRI references:
+    case (including the host), percent-encoding & dot segments, each of which
+    can be turned off
+    '''
+    send = target.send
+    funcs = []
+    if percent_encoding:
+        funcs.append(iri.normalize_percent_encoding)
+    if case:
+        normalize_case = iri.normalize_case
+        funcs.append(lambda i: normalize_case(i, doHost=True))
+    if path_segments:
+        funcs.append(iri.normalize_path_segments_in_uri)
+    try:
+        while True:
+            items = (yield)
+            for func in funcs:
+                items = list(map(func, items))
+            send(items)
+    except GeneratorExit:
+        target.close()
+
+
+@coroutine
+def resolve_iris(base, target, limit_schemes=None):
+    '''
+    Stage which resolves IRI references against a base IRI
+    '''
+    send = target.send
+    absolutize = iri.absolutize
+    try:
+        while True:
+            items = (yield)
+            send([ absolutize(item, base, limit_schemes) for item in items ])
+    except GeneratorExit:
+        target.close()
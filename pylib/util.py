@@ -5,6 +5,8 @@ Some utilities for general use in Amara
 Copyright 2008-2015 Uche Ogbuji
 """
 
+from math import log10, ceil
+
 def coroutine(func):
     '''
     Decorator: Eliminate the need to call next() to kick-start a co-routine
@@ -64,3 +66,123 @@ def parse_requirement(r):
         return r
 
 
+
+
+class latency_histogram(object):
+    '''
+    Fixed-memory histogram of durations in seconds, with log-spaced buckets, for
+    percentile estimates over arbitrarily many samples
+
+    low, high - range covered by the buckets. Values outside it are still counted,
+        in an underflow or overflow bucket
+    buckets_per_decade - resolution. The default of 10 means each bucket is about
+        26% wider than the previous, which bounds the error of percentile estimates
+
+    >>> from amara3.util import latency_histogram
+    >>> h = latency_histogram()
+    >>> for ms in range(1, 101):
+    ...     h.record(ms/1000)
+    ...
+    >>> h.count, round(h.percentile(50), 3), round(h.percentile(99), 3)
+    (100, 0.05, 0.1)
+    '''
+    __slots__ = ('low', 'high', 'buckets_per_decade', 'counts', 'count', 'total', 'min', 'max', '_log_low')
+
+    def __init__(self, low=1e-5, high=100.0, buckets_per_decade=10):
+        self.low = low
+        self.high = high
+        self.buckets_per_decade = buckets_per_decade
+        self._log_low = log10(low)
+        nbuckets = int(ceil((log10(high) - self._log_low) * buckets_per_decade))
+        #Index 0 is underflow (below low), the last index is overflow (above high)
+        self.counts = [0] * (nbuckets + 2)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        if value <= self.low:
+            return 0
+        index = int((log10(value) - self._log_low) * self.buckets_per_decade) + 1
+        return min(index, len(self.counts) - 1)
+
+    def upper_bound(self, index):
+        '''
+        Upper bound of the given bucket. None for the overflow bucket
+        '''
+        if index >= len(self.counts) - 1:
+            return None
+        return 10 ** (self._log_low + index / self.buckets_per_decade)
+
+    def record(self, value):
+        '''
+        Add one sample
+        '''
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min: self.min = value
+        if self.max is None or value > self.max: self.max = value
+
+    def merge(self, other):
+        '''
+        Add all samples from another histogram with the same bucket layout
+        '''
+        if len(other.counts) != len(self.counts) or other._log_low != self._log_low:
+            raise ValueError('Cannot merge histograms with different bucket layouts')
+        self.counts = [ a + b for a, b in zip(self.counts, other.counts) ]
+        self.count += other.count
+        self.total += other.total
+        for sample in (other.min, other.max):
+            if sample is not None:
+                if self.min is None or sample < self.min: self.min = sample
+                if self.max is None or sample > self.max: self.max = sample
+
+    def percentile(self, pct):
+        '''
+        Estimate of the given percentile (0-100) of the samples, or None if there are none.
+        Interpolates geometrically within the bucket containing the rank
+        '''
+        if not self.count:
+            return None
+        rank = pct / 100 * self.count
+        seen = 0
+        for index, n in enumerate(self.counts):
+            if not n: continue
+            if seen + n >= rank:
+                lower = self.upper_bound(index - 1) if index else self.min
+                upper = self.upper_bound(index)
+                lower = max(lower, self.min)
+                upper = self.max if upper is None else min(upper, self.max)
+                fraction = (rank - seen) / n
+                if lower <= 0:
+                    return lower + (upper - lower) * fraction
+                return lower * (upper / lower) ** fraction
+            seen += n
+        return self.max
+
+    def buckets(self):
+        '''
+        Generate (upper bound, cumulative count) for each bucket, ending with
+        (None, total count) for the overflow bucket, e.g. for Prometheus export
+        '''
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            yield self.upper_bound(index), seen
+
+    def summary(self, percentiles=(50, 90, 99)):
+        '''
+        Dict of count, sum, min, max, mean and the given percentiles (as p50 etc.)
+        '''
+        result = {
+            'count': self.count,
+            'sum': self.total,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.total / self.count if self.count else None,
+        }
+        for pct in percentiles:
+            result['p{}'.format(pct)] = self.percentile(pct)
+        return result
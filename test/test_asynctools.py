@@ -0,0 +1,245 @@
+import pytest
+import io
+import json
+import time
+import socket
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from amara3 import asynctools
+from amara3.asynctools import http_metrics, OTHER_HOST, fetch_many, progress_meter, loop_runner, get_runner, go_async
+
+requires_aiohttp = pytest.mark.skipif(asynctools.aiohttp is None, reason='aiohttp not installed')
+
+
+def test_metrics_summary():
+    m = http_metrics()
+    for t in (0.1, 0.2, 0.3):
+        m.record('example.org', 'ttfb', t)
+    m.count('example.org', 'requests', 3)
+    summary = m.summary()['example.org']
+    assert summary['ttfb']['count'] == 3
+    assert summary['dns']['count'] == 0
+    assert summary['counters']['requests'] == 3
+    assert 0.1 <= summary['ttfb']['p50'] <= 0.3
+    assert json.loads(m.to_json())['example.org']['ttfb']['count'] == 3
+
+
+def test_metrics_bounded_hosts():
+    m = http_metrics(max_hosts=2)
+    for i in range(100):
+        m.record('host{}'.format(i), 'total', 0.01)
+    assert set(m.hosts) == {'host0', 'host1', OTHER_HOST}
+    assert m.summary()[OTHER_HOST]['total']['count'] == 98
+
+
+def test_metrics_prometheus():
+    m = http_metrics()
+    m.record('example.org', 'connect', 0.05)
+    m.count('example.org', 'bytes', 1024)
+    text = m.to_prometheus(prefix='test')
+    lines = text.splitlines()
+    assert '# TYPE test_request_phase_seconds histogram' in lines
+    assert 'test_request_phase_seconds_bucket{host="example.org",phase="connect",le="+Inf"} 1' in lines
+    assert 'test_request_phase_seconds_count{host="example.org",phase="connect"} 1' in lines
+    assert 'test_bytes_total{host="example.org"} 1024' in lines
+
+
+@requires_aiohttp
+def test_req_tracer_requests(faulty_origin):
+    base, state = faulty_origin
+    tracer = asynctools.req_tracer(max_requests=2)
+    async def run():
+        async with asynctools.aiohttp.ClientSession(trace_configs=[tracer.trace_config]) as sess:
+            for reqid in 'abc':
+                async with sess.get(base + '/ok/' + reqid, trace_request_ctx={'reqid': reqid}) as resp:
+                    await resp.read()
+                tracer.finish(reqid)
+            #Concurrent requests sharing a reqid (here the default, None) are each finished
+            resps = await asyncio.gather(*[ sess.get(base + '/ok/same{}'.format(i)) for i in range(2) ])
+            for resp in resps:
+                await resp.read()
+                resp.release()
+            for resp in resps:
+                tracer.finish()
+    asyncio.run(run())
+    assert list(tracer.request) == ['c', None]
+    assert tracer.request['c']['bytes'] == len(b'/ok/c')
+    summary = tracer.metrics.summary()['127.0.0.1']
+    assert summary['counters']['requests'] == 5
+    assert summary['transfer']['count'] == 5
+    assert summary['counters']['bytes'] == len(b'/ok/a') * 3 + len(b'/ok/same0') * 2
+
+
+@pytest.fixture
+def faulty_origin():
+    '''
+    Local HTTP server which injects faults: /flaky/... answers 503 twice before
+    succeeding, /drop/... hangs up twice without answering, /missing is a 404.
+    Every response takes a little while, and the peak number of requests being
+    handled at once is tracked
+    '''
+    state = {'requests': {}, 'active': 0, 'peak': 0}
+    lock = threading.Lock()
+
+    class handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with lock:
+                seen = state['requests'][self.path] = state['requests'].get(self.path, 0) + 1
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+            try:
+                time.sleep(0.02)
+                if self.path.startswith('/drop/') and seen <= 2:
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    return
+                if self.path.startswith('/flaky/') and seen <= 2:
+                    status = 503
+                elif self.path == '/missing':
+                    status = 404
+                else:
+                    status = 200
+                body = self.path.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            finally:
+                with lock:
+                    state['active'] -= 1
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(server.server_address[1]), state
+    server.shutdown()
+    server.server_close()
+
+
+def _fetch_all(iris, **kwargs):
+    async def collect():
+        return [ result async for result in fetch_many(iris, **kwargs) ]
+    return asyncio.run(collect())
+
+
+@requires_aiohttp
+def test_fetch_many_retries(faulty_origin):
+    base, state = faulty_origin
+    tracer = asynctools.req_tracer()
+    iris = [ base + p for p in ('/ok/1', '/flaky/1', '/drop/1', '/missing') ]
+    results = { r.iri: r for r in _fetch_all(iris, backoff=0.01, tracer=tracer) }
+    assert results[base + '/ok/1'].body == b'/ok/1'
+    assert results[base + '/ok/1'].attempts == 1
+    assert results[base + '/flaky/1'].status == 200
+    assert results[base + '/flaky/1'].attempts == 3
+    #aiohttp itself may retry a dropped idempotent request, so only check the outcome
+    assert results[base + '/drop/1'].body == b'/drop/1'
+    assert state['requests']['/drop/1'] == 3
+    #Not a transient error, so no retry
+    assert results[base + '/missing'].status == 404
+    assert results[base + '/missing'].attempts == 1
+    assert state['requests']['/missing'] == 1
+    assert tracer.request[(base + '/flaky/1', 2)]['transfer'] >= 0
+    assert tracer.metrics.summary()['127.0.0.1']['counters']['requests'] >= 6
+
+
+@requires_aiohttp
+def test_fetch_many_gives_up(faulty_origin):
+    base, state = faulty_origin
+    result, = _fetch_all([base + '/flaky/2'], retries=1, backoff=0.01)
+    assert result.status == 503
+    assert result.body is None
+    assert isinstance(result.error, asynctools.aiohttp.ClientResponseError)
+    assert result.attempts == 2
+
+
+@requires_aiohttp
+def test_fetch_many_limits(faulty_origin):
+    base, state = faulty_origin
+    iris = ( base + '/ok/{}'.format(i) for i in range(40) )
+    results = _fetch_all(iris, concurrency=8, per_host=3)
+    assert len(results) == 40
+    assert all( r.status == 200 for r in results )
+    assert state['peak'] <= 3
+
+
+def test_progress_meter_sync():
+    out = io.StringIO()
+    with progress_meter(total=100, interval=0.01, out=out, label='spam') as meter:
+        def work():
+            tally = meter.counter(every=7)
+            for i in range(25):
+                tally.add(1, 10)
+            tally.flush()
+        workers = [ threading.Thread(target=work) for i in range(4) ]
+        for w in workers: w.start()
+        for w in workers: w.join()
+    snap = meter.snapshot()
+    assert (snap['items'], snap['bytes']) == (100, 1000)
+    assert snap['eta'] == 0
+    last = out.getvalue().splitlines()[-1]
+    assert last.startswith('spam | 100/100 (100%) items')
+    assert '1000 B' in last
+    #The clock stops with the meter
+    time.sleep(0.02)
+    assert meter.snapshot()['elapsed'] == snap['elapsed']
+
+
+def test_progress_meter_async():
+    out = io.StringIO()
+    async def run():
+        async with progress_meter(interval=0.01, out=out) as meter:
+            for i in range(5):
+                await asyncio.sleep(0.01)
+                meter.update(2)
+        return meter
+    meter = asyncio.run(run())
+    lines = out.getvalue().splitlines()
+    assert len(lines) >= 2
+    assert lines[-1].startswith('10 items')
+    assert 'ETA' not in lines[-1]
+    assert meter.snapshot()['items_per_s'] > 0
+
+
+async def _double(n):
+    await asyncio.sleep(0.001)
+    return n * 2
+
+
+def test_loop_runner_many_threads():
+    results = {}
+    with loop_runner() as runner:
+        def work(i):
+            results[i] = [ runner.run(_double(i * 10 + j)) for j in range(10) ]
+        threads = [ threading.Thread(target=work, args=(i,)) for i in range(8) ]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        loop = runner.loop
+        assert runner.run(_current_loop()) is loop
+    assert results == { i: [ (i * 10 + j) * 2 for j in range(10) ] for i in range(8) }
+    assert loop.is_closed()
+
+
+async def _current_loop():
+    return asyncio.get_running_loop()
+
+
+def test_loop_runner_reentry():
+    async def nested():
+        return get_runner().run(_double(1))
+    with pytest.raises(RuntimeError):
+        get_runner().run(nested())
+
+
+def test_go_async_repeated():
+    #Repeated calls reuse the one shared loop rather than closing it out from under later calls
+    assert [ go_async(_double(i)) for i in range(5) ] == [0, 2, 4, 6, 8]
+    assert go_async(_current_loop()) is get_runner().loop
+    assert go_async(_current_loop(), close_loop=True) is get_runner().loop
+    #Coroutines run on the runner's thread, not the caller's
+    async def current_thread():
+        return threading.current_thread()
+    assert go_async(current_thread()) is get_runner()._thread
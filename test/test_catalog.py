@@ -0,0 +1,106 @@
+import pytest
+
+from amara3 import iri
+from amara3.catalog import catalog, public_ids_to_urns, urns_to_public_ids
+
+CATALOG = '''<?xml version="1.0"?>
+<catalog xmlns="urn:oasis:names:tc:entity:xmlns:xml:catalog" prefer="public">
+  <public publicId="-//OASIS//DTD  DocBook XML V4.5//EN" uri="dtd/docbookx.dtd"/>
+  <public publicId="-//OASIS//DTD DocBook XML V4.5//EN" uri="ignored.dtd"/>
+  <system systemId="http://example.org/spam.dtd" uri="spam.dtd"/>
+  <rewriteSystem systemIdStartString="http://example.org/dtds/" rewritePrefix="mirror/"/>
+  <rewriteSystem systemIdStartString="http://example.org/dtds/v2/" rewritePrefix="mirror2/"/>
+  <systemSuffix systemIdSuffix="/eggs.dtd" uri="eggs.dtd"/>
+  <uri name="http://example.org/schema.xsd" uri="schema.xsd"/>
+  <rewriteURI uriStartString="http://example.org/xsl/" rewritePrefix="/opt/xsl/"/>
+  <group prefer="system" xml:base="http://mirror.example.net/">
+    <public publicId="-//Example//DTD Strict//EN" uri="strict.dtd"/>
+  </group>
+  <nextCatalog catalog="next.xml"/>
+</catalog>
+'''
+
+NEXT_CATALOG = '''<?xml version="1.0"?>
+<catalog xmlns="urn:oasis:names:tc:entity:xmlns:xml:catalog">
+  <public publicId="-//Example//DTD Next//EN" uri="next.dtd"/>
+  <nextCatalog catalog="catalog.xml"/>
+</catalog>
+'''
+
+
+@pytest.fixture
+def cat(tmp_path):
+    (tmp_path / 'catalog.xml').write_text(CATALOG)
+    (tmp_path / 'next.xml').write_text(NEXT_CATALOG)
+    return catalog([str(tmp_path / 'catalog.xml')]), iri.os_path_to_uri(str(tmp_path)) + '/'
+
+
+def test_public_system(cat):
+    cat, base = cat
+    assert cat.resolve('-//OASIS//DTD DocBook XML V4.5//EN') == base + 'dtd/docbookx.dtd'
+    assert cat.resolve(' -//OASIS//DTD\tDocBook XML V4.5//EN\n') == base + 'dtd/docbookx.dtd'
+    assert cat.resolve(iri.public_id_to_urn('-//OASIS//DTD DocBook XML V4.5//EN')) == base + 'dtd/docbookx.dtd'
+    assert cat.resolve(None, 'urn:publicid:-:OASIS:DTD+DocBook+XML+V4.5:EN') == base + 'dtd/docbookx.dtd'
+    #System matches win over public ones
+    assert cat.resolve('-//OASIS//DTD DocBook XML V4.5//EN', 'http://example.org/spam.dtd') == base + 'spam.dtd'
+    assert cat.resolve(None, 'http://example.org/dtds/a/b.dtd') == base + 'mirror/a/b.dtd'
+    assert cat.resolve(None, 'http://example.org/dtds/v2/b.dtd') == base + 'mirror2/b.dtd'
+    assert cat.resolve(None, 'http://other.org/x/eggs.dtd') == base + 'eggs.dtd'
+    assert cat.resolve('-//Example//DTD Next//EN') == base + 'next.dtd'
+    assert cat.resolve('-//Nobody//DTD//EN', 'http://nowhere.org/') is None
+
+
+def test_prefer_and_base(cat):
+    cat, base = cat
+    assert cat.resolve('-//Example//DTD Strict//EN') == 'http://mirror.example.net/strict.dtd'
+    #prefer="system" means the public entry isn't used when there's a system ID
+    assert cat.resolve('-//Example//DTD Strict//EN', 'http://nowhere.org/strict.dtd') is None
+
+
+def test_uri(cat):
+    cat, base = cat
+    assert cat.resolve_uri('http://example.org/schema.xsd') == base + 'schema.xsd'
+    assert cat.resolve_uri('http://example.org/xsl/a.xsl') == 'file:///opt/xsl/a.xsl'
+    assert cat.resolve_uri('http://example.org/other') is None
+
+
+def test_memo_and_overrides(cat):
+    cat, base = cat
+    pairs = [('-//OASIS//DTD DocBook XML V4.5//EN', None), (None, 'http://example.org/spam.dtd')] * 3
+    assert cat.resolve_many(pairs) == [base + 'dtd/docbookx.dtd', base + 'spam.dtd'] * 3
+    cat.add_system('http://example.org/spam.dtd', 'file:///elsewhere/spam.dtd')
+    assert cat.resolve_many(pairs)[1] == 'file:///elsewhere/spam.dtd'
+
+
+def test_memo_lru(cat):
+    cat, base = cat
+    cat.cache_size = 2
+    cat.resolve('-//OASIS//DTD DocBook XML V4.5//EN')
+    cat.resolve_uri('http://example.org/schema.xsd')
+    #A hit makes the entry the most recently used, so the other one is dropped
+    cat.resolve('-//OASIS//DTD DocBook XML V4.5//EN')
+    cat.resolve(None, 'http://example.org/spam.dtd')
+    assert list(cat._memo) == [('-//OASIS//DTD DocBook XML V4.5//EN', None), (None, 'http://example.org/spam.dtd')]
+
+
+def test_incomplete_entries(tmp_path):
+    (tmp_path / 'catalog.xml').write_text('''<?xml version="1.0"?>
+<catalog xmlns="urn:oasis:names:tc:entity:xmlns:xml:catalog">
+  <public publicId="-//Example//DTD A//EN"/>
+  <system uri="nosystemid.dtd"/>
+  <nextCatalog/>
+  <system systemId="http://example.org/b.dtd" uri="b.dtd"/>
+</catalog>
+''')
+    cat = catalog([str(tmp_path / 'catalog.xml')])
+    assert cat.resolve('-//Example//DTD A//EN') is None
+    assert cat.resolve(None, 'http://example.org/b.dtd') == iri.os_path_to_uri(str(tmp_path / 'b.dtd'))
+
+
+def test_batch_conversion():
+    pubids = ['-//OASIS//DTD DocBook XML V4.5//EN', '+//IDN example.org//DTD XML Bookmarks 1.0//EN//XML', 'ISO 8879:1986//ENTITIES Added Latin 1//EN']
+    urns = public_ids_to_urns(pubids * 2)
+    assert urns == [ iri.public_id_to_urn(p) for p in pubids ] * 2
+    assert urns_to_public_ids(urns) == pubids * 2
+    with pytest.raises(ValueError):
+        urns_to_public_ids(['urn:isbn:0451450523'])
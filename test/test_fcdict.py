@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+from amara3.irihelper import normalize_key
+from amara3.fcdict import build_fcdict, fcdict
+
+
+def sample_iris(n):
+    rng = random.Random(3986)
+    hosts = ['example.org', 'example.com', 'exémple.fr', 'a.b.c.example.net']
+    return [ 'http://{0}/{1}/{2}'.format(rng.choice(hosts), rng.randrange(50), '•' * rng.randrange(3) + str(rng.randrange(10**6)))
+             for _ in range(n) ]
+
+
+@pytest.mark.parametrize('block_size,run_size', [(16, 1000000), (1, 1000000), (7, 100)])
+def test_round_trip(tmp_path, block_size, run_size):
+    iris = sample_iris(1000)
+    path = str(tmp_path / 'iris.fcd')
+    #Duplicates within & across runs
+    count = build_fcdict(iris + iris[:300], path, block_size=block_size, run_size=run_size, tmpdir=str(tmp_path))
+    expected = sorted(set(iris), key=lambda i: i.encode('utf-8'))
+    assert count == len(expected)
+    with fcdict(path) as d:
+        assert len(d) == count
+        assert list(d) == expected
+        for ident, i in enumerate(expected):
+            assert d.id_of(i) == ident
+            assert d[ident] == i
+        assert d[-1] == expected[-1]
+        assert 'http://example.org/missing' not in d
+        assert d.get('http://0.example.org/') is None
+        assert d.get('http://zzz.example.org/') is None
+        with pytest.raises(KeyError):
+            d.id_of('http://example.org/missing')
+        with pytest.raises(IndexError):
+            d[count]
+
+
+def test_normalization(tmp_path):
+    path = str(tmp_path / 'iris.fcd')
+    assert build_fcdict(['HTTP://example.org/%7ex', 'http://example.org/~x', 'file://localhost/tmp'], path) == 2
+    with fcdict(path) as d:
+        assert d[d.id_of('http://example.org/%7Ex')] == normalize_key('http://example.org/~x')
+        assert 'file:///tmp' in d
+    build_fcdict(['HTTP://example.org/%7ex'], path, normalize=False)
+    with fcdict(path, normalize=False) as d:
+        assert list(d) == ['HTTP://example.org/%7ex']
+        assert 'http://example.org/~x' not in d
+
+
+def test_empty_and_invalid(tmp_path):
+    path = str(tmp_path / 'iris.fcd')
+    assert build_fcdict([], path) == 0
+    with fcdict(path) as d:
+        assert len(d) == 0
+        assert list(d) == []
+        assert 'http://example.org/' not in d
+    with pytest.raises(ValueError):
+        build_fcdict(['http://example.org/a\nb'], path)
+    (tmp_path / 'other').write_bytes(b'\0' * 64)
+    with pytest.raises(ValueError):
+        fcdict(str(tmp_path / 'other'))
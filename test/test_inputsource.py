@@ -1,9 +1,10 @@
 import pytest
 import io, os, sys, inspect #,codecs
 import warnings
-from amara3 import inputsource, iri
+from amara3 import iri
 from amara3.iri import IriError
-from amara3.inputsource import factory
+from amara3.inputsource import factory, inputsource, inputsourcetype, archivesource
+from amara3.iricache import diskcache, cache_key
 
 import os, inspect
 def module_path(local_function):
@@ -95,3 +96,294 @@ def test_zip_is():
     assert inp.iri is None
     assert inp.stream.read() == b'monty\n'
 
+
+
+def test_mmap_is():
+    fname = os.path.join(RESOURCEPATH, 'spam.txt')
+    with inputsource(fname, sourcetype=inputsourcetype.filename, use_mmap=True) as inp:
+        assert inp.iri == iri.os_path_to_uri(fname)
+        assert bytes(inp.buffer) == b'monty\n'
+        assert inp.stream.readline() == b'monty\n'
+        inp.stream.seek(0)
+        assert inp.stream.read(3) == b'mon'
+    assert inp.buffer is None
+
+
+def test_mmap_empty_file_fallback(tmp_path):
+    fname = tmp_path / 'empty.txt'
+    fname.write_bytes(b'')
+    inp = inputsource(str(fname), sourcetype=inputsourcetype.filename, use_mmap=True)
+    assert inp.buffer is None
+    assert inp.stream.read() == b''
+    inp.close()
+
+
+def test_mmap_pipe_fallback():
+    if not os.path.isdir('/dev/fd'):
+        pytest.skip('No /dev/fd on this platform')
+    rfd, wfd = os.pipe()
+    os.write(wfd, b'python\n')
+    os.close(wfd)
+    inp = inputsource('/dev/fd/{}'.format(rfd), sourcetype=inputsourcetype.filename, use_mmap=True)
+    assert inp.buffer is None
+    assert inp.stream.read() == b'python\n'
+    inp.close()
+    os.close(rfd)
+
+
+def test_mmap_text_mode_ignored():
+    fname = os.path.join(RESOURCEPATH, 'spam.txt')
+    inp = inputsource(fname, sourcetype=inputsourcetype.filename, streamopenmode='r', use_mmap=True)
+    assert inp.buffer is None
+    assert inp.stream.read() == 'monty\n'
+    inp.close()
+
+
+def _make_tar(path, mode, members):
+    import tarfile
+    with tarfile.open(str(path), mode) as tf:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+
+
+def test_archive_random_access():
+    with archivesource(os.path.join(RESOURCEPATH, 'speggs.zip')) as arc:
+        assert arc.names() == ['eggs.txt', 'spam.txt']
+        assert len(arc) == 2 and 'spam.txt' in arc
+        spam = arc['spam.txt']
+        eggs = arc['eggs.txt']
+        #Members don't share a file pointer, so reading order doesn't matter
+        assert eggs.stream.read() == b'python\n'
+        assert spam.stream.read() == b'monty\n'
+        assert spam.sourcetype == inputsourcetype.zipfilestream
+        with pytest.raises(KeyError):
+            arc['bacon.txt']
+
+
+@pytest.mark.parametrize('mode', ['w', 'w:gz'])
+def test_archive_tar(tmp_path, mode):
+    fname = tmp_path / 'speggs.tar'
+    _make_tar(fname, mode, [('spam.txt', b'monty\n'), ('eggs.txt', b'python\n')])
+    with archivesource(str(fname)) as arc:
+        assert arc.kind == 'tar'
+        assert arc.names() == ['spam.txt', 'eggs.txt']
+        assert arc['eggs.txt'].stream.read() == b'python\n'
+        assert arc['spam.txt'].stream.read() == b'monty\n'
+        assert arc['spam.txt'].sourcetype == inputsourcetype.tarfilestream
+
+
+def test_archive_parallel_map(tmp_path):
+    fname = tmp_path / 'many.tar.gz'
+    members = [ ('m{}.txt'.format(i), str(i).encode('ascii')*(i+1)) for i in range(200) ]
+    _make_tar(fname, 'w:gz', members)
+    with open(str(fname), 'rb') as fp:
+        arc = archivesource(fp)
+    results = dict(arc.map(lambda inp: inp.stream.read(), workers=4))
+    assert results == dict(members)
+    ordered = [ name for name, _ in arc.map(lambda inp: None, workers=4, ordered=True) ]
+    assert ordered == [ name for name, _ in members ]
+    #Worker handles are closed once each map finishes, leaving the constructing thread's
+    assert len(arc._handles) == 1
+    arc.close()
+
+
+def test_archive_in_memory_stream():
+    with open(os.path.join(RESOURCEPATH, 'speggs.zip'), 'rb') as fp:
+        data = fp.read()
+    arc = archivesource(io.BytesIO(data))
+    assert dict(arc.map(lambda inp: inp.stream.read())) == {'eggs.txt': b'python\n', 'spam.txt': b'monty\n'}
+    with pytest.raises(ValueError):
+        archivesource(io.BytesIO(b'not an archive'))
+
+
+def test_factory_tar_is(tmp_path):
+    fname = tmp_path / 'speggs.tar'
+    _make_tar(fname, 'w', [('spam.txt', b'monty\n'), ('eggs.txt', b'python\n')])
+    inpl = factory(open(str(fname), 'rb'), zipcheck=True)
+    assert [ inp.stream.read() for inp in inpl ] == [b'monty\n', b'python\n']
+
+
+def test_factory_zipcheck_not_archive():
+    fname = os.path.join(RESOURCEPATH, 'spam.txt')
+    fp = open(fname, 'rb')
+    assert list(factory(fp, zipcheck=True)) == []
+    assert fp.read() == b'monty\n'
+
+
+class _counting_stream(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+def test_factory_zipcheck_nameless_stream():
+    #A stream that doesn't start like an archive isn't read into memory
+    fp = _counting_stream(b'x' * 100000)
+    assert list(factory(fp, zipcheck=True)) == []
+    assert fp.bytes_read < 1000
+    assert fp.read(3) == b'xxx'
+    zf = _counting_stream(open(os.path.join(RESOURCEPATH, 'speggs.zip'), 'rb').read())
+    assert sorted(inp.stream.read() for inp in factory(zf, zipcheck=True)) == [b'monty\n', b'python\n']
+
+
+def _make_files(tmp_path, count):
+    fnames = []
+    for i in range(count):
+        fname = tmp_path / 'f{}.txt'.format(i)
+        fname.write_bytes(str(i).encode('ascii'))
+        fnames.append(str(fname))
+    return fnames
+
+
+def test_factory_lazy_bounded(tmp_path):
+    fnames = _make_files(tmp_path, 50)
+    inpl = factory(fnames, defaultsourcetype=inputsourcetype.filename, max_open=4)
+    #Nothing is opened until reached
+    assert len(inpl) == 50 and not inpl._open
+    seen = []
+    for inp in inpl:
+        seen.append(inp)
+        assert inp.stream.read() == str(len(seen)-1).encode('ascii')
+        assert len(inpl._open) <= 4
+    assert [ inp.stream.closed for inp in seen ] == [True]*46 + [False]*4
+    inpl.close()
+    assert all( inp.stream.closed for inp in seen )
+
+
+def test_factory_lazy_prefetch(tmp_path):
+    fnames = _make_files(tmp_path, 20)
+    with factory(fnames, defaultsourcetype=inputsourcetype.filename, max_open=4, prefetch=2) as inpl:
+        it = iter(inpl)
+        inp = next(it)
+        assert inp.stream.read() == b'0'
+        assert sorted(inpl._pending) == [1, 2]
+        assert [ inp.stream.read() for inp in it ] == [ str(i).encode('ascii') for i in range(1, 20) ]
+    assert not inpl._open and not inpl._pending
+
+
+def test_factory_lazy_iterates_afresh():
+    with factory(['abc', 'def']) as inpl:
+        assert [ inp.iri for inp in inpl ] == [None, None]
+        #A second pass starts over, rather than finding the iterator exhausted
+        assert len(list(inpl)) == 2
+        it1, it2 = iter(inpl), iter(inpl)
+        assert next(it1) is next(it2)
+
+
+def test_factory_lazy_leaves_streams_alone():
+    files = [ open(os.path.join(RESOURCEPATH, f)) for f in ('spam.txt', 'eggs.txt') ]
+    with factory(files, max_open=1) as inpl:
+        assert [ inp.stream.read() for inp in inpl ] == ['monty\n', 'python\n']
+    assert not any( f.closed for f in files )
+
+
+@pytest.fixture
+def origin():
+    '''
+    Local HTTP server standing in for a remote origin, counting the requests it gets
+    and the number of those it answers 304
+    '''
+    import threading
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from email.utils import formatdate
+    counts = {'requests': 0, 'not_modified': 0}
+    pages = {
+        '/fresh': ({'Cache-Control': 'max-age=3600'}, b'fresh'),
+        '/etag': ({'ETag': '"v1"', 'Cache-Control': 'no-cache'}, b'tagged'),
+        '/lastmod': ({'Last-Modified': formatdate(0, usegmt=True)}, b'dated'),
+        '/nostore': ({'Cache-Control': 'no-store'}, b'private'),
+    }
+    for i in range(5):
+        pages['/big{}'.format(i)] = ({'Cache-Control': 'max-age=3600'}, b'x'*100)
+
+    class handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            counts['requests'] += 1
+            headers, body = pages[self.path]
+            if (self.headers.get('If-None-Match') == headers.get('ETag') is not None or
+                self.headers.get('If-Modified-Since') == headers.get('Last-Modified') is not None):
+                counts['not_modified'] += 1
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(server.server_address[1]), counts
+    server.shutdown()
+    server.server_close()
+
+
+def _fetch(url, cache):
+    with inputsource(url, sourcetype=inputsourcetype.iri, cache=cache) as inp:
+        return inp.stream.read()
+
+
+def test_cache_key():
+    assert cache_key('HTTP://Example.ORG/a/./b/%7euser#frag') == 'http://example.org/a/b/~user'
+
+
+def test_cache_fresh_hit(origin, tmp_path):
+    base, counts = origin
+    cache = diskcache(str(tmp_path))
+    assert _fetch(base + '/fresh', cache) == b'fresh'
+    #Equivalent IRI, served straight from disk
+    assert _fetch('HTTP://' + base[len('http://'):] + '/./fresh#x', cache) == b'fresh'
+    assert counts['requests'] == 1
+    assert (cache.misses, cache.hits) == (1, 1)
+    #A new cache object over the same directory picks up the stored entry
+    assert _fetch(base + '/fresh', diskcache(str(tmp_path))) == b'fresh'
+    assert counts['requests'] == 1
+
+
+@pytest.mark.parametrize('path,body', [('/etag', b'tagged'), ('/lastmod', b'dated')])
+def test_cache_revalidate(origin, tmp_path, path, body):
+    base, counts = origin
+    cache = diskcache(str(tmp_path))
+    for i in range(3):
+        assert _fetch(base + path, cache) == body
+    assert counts['requests'] == 3
+    assert counts['not_modified'] == 2
+    assert (cache.misses, cache.revalidated) == (1, 2)
+
+
+def test_cache_no_store(origin, tmp_path):
+    base, counts = origin
+    cache = diskcache(str(tmp_path))
+    assert _fetch(base + '/nostore', cache) == b'private'
+    assert _fetch(base + '/nostore', cache) == b'private'
+    assert counts['requests'] == 2
+    assert cache.size == 0
+
+
+def test_cache_lru_eviction(origin, tmp_path):
+    base, counts = origin
+    cache = diskcache(str(tmp_path), max_size=300)
+    for i in range(3):
+        _fetch(base + '/big{}'.format(i), cache)
+    #Touch big0, so big1 is now least recently used
+    _fetch(base + '/big0', cache)
+    _fetch(base + '/big3', cache)
+    assert counts['requests'] == 4
+    assert cache.size == 300
+    _fetch(base + '/big0', cache)
+    assert counts['requests'] == 4
+    _fetch(base + '/big1', cache)
+    assert counts['requests'] == 5
@@ -0,0 +1,53 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+from amara3 import iri, instrument
+
+
+@pytest.fixture
+def instrumented():
+    instrument.reset()
+    instrument.enable()
+    yield
+    instrument.disable()
+    instrument.reset()
+
+
+def test_disabled_leaves_originals():
+    original = iri.absolutize
+    instrument.enable()
+    assert iri.absolutize is not original
+    assert iri.absolutize.__wrapped__ is original
+    instrument.disable()
+    assert iri.absolutize is original
+    assert not instrument.enabled()
+
+
+def test_counts(instrumented):
+    for i in range(100):
+        iri.absolutize('a/{0}'.format(i), 'http://example.org/x/')
+    stats = { r['name']: r for r in instrument.report(top=100) }
+    assert stats['amara3.iri.absolutize']['calls'] == 100
+    #Calls from within the module are counted too
+    assert stats['amara3.iri.split_uri_ref']['calls'] >= 100
+    assert stats['amara3.iri.absolutize']['p50'] > 0
+    assert instrument.report(top=1, sort='calls')[0]['calls'] >= 100
+    instrument.reset()
+    assert instrument.report() == []
+
+
+def test_exceptions_counted(instrumented):
+    with pytest.raises(ValueError):
+        iri.uri_to_os_path('http://example.org/', osname='posix')
+    stats = { r['name']: r for r in instrument.report(top=100) }
+    assert stats['amara3.iri.uri_to_os_path']['calls'] == 1
+
+
+def test_environment_variable():
+    code = 'from amara3 import iri, instrument; iri.is_absolute("a"); print(instrument.report()[0]["name"])'
+    env = dict(os.environ, AMARA3_INSTRUMENT='1')
+    out = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True).stdout
+    assert out.strip() == 'amara3.iri.is_absolute'
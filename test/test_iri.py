@@ -1,5 +1,6 @@
 import pytest
 import os, unittest, sys, codecs
+import random
 import warnings
 from amara3 import iri, irihelper
 from amara3.iri import IriError
@@ -889,6 +890,42 @@ def test_base_join():
         assert expectedUri == res, 'base=%r rel=%r' % (base, relative)
 
 
+def _reference_join(*parts):
+    #join as originally implemented, one basejoin per part
+    base = parts[0]
+    for part in parts[1:]:
+        base = iri.basejoin(base.rstrip('/') + '/', part)
+    return base
+
+
+def test_join_matches_basejoin():
+    rng = random.Random(3986)
+    bases = ['http://example.org', 'http://example.org/a/b', 'http://example.org//', 'file:///', 'file:/x/y',
+             'file:////host/share', '/a/./b/..', '/', '//host', 'a/b', '../a', 'urn:x:y', 'http://e.org/a?q=1', 'x#f']
+    segments = ['a', 'b c', '', '.', '..', 'x:y', '%2F', 'q?r=1', 'f#g', 'http://other.org/z']
+    for _ in range(3000):
+        parts = [rng.choice(bases)]
+        for _ in range(rng.randint(1, 6)):
+            part = '/'.join(rng.choice(segments) for _ in range(rng.randint(1, 4)))
+            parts.append(rng.choice(['', '/', '//h/']) + part if rng.random() < 0.1 else part)
+        assert iri.join(*parts) == _reference_join(*parts), parts
+    assert iri.join('http://example.org/a', *['b'] * 1000) == 'http://example.org/a' + '/b' * 1000
+
+
+def test_path_resolve(tmp_path):
+    (tmp_path / 'd1' / 'd2').mkdir(parents=True)
+    base = str(tmp_path)
+    assert iri.path_resolve([base]) == base
+    assert iri.path_resolve([base, 'd1']) == iri.os_path_to_uri(os.path.join(base, 'd1'))
+    assert iri.path_resolve([base, 'd1', 'd2', 'f.txt']) == iri.os_path_to_uri(os.path.join(base, 'd1', 'd2', 'f.txt'))
+    #Non-directories are resolved against their parent
+    assert iri.path_resolve([base, 'nofile', 'd1', '../x']) == iri.os_path_to_uri(os.path.join(base, 'x'))
+    #A part repeated later in the list
+    (tmp_path / 'f').write_text('')
+    assert iri.path_resolve([base, 'f', 'g', 'f']) == iri.os_path_to_uri(os.path.join(base, 'f'))
+    assert iri.path_resolve([base, 'd1', 'd1', 'd1']) == iri.os_path_to_uri(os.path.join(base, 'd1', 'd1'))
+
+
 # uri_to_os_path
 def test_uri_to_os_path():
     for osname in ('posix', 'nt'):
@@ -943,6 +980,39 @@ def test_os_path_to_uri():
                                  osname+': '+testname+': '+uri
 
 
+@pytest.mark.parametrize('uri', [
+    'file:///a/b/c', 'file://localhost/a/b', 'file:///', 'file:////a', 'file:///a%20b/c%2Fd/%7Ee',
+    'file://localhost/x/%2f/%C3%A9', 'file:///dir/./../x', 'file:///%',
+])
+def test_uri_to_os_path_posix_fast_path(uri):
+    #A fragment forces the general code path, which should give the same result
+    expected = iri.uri_to_os_path(uri + '#frag', osname='posix')
+    assert iri.uri_to_os_path(uri, osname='posix') == expected
+    assert iri.uri_to_os_path(uri, osname='posix', cache_dirs=True) == expected
+    assert iri.uri_to_os_path(uri, osname='posix', cache_dirs=True) == expected
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='posix paths')
+@pytest.mark.parametrize('relative', [False, True])
+def test_walk_file_uris(tmp_path, monkeypatch, relative):
+    names = ['plain.txt', 'a b.txt', 'caf\u00e9', '100%', 'x#y;z', '.hidden', 'dir?']
+    for sub in ('', 'sub dir', 'sub dir/deeper', 'dir?'):
+        (tmp_path / sub).mkdir(exist_ok=True)
+        for name in names[:-1]:
+            (tmp_path / sub / name).write_text('')
+    if relative:
+        monkeypatch.chdir(tmp_path.parent)
+        root = os.path.join(tmp_path.name, '.')
+    else:
+        root = str(tmp_path / 'sub dir' / '..')
+    pairs = list(iri.walk_file_uris(root))
+    expected = [ (os.path.join(d, f), iri.os_path_to_uri(os.path.join(d, f))) for d, _, files in os.walk(root) for f in files ]
+    assert sorted(pairs) == sorted(expected)
+    assert len(pairs) == 4 * (len(names) - 1)
+    dirs = [ path for path, uri in iri.walk_file_uris(root, include_dirs=True) if os.path.isdir(path) ]
+    assert sorted(dirs) == sorted(os.path.join(d, s) for d, subdirs, _ in os.walk(root) for s in subdirs)
+
+
 # normalize_case
 def test_normalize_case():
     for uri, expected0, expected1 in case_normalization_tests:
@@ -984,6 +1054,161 @@ def test_normalize_path_segments_in_uri():
             assert expected == iri.normalize_path_segments_in_uri(uri), testname
 
 
+def test_scheme_registry():
+    assert iri.get_scheme('http://example.org/') is iri.SCHEMES['http'].name
+    #Other spellings are returned as given
+    assert iri.get_scheme('HTTP://example.org/') == 'HTTP'
+    assert iri.get_scheme('x-unknown:foo') == 'x-unknown'
+    assert iri.get_scheme('a/b') is None
+    assert iri.lookup_scheme('HTTPS').default_port == 443
+    assert not iri.lookup_scheme('urn').hierarchical
+    assert iri.lookup_scheme('x-unknown') is None
+    #Dot segments left alone for schemes registered not to use them
+    assert iri.normalize_path_segments_in_uri('tag:example.org,2020:/a/../b') == 'tag:example.org,2020:/a/../b'
+    assert iri.normalize_case('HTTP://Example.ORG/') == 'http://Example.ORG/'
+    assert iri.absolutize('a', 'http://example.org/', limit_schemes={'http', 'https'}) == 'http://example.org/a'
+    with pytest.raises(ValueError):
+        iri.absolutize('a', 'ftp://example.org/', limit_schemes={'http', 'https'})
+    assert iri.uri_to_os_path('FILE:///tmp/x', osname='posix') == '/tmp/x'
+
+
+def test_scheme_dispatch():
+    info = iri.register_scheme('x-test', default_port=8080, handlers={'port': lambda i: 8080})
+    try:
+        assert iri.get_scheme('x-test://h/p') is info.name
+        assert iri.dispatch('x-test://h/p', 'port') == 8080
+        assert iri.dispatch('X-Test://h/p', 'port') == 8080
+        with pytest.raises(LookupError):
+            iri.dispatch('x-test://h/p', 'nothing')
+        with pytest.raises(LookupError):
+            iri.dispatch('a/b', 'port')
+    finally:
+        iri.unregister_scheme('X-TEST')
+    assert iri.lookup_scheme('x-test') is None
+    assert iri.get_scheme('x-test://h/p') == 'x-test'
+
+
+def test_scheme_any_case():
+    assert iri.get_scheme('Http://x/') == 'Http'
+    assert iri.schemes_of(['hTtPs://x/', 'X-Other:y', 'https:z']) == ['hTtPs', 'X-Other', 'https']
+    assert iri.lookup_scheme('hTtPs').default_port == 443
+    assert iri.normalize_path_segments_in_uri('Urn:a/../b') == 'Urn:a/../b'
+    assert iri.uri_to_os_path('File:///a/b', osname='posix') == '/a/b'
+    assert iri.uri_to_os_path('fIlE:///x#f', osname='posix') == '/x'
+    assert iri.absolutize('a', 'HTTP://example.org/', limit_schemes={'HTTP'}) == 'HTTP://example.org/a'
+    assert iri.absolutize('a', 'Http://example.org/', limit_schemes=['http']) == 'Http://example.org/a'
+
+
+@pytest.mark.parametrize('ref', [
+    'http://example.org/', 'X-Up:x', 'x-custom+v1.2:thing', 'c:\\path', 'urn:isbn:0451450523',
+    'a/b', 'a/b:c', '1http:x', ':x', '', '#frag', '?q:x', '-x:y', 'caf\u00e9:x', 'a b:c',
+])
+def test_get_scheme_matches_pattern(ref):
+    m = iri.SCHEME_PATTERN.match(ref)
+    expected = m.group(1) if m else None
+    assert iri.get_scheme(ref) == expected
+    assert iri.is_absolute(ref) is (expected is not None)
+    assert iri.schemes_of([ref]) == [expected]
+
+
+def test_schemes_of():
+    schemes = iri.schemes_of(['http://example.org/', 'a/b', 'urn:x:y', 'x-y:z'])
+    assert schemes == ['http', None, 'urn', 'x-y']
+    assert schemes[0] is iri.SCHEMES['http'].name
+
+
+def test_normalize_levels():
+    ref = 'HTTP://Example.ORG:80/a/./%7euser/../b%2f?q=%7e#F%2a'
+    assert iri.normalize(ref, 'simple') == ref
+    assert iri.normalize(ref, 'case') == 'http://example.org:80/a/./%7Euser/../b%2F?q=%7E#F%2A'
+    assert iri.normalize(ref, 'percent_encoding') == 'http://example.org:80/a/./~user/../b%2F?q=~#F%2A'
+    assert iri.normalize(ref, 'path_segments') == 'http://example.org:80/a/b%2F?q=~#F%2A'
+    assert iri.normalize(ref) == 'http://example.org/a/b%2F?q=~#F%2A'
+    assert iri.normalize('http://example.org:') == 'http://example.org/'
+    assert iri.normalize('https://example.org:80') == 'https://example.org:80/'
+    assert iri.normalize('tag:example.org,2020:/a/../b') == 'tag:example.org,2020:/a/../b'
+    #Escapes in the host keep upper-case hex, while the rest is lower-cased
+    assert iri.normalize('http://%C3%A9X.org/') == 'http://%C3%A9x.org/'
+    assert iri.normalize('http://u@%c3%a9X.org:80/', 'case') == 'http://u@%C3%A9x.org:80/'
+    assert iri.normalize('http://%41x.org/') == 'http://ax.org/'
+    with pytest.raises(ValueError):
+        iri.normalize(ref, 'bogus')
+
+
+def test_iri_equivalent():
+    assert iri.iri_equivalent('http://example.org/~a', 'HTTP://Example.org:80/%7Ea')
+    assert not iri.iri_equivalent('http://example.org/~a', 'HTTP://Example.org:80/%7Ea', level='path_segments')
+    assert iri.iri_equivalent('http://example.org/a/../b', 'http://example.org/b', level='path_segments')
+    assert not iri.iri_equivalent('http://example.org/a/../b', 'http://example.org/b', level='percent_encoding')
+    assert not iri.iri_equivalent('http://example.org/', 'http://example.com/')
+    assert not iri.iri_equivalent('http://example.org/', 'http://example.org/#')
+    assert not iri.iri_equivalent('a', 'b', level='simple')
+    assert iri.iri_equivalent('a', 'a', level='simple')
+    with pytest.raises(ValueError):
+        iri.iri_equivalent('a', 'a', level='bogus')
+
+
+def test_iri_equivalent_matches_normalize():
+    rng = random.Random(6)
+    pieces = {
+        'scheme': ['http', 'HTTP', 'https', 'urn', 'x-y', None],
+        'authority': ['example.org', 'Example.ORG', 'example.org:80', 'example.org:', 'u%7e@example.org',
+                      'u~@example.org', 'example.org:443', '', None],
+        'path': ['', '/', '/a/./b', '/a/b', '/a/c/../b', '/%7ea', '/~a', '/%7Ea', 'a/../b', '/%2f'],
+        'query': [None, '', 'q=%7e', 'q=~', 'q=%2a', 'q=%2A'],
+        'fragment': [None, '', 'f', '%7E'],
+    }
+    refs = [ iri.unsplit_uri_ref(tuple(rng.choice(pieces[c]) for c in ('scheme', 'authority', 'path', 'query', 'fragment')))
+             for _ in range(300) ]
+    for level in iri.COMPARISON_LEVELS:
+        for _ in range(2000):
+            a, b = rng.choice(refs), rng.choice(refs)
+            assert iri.iri_equivalent(a, b, level) == (iri.normalize(a, level) == iri.normalize(b, level)), (a, b, level)
+
+
+def test_mint_iris():
+    from uuid import UUID, uuid5, NAMESPACE_URL
+    from hashlib import blake2b
+    from amara3.irihelper import iriref
+    base = 'http://example.org/id/'
+    minted = list(iri.mint_iris(base, 10000, batch_size=1000))
+    assert len(minted) == len(set(minted)) == 10000
+    for m in minted[:100] + minted[-100:]:
+        assert type(m) is iriref
+        assert m.startswith(base)
+        u = UUID(m[len(base):])
+        assert u.version == 4 and str(u) == m[len(base):]
+        assert iri.matches_uri_ref_syntax(m)
+    assert list(iri.mint_iris(base, 0)) == []
+
+    keys = ['a', 'b', 'é', b'raw']
+    minted = list(iri.mint_iris(base, strategy='uuid5', keys=keys, batch_size=3))
+    ns = uuid5(NAMESPACE_URL, base)
+    assert minted == [ base + str(uuid5(ns, k.decode('utf-8') if isinstance(k, bytes) else k)) for k in keys ]
+    minted = list(iri.mint_iris(base, 2, strategy='blake2', keys=iter(keys)))
+    assert minted == [ base + blake2b(k.encode('utf-8'), digest_size=16).hexdigest() for k in keys[:2] ]
+    assert next(iri.mint_iris('urn:uuid:', 1)).startswith('urn:uuid:')
+    assert next(iri.mint_iris('http://example.org/?id=', 1)).startswith('http://example.org/?id=')
+    assert next(iri.mint_iris('http://example.org/doc#', 1)).startswith('http://example.org/doc#')
+
+
+@pytest.mark.parametrize('args,kwargs', [
+    (('a/b/', 1), {}),
+    (('http://example.org/ spam', 1), {}),
+    #The identifier would run on into the host name
+    (('http://example.org', 1), {}),
+    (('http://', 1), {}),
+    (('http://example.org/id', 1), {}),
+    (('http://example.org/', 1), {'strategy': 'uuid1'}),
+    (('http://example.org/',), {}),
+    (('http://example.org/',), {'strategy': 'blake2'}),
+    (('http://example.org/', 1), {'keys': ['a']}),
+])
+def test_mint_iris_errors(args, kwargs):
+    with pytest.raises(ValueError):
+        iri.mint_iris(*args, **kwargs)
+
+
 if __name__ == '__main__':
     raise SystemExit("Use py.test")
 
@@ -0,0 +1,132 @@
+import sys
+import subprocess
+import multiprocessing
+
+import pytest
+
+from amara3 import iri
+from amara3.iriarray import IriArray, COMPONENTS, publish, attach
+
+IRIS = [
+    'http://example.org/a/b?x=1#top',
+    'urn:isbn:0451450523',
+    'file:///tmp/x',
+    '../rel/path',
+    '#frag',
+    '?q',
+    '//host',
+    '',
+    'http://exémple.org/café?ç=1#•',
+    'mailto:a@example.org?subject=a#b?c',
+]
+
+
+def test_components():
+    arr = IriArray(IRIS)
+    assert len(arr) == len(IRIS)
+    assert list(arr) == IRIS
+    for i, ref in enumerate(IRIS):
+        assert arr[i] == ref
+        assert arr.split(i) == iri.split_uri_ref(ref)
+        for name, expected in zip(COMPONENTS, iri.split_uri_ref(ref)):
+            view = arr.component(i, name)
+            assert (None if view is None else str(view, 'utf-8')) == expected
+            if view is not None:
+                view.release()
+    assert arr[-1] == IRIS[-1]
+    with pytest.raises(IndexError):
+        arr[len(IRIS)]
+    with pytest.raises(ValueError):
+        arr.span(0, 'port')
+
+
+def test_slicing():
+    arr = IriArray(IRIS)
+    part = arr[2:6]
+    assert list(part) == IRIS[2:6]
+    assert part.split(1) == iri.split_uri_ref(IRIS[3])
+    assert list(arr[::3]) == IRIS[::3]
+    assert list(arr[5:2]) == []
+    with pytest.raises(TypeError):
+        part.append('x')
+    del part
+    arr.append('tag:example.org,2020:x')
+    assert arr[-1] == 'tag:example.org,2020:x'
+
+
+def test_save_load(tmp_path):
+    arr = IriArray(IRIS * 3)
+    path = str(tmp_path / 'iris.bin')
+    arr.save(path)
+    with IriArray.load(path) as loaded:
+        assert list(loaded) == IRIS * 3
+        assert loaded.split(8) == iri.split_uri_ref(IRIS[8])
+        assert list(loaded[1:4]) == IRIS[1:4]
+        with pytest.raises(TypeError):
+            loaded.append('x')
+    #A slice is saved on its own
+    arr[3:5].save(path)
+    with IriArray.load(path) as loaded:
+        assert list(loaded) == IRIS[3:5]
+        assert loaded.split(1) == iri.split_uri_ref(IRIS[4])
+
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.bin'
+    path.write_bytes(b'\0' * 64)
+    with pytest.raises(ValueError):
+        IriArray.load(str(path))
+
+
+def _worker_read(args):
+    name, i = args
+    table = attach(name)
+    try:
+        view = table.array.component(i, 'authority')
+        result = (table.array[i], None if view is None else bytes(view))
+        if view is not None:
+            view.release()
+        return result
+    finally:
+        table.close()
+
+
+def test_shared_memory():
+    with publish(IRIS) as table:
+        assert list(table.array) == IRIS
+        with multiprocessing.Pool(2) as pool:
+            results = pool.map(_worker_read, [ (table.name, i) for i in range(len(IRIS)) ])
+        assert [ r[0] for r in results ] == IRIS
+        assert results[0][1] == b'example.org'
+        #Attaching in the same process works too, and leaves the block in place
+        with attach(table.name) as other:
+            assert other.array[1] == IRIS[1]
+        assert table.array.split(8) == iri.split_uri_ref(IRIS[8])
+
+
+SHARED_SCRIPT = '''
+import multiprocessing
+from amara3.iriarray import publish, attach
+
+def work(name):
+    with attach(name) as table:
+        return table.array[1]
+
+if __name__ == '__main__':
+    multiprocessing.set_start_method('fork')
+    with publish(['http://a/', 'http://b/']) as table:
+        with multiprocessing.Pool(2) as pool:
+            print(pool.map(work, [table.name] * 4))
+'''
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='needs fork')
+def test_attach_leaves_publisher_registration(tmp_path):
+    #Fork workers share the publisher's resource tracker, which mustn't lose track of the block
+    script = tmp_path / 'shared.py'
+    script.write_text(SHARED_SCRIPT)
+    proc = subprocess.run([sys.executable, str(script)], capture_output=True, text=True, timeout=60)
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.strip() == str(['http://b/'] * 4)
+    assert 'KeyError' not in proc.stderr
+    assert 'leaked' not in proc.stderr
@@ -0,0 +1,47 @@
+import sys
+import pickle
+
+from amara3.iri import I
+from amara3.irihelper import NormalizedIri
+from amara3.contrib.mem_check import deep_sizeof
+
+
+def test_normalized_iri_equivalence():
+    a = NormalizedIri('HTTP://Example.org:80/a/./%7ex')
+    b = NormalizedIri('http://example.org/a/~x')
+    assert a == b
+    assert not a != b
+    assert hash(a) == hash(b)
+    assert str(a) == 'HTTP://Example.org:80/a/./%7ex'
+    assert a.canonical == 'http://example.org/a/~x'
+    assert a != NormalizedIri('http://example.org/a/~y')
+    assert a != 'http://example.org/a/~x'
+    assert len({a, b, NormalizedIri('http://example.org/a/%7Ex')}) == 1
+    d = {a: 1}
+    assert d[NormalizedIri('http://EXAMPLE.org/a/~x')] == 1
+    assert sorted([NormalizedIri('http://b/'), NormalizedIri('HTTP://a/')]) == [NormalizedIri('http://a/'), NormalizedIri('http://b/')]
+    assert pickle.loads(pickle.dumps(a)) == b
+
+
+def test_normalized_iri_lazy_and_slotted():
+    a = NormalizedIri('http://example.org/x')
+    assert a._canonical is None and a._hash is None
+    #Same text compares equal without normalizing
+    assert a == NormalizedIri('http://example.org/x')
+    assert a._canonical is None
+    hash(a)
+    #Already normal, so the text is shared
+    assert a.canonical is a.text
+    assert not hasattr(a, '__dict__')
+    text = 'http://example.org/' + 'x' * 40
+    assert deep_sizeof(NormalizedIri(text)) < sys.getsizeof(I(text)) + 64
+
+
+def test_iriref_pickle_skips_validation(monkeypatch):
+    from amara3 import iri, irihelper
+    ref = I('http://example.org/a')
+    data = pickle.dumps([ref, ref('b')])
+    monkeypatch.setattr(iri, 'matches_uri_ref_syntax', lambda value: False)
+    loaded = pickle.loads(data)
+    assert loaded == ['http://example.org/a', 'http://example.org/ab']
+    assert all(type(i) is irihelper.iriref for i in loaded)
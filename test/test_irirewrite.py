@@ -0,0 +1,100 @@
+import re
+
+import pytest
+
+from amara3 import iri
+from amara3.irirewrite import rewriter
+from amara3.inputsource import inputsource, inputsourcetype, factory
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    #Local file tree standing in for remote hosts
+    files = {
+        'vocab.example.org/terms/title.ttl': b'title',
+        'vocab.example.org/terms/sub/creator.ttl': b'creator',
+        'schemas.example.com/book-2/book.xsd': b'<xs:schema/>',
+    }
+    for name, content in files.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+    base = iri.os_path_to_uri(str(tmp_path)) + '/'
+    return rewriter([
+        ('http://vocab.example.org/', base + 'vocab.example.org/'),
+        ('http://vocab.example.org/terms/sub/', base + 'vocab.example.org/terms/sub/'),
+        (re.compile(r'https?://schemas\.example\.com/(\w+)/v(\d+)/'), base + r'schemas.example.com/\1-\2/'),
+    ]), base
+
+
+def test_rewrite_rules(mirror):
+    rw, base = mirror
+    assert rw('http://vocab.example.org/terms/title.ttl') == base + 'vocab.example.org/terms/title.ttl'
+    assert rw('https://schemas.example.com/book/v2/book.xsd') == base + 'schemas.example.com/book-2/book.xsd'
+    assert rw('http://vocab.example.org') == 'http://vocab.example.org'
+    assert rw('http://other.example.org/') == 'http://other.example.org/'
+    assert rw.rewrite_many(['a', 'http://vocab.example.org/x']) == ['a', base + 'vocab.example.org/x']
+    assert len(rw) == 3
+
+
+def test_longest_prefix_and_precedence():
+    rw = rewriter([('http://a/', 'A:'), ('http://a/b/', 'B:'), ('http://a/b/c', 'C:'), (re.compile('http://a/b/(.)'), r'P:\1')])
+    assert rw('http://a/b/cd') == 'C:d'
+    assert rw('http://a/b/x') == 'B:x'
+    assert rw('http://a/x') == 'A:x'
+    rw.add_prefix('http://a/', 'Z:')
+    assert rw('http://a/x') == 'Z:x'
+    assert len(rw) == 4
+
+
+def test_pattern_order_and_fallback():
+    rw = rewriter([(re.compile(r'http://(\w+)\.org/'), r'org:\1/')])
+    rw.add_pattern(r'(?i)HTTP://(\w+)\.net/', r'net:\1/')
+    rw.add_pattern(r'http://(\w+)\.(\w+)/', r'any:\2:\1/')
+    assert rw('http://x.org/p') == 'org:x/p'
+    assert rw('http://y.NET/p') == 'net:y/p'
+    assert rw('http://z.com/p') == 'any:com:z/p'
+    #Flags of one rule don't leak into others
+    assert rw('http://x.ORG/p') == 'any:ORG:x/p'
+    assert rw('HTTP://x.com/p') == 'HTTP://x.com/p'
+    #Backreferences within patterns can't be combined, so fall back to trying rules in turn
+    rw.add_pattern(r'(\w)\1://', r'double:')
+    assert rw('xx://a') == 'double:a'
+    assert rw('http://y.net/p') == 'net:y/p'
+
+
+def test_pattern_literal_start():
+    #Rules are narrowed down by the literal text they start with, but still tried in order
+    rw = rewriter([(re.compile(r'ht(.)p://b/'), r'short:\1/'), (re.compile(r'http://a(.)'), r'long:\1')])
+    rw.add_pattern(r'(\w+):', r'any:\1:')
+    rw.add_pattern(r'(?x) http:// c', r'verbose:')
+    assert rw('http://ab') == 'long:b'
+    assert rw('http://b/x') == 'short:t/x'
+    assert rw('http://cx') == 'any:http://cx'
+    assert rw('urn:x') == 'any:urn:x'
+    rw = rewriter([(re.compile(r'http://c'), 'c:'), (re.compile(r'HTTP://D', re.IGNORECASE), 'd:')])
+    assert rw('http://d/') == 'd:/'
+    assert rw('http://c/') == 'c:/'
+    assert rw('http://e/') == 'http://e/'
+
+
+def test_pattern_unparseable_start(monkeypatch):
+    #If the regex internals change, rules are still applied, just without narrowing
+    from amara3 import irirewrite
+    monkeypatch.setattr(irirewrite, '_sre_parse', None)
+    rw = rewriter([(re.compile(r'http://(\w+)/'), r'x:\1/'), (re.compile(r'urn:'), 'u:')])
+    assert rw('http://a/b') == 'x:a/b'
+    assert rw('urn:c') == 'u:c'
+    assert rw('ftp://a/') == 'ftp://a/'
+
+
+def test_inputsource_rewrite(mirror):
+    rw, base = mirror
+    inp = inputsource('http://vocab.example.org/terms/sub/creator.ttl', sourcetype=inputsourcetype.iri, rewriter=rw)
+    with inp:
+        assert inp.stream.read() == b'creator'
+    #Base IRI is still the one given
+    assert inp.iri == 'http://vocab.example.org/terms/sub/creator.ttl'
+    iris = ['http://vocab.example.org/terms/title.ttl', 'https://schemas.example.com/book/v2/book.xsd']
+    with factory(iris, defaultsourcetype=inputsourcetype.iri, rewriter=rw) as inps:
+        assert [ inp.stream.read() for inp in inps ] == [b'title', b'<xs:schema/>']
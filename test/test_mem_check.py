@@ -0,0 +1,50 @@
+import sys
+
+from amara3.iri import I
+from amara3.irihelper import iridict
+from amara3.contrib.mem_check import get_mem_use, get_peak_mem_use, alloc_diff, deep_sizeof, sizeof_report
+
+
+def test_mem_use_units():
+    current = get_mem_use(units='B')
+    assert current > 1024*1024
+    assert abs(get_mem_use(units='KB') - current / 1024) < 1024
+    #Peak can't be below current, allowing for pages touched between the calls
+    assert get_peak_mem_use(units='B') >= current * 0.9
+    if sys.platform.startswith('linux'):
+        with open('/proc/self/status') as status:
+            vmrss = [ line for line in status if line.startswith('VmRSS:') ][0]
+        assert abs(int(vmrss.split()[1]) - get_mem_use(units='KB')) < 10*1024
+
+
+def test_alloc_diff():
+    with alloc_diff() as diff:
+        keep = [ I('http://example.org/{0}'.format(i)) for i in range(5000) ]
+    assert diff.net > 5000 * sys.getsizeof(keep[0]) * 0.9
+    assert diff.peak >= diff.net
+    assert diff.stats
+    assert diff.report(top=3).startswith('net ')
+
+
+def test_deep_sizeof_shared():
+    s = 'http://example.org/' + 'x' * 100
+    assert deep_sizeof([s, s]) == sys.getsizeof([s, s]) + sys.getsizeof(s)
+    seen = set()
+    first = deep_sizeof([s], seen)
+    assert deep_sizeof([s], seen) == sys.getsizeof([s])
+    assert first > sys.getsizeof(s)
+
+
+def test_sizeof_report_iri_containers():
+    iris = [ I('http://example.org/{0}'.format(i)) for i in range(1000) ]
+    d = iridict()
+    for i in iris:
+        d[i] = None
+    report = sizeof_report(d)
+    assert report['items'] == 1000
+    assert report['total'] == report['container'] + report['keys'] + report['values']
+    assert report['container'] >= sys.getsizeof(d)
+    report = sizeof_report(iris)
+    assert report['keys'] == 0
+    assert report['values'] == sum(sys.getsizeof(i) for i in iris)
+    assert report['per_item'] == report['total'] / 1000
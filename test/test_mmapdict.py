@@ -0,0 +1,107 @@
+import multiprocessing
+
+import pytest
+
+from amara3 import mmapdict as mmapdict_module
+from amara3.mmapdict import mmapdict
+
+
+def test_equivalence_and_persistence(tmp_path):
+    path = str(tmp_path / 'd')
+    with mmapdict(path) as d:
+        d['http://spam/%7ex/'] = 1
+        d['file://localhost/x'] = {'a': [1, 2]}
+        assert d['HTTP://spam/~x/'] == 1
+        assert d['file:///x'] == {'a': [1, 2]}
+        assert 'http://spam/%7Ex/' in d
+        assert 'http://spam/y' not in d
+        assert d.get('http://spam/y') is None
+        d['http://spam/~x/'] = 2
+        assert len(d) == 2
+    with mmapdict(path, readonly=True) as d:
+        assert d['http://spam/%7Ex/'] == 2
+        assert sorted(d) == ['file:///x', 'http://spam/~x/']
+        with pytest.raises(TypeError):
+            d['http://spam/y'] = 3
+
+
+def test_growth_delete_compact(tmp_path):
+    path = str(tmp_path / 'd')
+    with mmapdict(path, slots=8) as d:
+        for i in range(1000):
+            d['http://example.org/{0}'.format(i)] = i
+        for i in range(0, 1000, 2):
+            del d['http://example.org/{0}'.format(i)]
+        with pytest.raises(KeyError):
+            del d['http://example.org/0']
+        assert len(d) == 500
+        #Deleted slots get reused
+        d['http://example.org/0'] = 'back'
+        assert d['http://example.org/0'] == 'back'
+        assert d['http://example.org/999'] == 999
+        d.compact()
+        assert len(d) == 501
+        assert d['http://example.org/1'] == 1
+        assert d['http://example.org/0'] == 'back'
+        assert 'http://example.org/2' not in d
+
+
+def test_fingerprint_collisions(tmp_path, monkeypatch):
+    monkeypatch.setattr(mmapdict_module, 'fingerprint', lambda key: 42)
+    with mmapdict(str(tmp_path / 'd'), slots=8) as d:
+        for i in range(20):
+            d['http://example.org/{0}'.format(i)] = i
+        assert [ d['http://example.org/{0}'.format(i)] for i in range(20) ] == list(range(20))
+        assert 'http://example.org/20' not in d
+
+
+def _writer(path, start):
+    with mmapdict(path) as d:
+        for i in range(start, start + 300):
+            d['http://example.org/{0}'.format(i)] = i
+
+
+def test_multiple_processes(tmp_path):
+    path = str(tmp_path / 'd')
+    with mmapdict(path, slots=8) as reader:
+        procs = [ multiprocessing.Process(target=_writer, args=(path, n * 300)) for n in range(3) ]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+            assert p.exitcode == 0
+        #The open reader follows the regrown table
+        assert len(reader) == 900
+        assert all(reader['http://example.org/{0}'.format(i)] == i for i in range(900))
+
+
+def test_read_while_growing(tmp_path):
+    path = str(tmp_path / 'd')
+    with mmapdict(path, slots=8) as writer:
+        for i in range(5):
+            writer['http://example.org/a{0}'.format(i)] = i
+    with mmapdict(path, readonly=True) as reader:
+        it = iter(reader)
+        first = next(it)
+        #Another process regrows the table under the unfinished iteration
+        proc = multiprocessing.Process(target=_writer, args=(path, 0))
+        proc.start()
+        proc.join()
+        assert proc.exitcode == 0
+        seen = [first]
+        for k in it:
+            reader[k]
+            seen.append(k)
+        #Keys added before the regrowth may or may not be seen, but the rest are
+        assert set(seen) >= { 'http://example.org/a{0}'.format(i) for i in range(5) }
+        #And iterations running alongside writers
+        procs = [ multiprocessing.Process(target=_writer, args=(path, n * 300)) for n in range(1, 4) ]
+        for p in procs:
+            p.start()
+        while any(p.is_alive() for p in procs):
+            for k, v in reader.items():
+                assert reader[k] == v
+        for p in procs:
+            p.join()
+            assert p.exitcode == 0
+        assert len(reader) == 1205
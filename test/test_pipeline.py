@@ -0,0 +1,38 @@
+import pytest
+
+from amara3 import pipeline as pl
+
+
+def test_map_filter_batch():
+    batches = []
+    pl.source(range(10), pl.map_items(lambda x: x * 2, pl.filter_items(lambda x: x % 3, pl.batch(4, pl.sink(batches.append)))), batch_size=3)
+    assert batches == [[2, 4, 8, 10], [14, 16]]
+
+
+def test_dedupe_key():
+    results = []
+    pl.source(['a', 'B', 'b', 'A', 'c'], pl.dedupe(pl.collect(results), key=str.lower), batch_size=2)
+    assert results == ['a', 'B', 'c']
+
+
+def test_close_flushes():
+    results = []
+    target = pl.batch(100, pl.collect(results))
+    target.send([1, 2])
+    assert results == []
+    target.close()
+    assert results == [1, 2]
+
+
+def test_error_propagates():
+    results = []
+    with pytest.raises(ZeroDivisionError):
+        pl.source([1, 0], pl.map_items(lambda x: 1 / x, pl.collect(results)), batch_size=1)
+    assert results == [1.0]
+
+
+def test_iri_stages():
+    results = []
+    pl.source(['../x/%7Ey', 'B/./C', 'HTTP://Example.org/a/../b'],
+              pl.resolve_iris('http://example.org/a/b/', pl.normalize_iris(pl.collect(results))))
+    assert results == ['http://example.org/a/x/~y', 'http://example.org/a/b/B/C', 'http://example.org/b']
@@ -0,0 +1,46 @@
+import pytest
+import random
+from amara3.util import latency_histogram
+
+
+def test_histogram_percentiles():
+    h = latency_histogram()
+    samples = [ random.uniform(0.001, 2.0) for i in range(10000) ]
+    for s in samples:
+        h.record(s)
+    samples.sort()
+    assert h.count == 10000
+    assert h.min == samples[0] and h.max == samples[-1]
+    for pct in (50, 90, 99):
+        exact = samples[int(pct / 100 * len(samples)) - 1]
+        #Buckets are ~26% wide at 10 per decade
+        assert abs(h.percentile(pct) - exact) / exact < 0.26
+
+
+def test_histogram_fixed_memory():
+    h = latency_histogram()
+    nbuckets = len(h.counts)
+    for s in (1e-9, 0.5, 1e6):
+        h.record(s)
+    assert len(h.counts) == nbuckets
+    assert h.counts[0] == 1 and h.counts[-1] == 1
+    assert h.percentile(100) == 1e6
+    assert list(h.buckets())[-1] == (None, 3)
+
+
+def test_histogram_merge():
+    a, b = latency_histogram(), latency_histogram()
+    a.record(0.1)
+    b.record(0.2)
+    b.record(0.3)
+    a.merge(b)
+    assert a.summary()['count'] == 3
+    assert a.min == 0.1 and a.max == 0.3
+    with pytest.raises(ValueError):
+        a.merge(latency_histogram(buckets_per_decade=5))
+
+
+def test_histogram_empty():
+    h = latency_histogram()
+    assert h.percentile(50) is None
+    assert h.summary()['mean'] is None